@@ -0,0 +1,1132 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the Mini Library Management System
+
+Run with:  python benchmark.py
+Each benchmark replaces the shared data structures, so do not run this
+in the same process as the demo or the tests.
+
+Regression suite (JSON results that can be compared across commits):
+    python benchmark.py suite --sizes 10000 100000 --out before.json
+    python benchmark.py compare before.json after.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from operations import (
+    add_book, add_member, books, borrow_book, borrow_many, borrowers, close_storage,
+    delete_member, export_snapshot, find_member, import_snapshot, members, open_storage,
+    return_book, return_many, search_books, update_book, cache_stats, configure_cache,
+    iter_books, search_page, count_books, genre_counts, changes,
+    place_hold, hold_queue, expire_holds, HOLD_PICKUP_SECONDS,
+    overdue_loans, member_loans, renew_loan, fuzzy_search, add_books, add_members, MAX_BORROW,
+    loan_count, transaction, TransactionConflict, add_loan_history, related_books,
+)
+from changefeed import ChangeFeed
+from fines import calculate_fines
+from loans import DAY
+from bulk import export_books, load_books
+from sharding import ShardedLibrary
+from store import BookStore, MemberStore
+from synthetic import (
+    ZipfSampler, generate_books, generate_borrows, generate_members, generate_queries,
+    isbn_for, member_id_for,
+)
+from wal import WriteAheadLog
+
+SYLLABLES = ("ka", "ro", "mi", "ten", "sa", "lu", "dor", "vi", "ne", "th",
+             "ar", "bel", "co", "fi", "gra", "hu", "jo", "ly", "pen", "qu")
+# 8000 pseudo-words plus a few real ones so queries are selective
+WORDS = tuple(a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES) + (
+    "python", "galaxy", "night", "river", "code")
+SURNAMES = ("Adams", "Knuth", "Harari", "Weir", "Eco", "Smith", "Okafor",
+            "Bangura", "Kamara", "Nakamura", "Garcia", "Novak")
+
+
+def time_per_call(fn, args_list):
+    """Return the mean seconds per call of fn over args_list"""
+    start = time.perf_counter()
+    for args in args_list:
+        fn(*args)
+    return (time.perf_counter() - start) / len(args_list)
+
+
+def run_threads(n, target):
+    """Run target(i) on n threads and return the elapsed seconds"""
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(n)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start
+
+
+def fill_members(n):
+    """Replace the member store with n synthetic members"""
+    members.clear()
+    for i in range(n):
+        members.append({"member_id": f"M{i:07d}", "name": f"Member {i}",
+                        "email": f"m{i}@example.com", "borrowed_books": []})
+
+
+def fill_books(n, seed=7):
+    """Replace the catalogue with n synthetic books via add_book"""
+    rng = random.Random(seed)
+    books.clear()
+    for i in range(n):
+        title = " ".join(rng.choice(WORDS) for _ in range(3)).title()
+        add_book(f"978-{i:010d}", title, f"A. {rng.choice(SURNAMES)}", "Fiction", 1)
+
+
+def bench_find_member(sizes=(1_000, 10_000, 100_000, 1_000_000), lookups=100_000):
+    """find_member cost should stay flat as the member base grows"""
+    print("\nfind_member (mean per lookup)")
+    rng = random.Random(42)
+    for n in sizes:
+        fill_members(n)
+        ids = [(f"M{rng.randrange(n):07d}",) for _ in range(lookups)]
+        hit = time_per_call(find_member, ids)
+        miss = time_per_call(find_member, [("NOPE",)] * lookups)
+        print(f"  {n:>9,} members: hit {hit * 1e9:7.0f} ns   miss {miss * 1e9:7.0f} ns")
+    members.clear()
+
+
+def bench_search_books(sizes=(10_000, 100_000), queries=("python", "galax", "night river", "knuth code")):
+    """Indexed search vs the substring scan"""
+    print("\nsearch_books (mean per query)")
+    for n in sizes:
+        fill_books(n)
+        for mode in ("index", "substring"):
+            t = time_per_call(search_books, [(q, mode) for q in queries])
+            print(f"  {n:>9,} books, {mode:<9}: {t * 1e3:8.2f} ms")
+    books.clear()
+
+
+def allocated_bytes(build):
+    """Return the bytes still allocated by the object build() returns"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    obj = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del obj
+    return after - before
+
+
+def bench_record_memory(n=100_000):
+    """Bytes per record: plain dicts vs BookStore / MemberStore"""
+    print(f"\nmemory per record ({n:,} records)")
+    rng = random.Random(1)
+    rows = [(f"978-{i:010d}", f"Title {i}", f"A. {rng.choice(SURNAMES)}") for i in range(n)]
+
+    def book_dicts():
+        return {isbn: {"title": t, "author": "".join(a), "genre": "Fiction",
+                       "total_copies": 3, "available_copies": 3} for isbn, t, a in rows}
+
+    def book_store():
+        store = BookStore()
+        for isbn, t, a in rows:
+            store[isbn] = {"title": t, "author": "".join(a), "genre": "Fiction",
+                           "total_copies": 3, "available_copies": 3}
+        return store
+
+    def member_dicts():
+        return [{"member_id": f"M{i:07d}", "name": f"Member {i}",
+                 "email": f"m{i}@example.com", "borrowed_books": []} for i in range(n)]
+
+    def member_store():
+        return MemberStore({"member_id": f"M{i:07d}", "name": f"Member {i}",
+                            "email": f"m{i}@example.com", "borrowed_books": []} for i in range(n))
+
+    for label, before, after in (("books", book_dicts, book_store),
+                                 ("members", member_dicts, member_store)):
+        b, a = allocated_bytes(before) / n, allocated_bytes(after) / n
+        print(f"  {label:<8} dicts {b:6.0f} B   store {a:6.0f} B   ({1 - a / b:.0%} smaller)")
+
+
+def bench_batch_circulation(n_members=100_000, n_books=100_000, batch=50_000):
+    """borrow_many/return_many vs calling borrow_book/return_book in a loop"""
+    print(f"\nbatch circulation ({batch:,} pairs)")
+    fill_books(n_books)
+    fill_members(n_members)
+    # every pair is valid so the atomic mode commits too
+    rng = random.Random(3)
+    pairs = [(f"M{i % n_members:07d}", f"978-{i % n_books:010d}") for i in range(batch)]
+    rng.shuffle(pairs)
+    for label, borrow, ret in (
+            ("per-call loop", lambda p: [borrow_book(*x) for x in p], lambda p: [return_book(*x) for x in p]),
+            ("batch", borrow_many, return_many),
+            ("batch atomic", lambda p: borrow_many(p, atomic=True), lambda p: return_many(p, atomic=True))):
+        start = time.perf_counter()
+        done = borrow(pairs)
+        mid = time.perf_counter()
+        ret([x for x, ok in zip(pairs, done) if ok])
+        end = time.perf_counter()
+        print(f"  {label:<13}: borrow {batch / (mid - start):10,.0f} ops/s   "
+              f"return {sum(done) / (end - mid):10,.0f} ops/s")
+    books.clear()
+    members.clear()
+
+
+def bench_threaded_circulation(thread_counts=(1, 2, 4, 8), ops_per_thread=50_000):
+    """borrow/return throughput as desk threads are added"""
+    print("\nthreaded circulation (borrow + return pairs)")
+    fill_books(10_000)
+    fill_members(10_000)
+    for n in thread_counts:
+        def desk(seed):
+            rng = random.Random(seed)
+            for _ in range(ops_per_thread // 2):
+                member_id, isbn = f"M{rng.randrange(10_000):07d}", f"978-{rng.randrange(10_000):010d}"
+                if borrow_book(member_id, isbn):
+                    return_book(member_id, isbn)
+        elapsed = run_threads(n, desk)
+        print(f"  {n} threads: {n * ops_per_thread / elapsed:10,.0f} ops/s")
+    books.clear()
+    members.clear()
+
+
+def bench_wal_writes(policies=(("always", 2_000), ("batch", 50_000), ("never", 50_000))):
+    """Logged borrow/return throughput under each fsync policy"""
+    print("\nwrite-ahead log (borrow + return, logged)")
+    for policy, ops in policies:
+        for n_threads in (1, 8):
+            fill_books(1_000)
+            fill_members(1_000)
+            with tempfile.TemporaryDirectory() as directory:
+                open_storage(directory, fsync=policy, checkpoint_every=0)
+
+                def desk(seed):
+                    rng = random.Random(seed)
+                    for _ in range(ops // 2 // n_threads):
+                        member_id, isbn = f"M{rng.randrange(1_000):07d}", f"978-{rng.randrange(1_000):010d}"
+                        if borrow_book(member_id, isbn):
+                            return_book(member_id, isbn)
+                elapsed = run_threads(n_threads, desk)
+                close_storage()
+            print(f"  fsync={policy:<6} {n_threads} threads: {ops / elapsed:10,.0f} ops/s")
+    books.clear()
+    members.clear()
+
+
+def bench_wal_recovery(records=1_000_000):
+    """Time to recover from a snapshot plus a long log"""
+    print(f"\nrecovery ({records:,} log records)")
+    fill_books(10_000)
+    fill_members(10_000)
+    with tempfile.TemporaryDirectory() as directory:
+        open_storage(directory, checkpoint_every=0)
+        close_storage()
+        # write the log directly: alternating borrow/return of valid pairs
+        wal = WriteAheadLog(directory, fsync="never")
+        for i in range(records // 2):
+            pair = [f"M{i % 10_000:07d}", f"978-{i % 10_000:010d}"]
+            wal.append_many([("borrow_book", pair, None), ("return_book", pair, None)])
+        wal.close()
+        size = os.path.getsize(wal.log_path)
+        books.clear()
+        members.clear()
+        start = time.perf_counter()
+        replayed = open_storage(directory, checkpoint_every=0)
+        elapsed = time.perf_counter() - start
+        close_storage()
+    print(f"  replayed {replayed:,} records ({size / 1e6:.0f} MB) in {elapsed:.2f} s "
+          f"({replayed / elapsed:,.0f} records/s)")
+    books.clear()
+    members.clear()
+
+
+COLD_START = """
+import sys, time
+start = time.perf_counter()
+from operations import borrow_book, import_snapshot, search_books
+imported = time.perf_counter()
+import_snapshot(sys.argv[1], lazy=sys.argv[2] == "lazy")
+loaded = time.perf_counter()
+borrow_book("M0000042", "978-0000004242")
+borrowed = time.perf_counter()
+search_books("python galaxy")
+searched = time.perf_counter()
+print(imported - start, loaded - imported, borrowed - loaded, searched - borrowed)
+"""
+
+
+def bench_snapshot_cold_start(n_books=1_000_000, n_members=100_000):
+    """Fresh-process time until the first borrow/search from a binary snapshot"""
+    print(f"\nsnapshot cold start ({n_books:,} books, {n_members:,} members)")
+    fill_books(n_books)
+    fill_members(n_members)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "catalogue.snap")
+        start = time.perf_counter()
+        export_snapshot(path)
+        print(f"  export: {time.perf_counter() - start:.2f} s, {os.path.getsize(path) / 1e6:.0f} MB")
+        books.clear()
+        members.clear()
+        for mode in ("lazy", "eager"):
+            out = subprocess.run([sys.executable, "-c", COLD_START, path, mode],
+                                 capture_output=True, text=True, check=True,
+                                 cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+            startup, load, borrow, search = (float(x) * 1e3 for x in out.split())
+            print(f"  {mode:<5}: import modules {startup:6.1f} ms   load {load:9.1f} ms"
+                  f"   first borrow {borrow:6.2f} ms   first search {search:6.2f} ms")
+
+
+BACKEND_RUN = """
+import random, sys, time
+from benchmark import fill_books, fill_members
+from operations import borrow_book, return_book, search_books
+n, ops = int(sys.argv[1]), int(sys.argv[2])
+start = time.perf_counter()
+fill_books(n)
+fill_members(n)
+loaded = time.perf_counter()
+rng = random.Random(5)
+for _ in range(ops // 2):
+    member_id, isbn = f"M{rng.randrange(n):07d}", f"978-{rng.randrange(n):010d}"
+    if borrow_book(member_id, isbn):
+        return_book(member_id, isbn)
+circulated = time.perf_counter()
+for q in ("python", "galaxy night", "knuth"):
+    search_books(q)
+searched = time.perf_counter()
+print(loaded - start, ops / (circulated - loaded), (searched - circulated) / 3)
+"""
+
+
+def bench_backends(n=20_000, ops=20_000):
+    """Same workload against the in-memory and SQLite backends"""
+    print(f"\nstorage backends ({n:,} books/members)")
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as directory:
+        for backend in ("memory", "sqlite"):
+            env = dict(os.environ, LIBRARY_BACKEND=backend,
+                       LIBRARY_DB=os.path.join(directory, "bench.db"))
+            out = subprocess.run([sys.executable, "-c", BACKEND_RUN, str(n), str(ops)],
+                                 capture_output=True, text=True, check=True, cwd=here, env=env).stdout
+            load, rate, search = (float(x) for x in out.split())
+            print(f"  {backend:<6}: load {load:6.2f} s   circulation {rate:9,.0f} ops/s"
+                  f"   search {search * 1e3:7.2f} ms")
+
+
+def bench_server(client_counts=(1, 100, 1000), pipelines=(1, 16), requests=50):
+    """Throughput and latency of server.py under the bundled load generator"""
+    import asyncio
+    from loadgen import run_load
+    print(f"\nasyncio server ({requests} requests per client)")
+    here = os.path.dirname(os.path.abspath(__file__))
+    server = subprocess.Popen([sys.executable, "server.py", "0"], cwd=here,
+                              stdout=subprocess.PIPE, text=True)
+    try:
+        port = int(server.stdout.readline().rsplit(":", 1)[1])
+        seeded = False
+        for clients in client_counts:
+            for pipeline in pipelines:
+                report = asyncio.run(run_load(port=port, clients=clients, requests=requests,
+                                              pipeline=pipeline, seed_data=not seeded))
+                seeded = True
+                print(f"  {clients:5,} clients, pipeline {pipeline:2}: {report['rps']:9,.0f} req/s"
+                      f"   p50 {report['p50_ms']:7.2f} ms   p99 {report['p99_ms']:7.2f} ms"
+                      f"   errors {report['errors']}")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def bench_loan_ledger(n_members=100_000, n_books=100_000, loans=200_000, lookups=1_000):
+    """Who has a book: scan of every member's list vs the loan ledger"""
+    print(f"\nloan ledger ({n_members:,} members, {loans:,} loans)")
+    fill_members(n_members)
+    fill_books(n_books)
+    for isbn in books:
+        books[isbn]["total_copies"] = books[isbn]["available_copies"] = 10
+    rng = random.Random(11)
+    borrow_many((f"M{rng.randrange(n_members):07d}", f"978-{rng.randrange(n_books):010d}")
+                for _ in range(loans))
+    isbns = [(f"978-{rng.randrange(n_books):010d}",) for _ in range(lookups)]
+
+    def scan(isbn):
+        return {m["member_id"]: m["borrowed_books"].count(isbn)
+                for m in members if isbn in m["borrowed_books"]}
+
+    assert all(scan(*args) == borrowers(*args) for args in isbns[:10])
+    slow = time_per_call(scan, isbns[:20])
+    fast = time_per_call(borrowers, isbns)
+    print(f"  scan members: {slow * 1e3:9.3f} ms   ledger: {fast * 1e6:6.2f} us"
+          f"   ({slow / fast:,.0f}x)")
+    books.clear()
+    members.clear()
+
+
+def run_all_benchmarks():
+    """Run all benchmark functions"""
+    print("Running Library Management System Benchmarks...")
+    bench_find_member()
+    bench_search_books()
+    bench_record_memory()
+    bench_batch_circulation()
+    bench_threaded_circulation()
+    bench_wal_writes()
+    bench_wal_recovery()
+    bench_snapshot_cold_start()
+    bench_backends()
+    bench_server()
+    bench_loan_ledger()
+    bench_instrumentation()
+    bench_query_cache()
+    bench_streaming_search()
+    bench_facets()
+    bench_sharding()
+    bench_bulk_load()
+    bench_change_feed()
+    bench_holds()
+    bench_due_dates()
+    bench_fuzzy_search()
+    bench_transactions()
+    bench_recommendations()
+
+
+def bench_instrumentation(n=100_000, ops=200_000, rounds=5):
+    """Cost of the metrics layer: undecorated vs disabled vs enabled vs profiling"""
+    import metrics
+    print(f"\ninstrumentation overhead (borrow + return pairs, {n:,} books/members)")
+    fill_members(n)
+    fill_books(n)
+    rng = random.Random(3)
+    pairs = [(f"M{rng.randrange(n):07d}", f"978-{rng.randrange(n):010d}") for _ in range(ops // 2)]
+    ids = [(f"M{rng.randrange(n):07d}",) for _ in range(ops)]
+
+    def circulate(borrow, give_back):
+        start = time.perf_counter()
+        for member_id, isbn in pairs:
+            if borrow(member_id, isbn):
+                give_back(member_id, isbn)
+        return (time.perf_counter() - start) / ops
+
+    modes = (("undecorated", lambda: None), ("disabled", metrics.disable),
+             ("enabled", metrics.enable), ("profiling 1/100", lambda: (metrics.enable(), metrics.start_profiling(every=100))))
+    best = {}
+    for round_no in range(rounds):  # best of several rounds, alternating the order
+        for label, switch in (modes if round_no % 2 else modes[::-1]):
+            switch()
+            if label == "undecorated":
+                fns = (borrow_book.__wrapped__, return_book.__wrapped__, find_member.__wrapped__)
+            else:
+                fns = (borrow_book, return_book, find_member)
+            t = circulate(*fns[:2])
+            lookup = time_per_call(fns[2], ids)
+            old = best.get(label, (t, lookup))
+            best[label] = (min(old[0], t), min(old[1], lookup))
+            metrics.stop_profiling()
+            metrics.disable()
+    base_op, base_lookup = best["undecorated"]
+    for label, _ in modes:
+        op, lookup = best[label]
+        print(f"  {label:<16}: circulation {op * 1e6:6.2f} us/op ({op / base_op - 1:+6.1%})"
+              f"   find_member {lookup * 1e9:5.0f} ns ({lookup / base_lookup - 1:+6.1%})")
+    metrics.reset()
+    books.clear()
+    members.clear()
+
+
+def bench_query_cache(n=100_000, queries=5_000, update_every=10):
+    """Skewed search traffic with and without the query cache, with updates mixed in"""
+    print(f"\nsearch cache ({n:,} books, {queries:,} Zipf-distributed queries,"
+          f" one update_book per {update_every} searches)")
+    load_library(n, 0)
+    workload = generate_queries(queries, seed=5)
+    rng = random.Random(5)
+    retitles = [(isbn_for(rng.randrange(n)), t) for t in generate_queries(queries // update_every, seed=6)]
+    for maxsize in (0, 256, 4096):
+        configure_cache(maxsize=maxsize)
+        configure_cache(maxsize=0)  # start empty
+        configure_cache(maxsize=maxsize)
+        before = cache_stats()
+        start = time.perf_counter()
+        for i, q in enumerate(workload):
+            search_books(q)
+            if i % update_every == 0:
+                update_book(retitles[i // update_every][0], title=retitles[i // update_every][1])
+        elapsed = time.perf_counter() - start
+        stats = cache_stats()
+        hits, misses = stats["hits"] - before["hits"], stats["misses"] - before["misses"]
+        rate = hits / (hits + misses) if maxsize else 0.0
+        print(f"  maxsize {maxsize:5}: {elapsed / queries * 1e3:7.3f} ms per search"
+              f"   hit rate {rate:5.1%}   invalidations {stats['invalidations'] - before['invalidations']:,}")
+    for q in ("python", "night ri", "love"):
+        configure_cache(maxsize=0)
+        cold = time_per_call(search_books, [(q,)] * 50)
+        configure_cache(maxsize=1024)
+        warm = time_per_call(search_books, [(q,)] * 50)
+        print(f"  repeated {q!r:<12} ({len(search_books(q)):6,} hits): uncached {cold * 1e3:7.3f} ms"
+              f"   cached {warm * 1e3:7.3f} ms")
+    books.clear()
+
+
+
+def _first_and_peak(consume):
+    """Seconds to the first result, seconds in total and peak traced bytes"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    first = consume()
+    total = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return first - start, total, peak
+
+
+def bench_streaming_search(n=200_000, queries=("the", "love", "night ri"), page=50):
+    """Full result lists vs streamed views vs one page, for broad and narrow queries"""
+    print(f"\nstreaming search ({n:,} books, uncached; first result / all results / peak memory)")
+    load_library(n, 0)
+    configure_cache(maxsize=0)
+
+    def full(q):
+        results = search_books(q)
+        first = time.perf_counter()
+        for _ in results:
+            pass
+        return first
+
+    def streamed(q):
+        stream = iter_books(q)
+        next(stream, None)
+        first = time.perf_counter()
+        for _ in stream:
+            pass
+        return first
+
+    def paged(q):
+        search_page(q, limit=page)
+        return time.perf_counter()
+
+    for q in queries:
+        hits = sum(1 for _ in iter_books(q))
+        print(f"  {q!r} ({hits:,} hits)")
+        for label, consume in (("search_books", full), ("iter_books", streamed),
+                               (f"search_page({page})", paged)):
+            first, total, peak = _first_and_peak(lambda: consume(q))
+            print(f"    {label:<17} {first * 1e3:8.2f} ms {total * 1e3:8.2f} ms {peak / 1e6:8.2f} MB")
+    configure_cache(maxsize=1024)
+    books.clear()
+
+
+
+def bench_facets(n=200_000, repeat=20):
+    """Genre/availability counts and filters: full scan vs the facet index"""
+    print(f"\nfacets ({n:,} books, {n // 4:,} loans)")
+    load_library(n, n // 4)
+    for member_id, isbn in generate_borrows(n // 4, n // 4, n, seed=9):
+        borrow_book(member_id, isbn)
+
+    def scan_count():
+        return sum(1 for isbn in books
+                   if books[isbn]["genre"] == "Mystery" and books[isbn]["available_copies"] > 0)
+
+    def scan_totals():
+        totals = {}
+        for isbn in books:
+            record = books.record(isbn)
+            row = totals.setdefault(record["genre"], [0, 0, 0, 0])
+            row[0] += 1
+            row[1] += record["available_copies"] > 0
+            row[2] += record["total_copies"]
+            row[3] += record["available_copies"]
+        return totals
+
+    def scan_page():
+        return [isbn for isbn in sorted(books)
+                if books[isbn]["genre"] == "Mystery" and books[isbn]["available_copies"] > 0][:20]
+
+    cases = (
+        ("count Mystery, available", scan_count,
+         lambda: count_books(genre="Mystery", available=True)),
+        ("per-genre totals", scan_totals, genre_counts),
+        ("first page Mystery, available", scan_page,
+         lambda: search_page("", genre="Mystery", available=True)),
+        ("'love' in Mystery", lambda: [r for r in search_books("love") if r["genre"] == "Mystery"],
+         lambda: list(iter_books("love", genre="Mystery"))),
+    )
+    for label, scan, indexed in cases:
+        scan_time = time_per_call(scan, [()] * 3)
+        index_time = time_per_call(indexed, [()] * repeat)
+        print(f"  {label:<30} scan {scan_time * 1e3:9.3f} ms   facets {index_time * 1e3:9.3f} ms")
+    pairs = generate_borrows(50_000, n // 4, n, seed=10)
+    start = time.perf_counter()
+    for pair in pairs:
+        if borrow_book(*pair):
+            return_book(*pair)
+    print(f"  borrow + return with facets kept up to date: {(time.perf_counter() - start) / len(pairs) * 1e6:.2f} us")
+    books.clear()
+    members.clear()
+
+
+
+def bench_sharding(n=200_000, worker_counts=(1, 2, 4), queries=1_000, clients=8):
+    """Search throughput of the sharded catalogue by number of worker processes
+
+    count_books runs the same search on every shard but only sends back
+    a number, which shows how the search itself scales; search_books
+    also ships every matching row to the coordinator.
+    """
+    print(f"\nsharded search ({n:,} books, {queries:,} queries from {clients} threads,"
+          f" {os.cpu_count()} CPUs; searches/s)")
+    workload = generate_queries(queries, seed=11)
+    load_library(n, 0)  # search caches stay on, as they are in the workers
+    single = {}
+    for name, fn in (("search_books", search_books), ("count_books", count_books)):
+        single[name] = 1 / time_per_call(fn, [(q,) for q in workload])
+        print(f"  single process  {name:<13} {single[name]:8,.0f}")
+    books.clear()
+    slices = [workload[i::clients] for i in range(clients)]
+    for workers in worker_counts:
+        with ShardedLibrary(workers) as lib:
+            lib.add_books(generate_books(n, 0))
+            for name in ("search_books", "count_books"):
+                fn = getattr(lib, name)
+                threads = [threading.Thread(target=lambda batch=batch: [fn(q) for q in batch])
+                           for batch in slices]
+                start = time.perf_counter()
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+                rate = queries / (time.perf_counter() - start)
+                print(f"  {workers} worker(s)     {name:<13} {rate:8,.0f}   ({rate / single[name]:.2f}x)")
+
+
+def bench_bulk_load(n=200_000, chunk_sizes=(1_000, 10_000)):
+    """Loading books from a CSV file: an add_book loop vs load_books
+
+    The peak is the memory tracemalloc sees above what the loaded
+    catalogue itself holds, i.e. what the loader keeps in flight.
+    """
+    print(f"\nbulk load ({n:,} books from CSV)")
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "books.csv")
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        f.write("isbn,title,author,genre,total_copies\n")
+        for row in generate_books(n, seed=12):
+            f.write(",".join(map(str, row)) + "\n")
+    books.clear()
+    start = time.perf_counter()
+    with open(path, encoding="utf-8") as f:
+        next(f)
+        for line in f:
+            isbn, title, author, genre, copies = line.rstrip("\n").split(",")
+            add_book(isbn, title, author, genre, int(copies))
+    loop = time.perf_counter() - start
+    print(f"  add_book loop            {loop:6.2f} s  {n / loop:9,.0f} rows/s")
+    for chunk in chunk_sizes:
+        books.clear()
+        report = load_books(path, chunk_size=chunk)
+        print(f"  load_books chunk {chunk:>6,}  {report['seconds']:6.2f} s  {n / report['seconds']:9,.0f} rows/s")
+    start = time.perf_counter()
+    export_books(os.path.join(directory, "export.csv"))
+    print(f"  export_books             {time.perf_counter() - start:6.2f} s")
+    for chunk in chunk_sizes:
+        books.clear()
+        tracemalloc.start()
+        load_books(path, chunk_size=chunk)
+        held, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"  chunk {chunk:>6,}: loader peak {(peak - held) / 2**20:6.1f} MB above the stored catalogue")
+    books.clear()
+
+
+def bench_change_feed(n=200_000, updates=1_000, events=200_000, batch_sizes=(1, 100, 1_000)):
+    """Incremental sync from the change feed vs rescanning the catalogue"""
+    print(f"\nchange feed ({n:,} books, {updates:,} changes to sync)")
+    load_library(n, 1_000)
+    position = changes()["next"]
+    pairs = generate_borrows(updates, 1_000, n, seed=13)
+    for pair in pairs:
+        if borrow_book(*pair):
+            return_book(*pair)
+    start = time.perf_counter()
+    replica = {isbn: books.record(isbn) for isbn in books}
+    scan = time.perf_counter() - start
+    start = time.perf_counter()
+    synced = 0
+    while True:
+        page = changes(position, limit=1_000)
+        if not page["events"]:
+            break
+        synced += len(page["events"])
+        position = page["next"]
+    feed = time.perf_counter() - start
+    print(f"  full rescan       {scan * 1e3:9.2f} ms  ({len(replica):,} books)")
+    print(f"  changes() since   {feed * 1e3:9.2f} ms  ({synced:,} events)")
+
+    feed = ChangeFeed()
+    start = time.perf_counter()
+    for i in range(events):
+        feed.publish("borrow_book", ("M0000001", isbn_for(i)))
+    print(f"  publish           {(time.perf_counter() - start) / events * 1e9:9.0f} ns per event")
+    for batch_size in batch_sizes:
+        feed = ChangeFeed(capacity=4_096)
+        subscription = feed.subscribe(batch_size=batch_size)
+        received = [0]
+
+        def consume():
+            while received[0] < events:
+                received[0] += len(subscription.poll(timeout=5))
+
+        reader = threading.Thread(target=consume)
+        start = time.perf_counter()
+        reader.start()
+        for i in range(events):
+            feed.publish("borrow_book", ("M0000001", isbn_for(i)))
+        reader.join()
+        elapsed = time.perf_counter() - start
+        subscription.close()
+        print(f"  tail, batch {batch_size:>5,}  {events / elapsed:9,.0f} events/s  (overruns: {feed.overruns})")
+    books.clear()
+    members.clear()
+
+
+def bench_holds(patrons=2_000, copies=20, queue_sizes=(10, 1_000, 100_000), returns=2_000):
+    """A popular title: patrons retrying borrow_book vs waiting in a hold queue"""
+    print(f"\nholds ({patrons:,} patrons, one title with {copies} copies)")
+    isbn = isbn_for(0)
+
+    def setup(n_members):
+        books.clear()
+        members.clear()
+        add_book(isbn, "Popular", "A. Writer", "Fiction", copies)
+        for i in range(n_members):
+            add_member(member_id_for(i), f"Member {i}", f"m{i}@example.com")
+
+    # each round, every loan comes back and the waiting patrons try again
+    setup(patrons)
+    calls, start = 0, time.perf_counter()
+    waiting, holding = [member_id_for(i) for i in range(patrons)], []
+    while waiting:
+        for member_id in holding:
+            return_book(member_id, isbn)
+        holding, still = [], []
+        for member_id in waiting:
+            calls += 1
+            (holding if borrow_book(member_id, isbn) else still).append(member_id)
+        waiting = still
+    retry = time.perf_counter() - start
+    print(f"  retrying borrow_book   {calls:9,} calls  {retry * 1e3:8.1f} ms")
+
+    setup(patrons)
+    calls, start = 0, time.perf_counter()
+    holding = []
+    for i in range(patrons):
+        calls += 1
+        if not place_hold(member_id_for(i), isbn):
+            calls += 1
+            borrow_book(member_id_for(i), isbn)
+            holding.append(member_id_for(i))
+    while holding:
+        for member_id in holding:
+            return_book(member_id, isbn)
+        holding = list(hold_queue(isbn)["ready"])
+        for member_id in holding:
+            calls += 1
+            borrow_book(member_id, isbn)
+    held = time.perf_counter() - start
+    print(f"  hold queue             {calls:9,} calls  {held * 1e3:8.1f} ms")
+
+    for size in queue_sizes:
+        setup(size + returns)
+        borrowers = [member_id_for(size + i) for i in range(returns)]
+        update_book(isbn, total_copies=returns)
+        for member_id in borrowers:
+            borrow_book(member_id, isbn)
+        for i in range(size):
+            place_hold(member_id_for(i), isbn)
+        start = time.perf_counter()
+        for member_id in borrowers:
+            return_book(member_id, isbn)  # each copy goes to the next in the queue
+        per_return = (time.perf_counter() - start) / returns
+        start = time.perf_counter()
+        lapsed = expire_holds(time.time() + HOLD_PICKUP_SECONDS + 1)
+        per_expiry = (time.perf_counter() - start) / max(lapsed, 1)
+        print(f"  queue of {size:>7,}: return + allocate {per_return * 1e6:6.1f} us,"
+              f" lapse {per_expiry * 1e6:6.1f} us per hold")
+    books.clear()
+    members.clear()
+
+
+def bench_due_dates(n_loans=1_000_000, n_books=1_000, days=60, limit=100, renewals=20_000):
+    """Overdue loans from the due date index vs a scan of every member's loans"""
+    print(f"\ndue dates ({n_loans:,} loans checked out over {days} days)")
+    now = time.time()
+    books.clear()
+    add_books((isbn_for(i), f"Title {i}", "A. Writer", "Fiction", n_loans) for i in range(n_books))
+    n_members = -(-n_loans // MAX_BORROW)
+    add_members((member_id_for(i), f"Member {i}", f"m{i}@example.com") for i in range(n_members))
+    pairs = [(member_id_for(i // MAX_BORROW), isbn_for(i % n_books)) for i in range(n_loans)]
+    per_day = -(-n_loans // days)
+    start = time.perf_counter()
+    for day in range(days):
+        borrow_many(pairs[day * per_day:(day + 1) * per_day], at=now - (days - day) * DAY)
+    print(f"  checkout            {(time.perf_counter() - start) / n_loans * 1e6:8.2f} us per loan")
+
+    start = time.perf_counter()
+    scanned = sorted((l["due"], l["member_id"]) for i in range(n_members)
+                     for l in member_loans(member_id_for(i)) if l["due"] < now)[:limit]
+    scan = time.perf_counter() - start
+    start = time.perf_counter()
+    indexed = overdue_loans(now, limit)
+    index = time.perf_counter() - start
+    assert [row["member_id"] for row in indexed] == [member_id for _, member_id in scanned]
+    print(f"  oldest {limit} overdue: scan {scan * 1e3:9.1f} ms   index {index * 1e3:7.3f} ms")
+
+    fines = calculate_fines(now)
+    print(f"  fines job           {fines['loans']:,} overdue loans in {fines['seconds']:.2f} s"
+          f" ({fines['loans'] / fines['seconds']:,.0f} loans/s)")
+
+    # renew loans that are not overdue yet (checked out in the last days)
+    recent = [pairs[-i - 1] for i in range(renewals)]
+    start = time.perf_counter()
+    renewed = sum(renew_loan(member_id, isbn, at=now) for member_id, isbn in recent)
+    print(f"  renew_loan          {(time.perf_counter() - start) / renewals * 1e6:8.2f} us"
+          f" per call ({renewed:,} renewed)")
+    books.clear()
+    members.clear()
+
+
+def bench_fuzzy_search(n=1_000_000, queries=200, scanned=3, seed=21):
+    """Misspelled author searches: trigram candidates vs edit distance against every book"""
+    print(f"\nfuzzy search ({n:,} books, {queries} misspelled surnames)")
+    load_library(n, 0)
+    rng = random.Random(seed)
+    typos = []
+    for i in rng.sample(range(n), queries):
+        surname = books[isbn_for(i)]["author"].split()[-1].lower()
+        k = rng.randrange(len(surname) - 1)
+        typos.append((surname, surname[:k] + surname[k + 1] + surname[k] + surname[k + 2:]))
+    found, start = 0, time.perf_counter()
+    for surname, typo in typos:
+        found += any(surname in row["author"].lower().split() for row in fuzzy_search(typo))
+    indexed = (time.perf_counter() - start) / queries
+    print(f"  fuzzy_search    {indexed * 1e3:9.3f} ms per query, right surname in the top 10"
+          f" for {found}/{queries}")
+
+    from search_index import edit_distance, max_edits, tokenize
+    start = time.perf_counter()
+    for _, typo in typos[:scanned]:
+        limit = max_edits(typo)
+        sorted((min(edit_distance(typo, word, limit) for word in tokenize(f"{b['title']} {b['author']}")), isbn)
+               for isbn, b in books.items())[:10]
+    scan = (time.perf_counter() - start) / scanned
+    print(f"  full scan       {scan * 1e3:9.1f} ms per query ({scan / indexed:,.0f}x)")
+    books.clear()
+
+
+def bench_transactions(n_members=20_000, threads=4, per_thread=2_000, hot_sizes=(20_000, 100, 5)):
+    """Desk workflow "return 2, borrow 3" one call at a time vs as a transaction; conflict rates"""
+    print(f"\ntransactions ({n_members:,} members returning 2 books and borrowing 3)")
+    n_books = 5 * n_members
+    books.clear()
+    members.clear()
+    add_books((isbn_for(i), f"Title {i}", "A. Writer", "Fiction", 1) for i in range(n_books))
+    add_members((member_id_for(i), f"Member {i}", f"m{i}@example.com") for i in range(n_members))
+    borrow_many([(member_id_for(i), isbn_for(5 * i + k)) for i in range(n_members) for k in range(2)])
+    def one_by_one(i):
+        m = member_id_for(i)
+        return_book(m, isbn_for(5 * i))
+        return_book(m, isbn_for(5 * i + 1))
+        for k in range(2, 5):
+            borrow_book(m, isbn_for(5 * i + k))
+
+    def as_transaction(i):
+        m = member_id_for(i)
+        with transaction() as tx:
+            tx.return_book(m, isbn_for(5 * i))
+            tx.return_book(m, isbn_for(5 * i + 1))
+            for k in range(2, 5):
+                tx.borrow_book(m, isbn_for(5 * i + k))
+
+    # in memory for most members, then a few with every log record synced
+    synced = min(500, n_members // 10)
+    in_memory = n_members // 2 - synced
+    runs = [(one_by_one, None, in_memory), (as_transaction, None, in_memory),
+            (one_by_one, "always", synced), (as_transaction, "always", synced)]
+    timings, first = [], 0
+    for workflow, fsync, count in runs:
+        with tempfile.TemporaryDirectory() as directory:
+            if fsync:
+                open_storage(directory, fsync=fsync)
+            start = time.perf_counter()
+            for i in range(first, first + count):
+                workflow(i)
+            timings.append((time.perf_counter() - start) / count)
+            close_storage()
+        first += count
+    assert sum(loan_count(member_id_for(i)) for i in range(n_members)) == 3 * n_members
+    for label, (single, staged) in (("in memory", timings[:2]), ("fsync=always", timings[2:])):
+        print(f"  {label:<13} 5 single calls {single * 1e6:8.1f} us   one transaction"
+              f" {staged * 1e6:8.1f} us per workflow ({staged / single:.2f}x)")
+
+    # threads renaming members and swapping a loan; retried on conflict
+    for hot in hot_sizes:
+        conflicts = [0]
+
+        def desk(seed):
+            rng = random.Random(seed)
+            for _ in range(per_thread):
+                i = rng.randrange(hot)
+                m = member_id_for(i)
+                while True:
+                    try:
+                        with transaction() as tx:
+                            tx.update_member(m, name=f"Member {i} ({seed})")
+                            tx.return_book(m, isbn_for(5 * i + 2))
+                            tx.borrow_book(m, isbn_for(5 * i + 2))
+                        break
+                    except TransactionConflict:
+                        conflicts[0] += 1
+
+        workers = [threading.Thread(target=desk, args=(t,)) for t in range(threads)]
+        start = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter() - start
+        commits = threads * per_thread
+        print(f"  {threads} threads, {hot:>6,} members: {commits / elapsed:9,.0f} commits/s,"
+              f" {conflicts[0] / commits:6.1%} retried")
+    books.clear()
+    members.clear()
+
+
+def bench_recommendations(n_loans=2_000_000, n_books=100_000, n_members=100_000,
+                          incremental=200_000, queries=1_000, scanned=3):
+    """Co-borrowing counts: bulk rebuild vs one loan at a time; related_books vs a scan"""
+    print(f"\nrecommendations ({n_loans:,} past loans, {n_books:,} books, {n_members:,} members)")
+    books.clear()
+    members.clear()
+    add_books(generate_books(n_books))
+    pairs = generate_borrows(n_loans, n_members, n_books)
+
+    start = time.perf_counter()
+    add_loan_history(pairs[:-incremental])
+    bulk = time.perf_counter() - start
+    history = members.history
+    loaded = len(history)
+    start = time.perf_counter()
+    for member_id, isbn in pairs[-incremental:]:  # as new loans would come in
+        history.record(member_id, isbn)
+    one_by_one = (time.perf_counter() - start) / (len(history) - loaded)
+    stats = history.stats()
+    print(f"  bulk rebuild        {bulk:8.2f} s for {loaded:,} distinct loans"
+          f" ({bulk / loaded * 1e6:.2f} us per loan)")
+    print(f"  one at a time       {one_by_one * 1e6:8.2f} us per loan (the last {incremental:,})")
+    print(f"  matrix              {stats['entries']:,} entries, {stats['bytes'] / 2**20:.0f} MiB of arrays")
+
+    # every book once (the long rows of popular books are then ranked), then again
+    rng = random.Random(23)
+    sample = list(dict.fromkeys(isbn for _, isbn in pairs[:queries // 10]))  # popular
+    sample += rng.sample(sorted({isbn for _, isbn in pairs}), queries - len(sample))
+    for label in ("first", "again"):
+        latencies = []
+        for isbn in sample:
+            start = time.perf_counter()
+            related_books(isbn)
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        print(f"  related_books {label}  p50 {latencies[len(latencies) // 2] * 1e3:6.3f} ms"
+              f"   p99 {latencies[len(latencies) * 99 // 100] * 1e3:6.3f} ms"
+              f"   max {latencies[-1] * 1e3:6.3f} ms")
+    popular = sample
+
+    # without the matrix: every member's history, for each query
+    start = time.perf_counter()
+    for isbn in popular[:scanned]:
+        counts = {}
+        for member_id, borrowed in history.dump():
+            if isbn in borrowed:
+                for other in borrowed:
+                    counts[other] = counts.get(other, 0) + 1
+        sorted(counts.items(), key=lambda item: -item[1])[:11]
+    scan = (time.perf_counter() - start) / scanned
+    print(f"  scan of the history {scan * 1e3:8.1f} ms per query")
+    books.clear()
+    members.clear()
+
+
+# ---------- Regression suite ----------
+# Times the main operations on seeded synthetic libraries of several
+# sizes. Results are written as JSON so two runs (say, before and after
+# a change) can be compared with `python benchmark.py compare`.
+
+SUITE_OPS = ("search_books", "find_member", "borrow_book", "return_book",
+             "update_book", "delete_member")
+
+
+def timed_calls(fn, args_list, repeat=1):
+    """Time each call of fn; return latency stats in microseconds
+
+    With repeat > 1 (only for calls that change nothing) each call is
+    made that many times and its fastest time is kept, which filters out
+    most of the noise from other processes.
+    """
+    clock = time.perf_counter_ns
+    latencies = []
+    succeeded = 0
+    for args in args_list:
+        best = None
+        for _ in range(repeat):
+            start = clock()
+            result = fn(*args)
+            elapsed = clock() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        latencies.append(best)
+        succeeded += bool(result)
+    latencies.sort()
+    total = sum(latencies)
+    n = len(latencies)
+    return {
+        "calls": n,
+        "succeeded": succeeded,
+        "mean_us": total / n / 1e3,
+        "p50_us": latencies[n // 2] / 1e3,
+        "p99_us": latencies[min(n - 1, n * 99 // 100)] / 1e3,
+        "ops_per_s": n / (total / 1e9) if total else 0.0,
+    }
+
+
+def load_library(n_books, n_members, seed=0):
+    """Replace all data with a synthetic library; returns seconds taken"""
+    start = time.perf_counter()
+    books.clear()
+    members.clear()
+    for row in generate_books(n_books, seed):
+        add_book(*row)
+    for row in generate_members(n_members, seed):
+        add_member(*row)
+    return time.perf_counter() - start
+
+
+def run_suite(sizes=(10_000, 100_000, 1_000_000), seed=0, ops=20_000, searches=200):
+    """Time SUITE_OPS at each size (books and members alike); returns a JSON-able dict"""
+    results = {}
+    for n in sizes:
+        print(f"\nsuite: {n:,} books and members (seed {seed})")
+        entry = {"load_s": load_library(n, n, seed)}
+        rng = random.Random(seed)
+        entry["search_books"] = timed_calls(search_books, [(q,) for q in generate_queries(searches, seed)],
+                                            repeat=3)
+        entry["find_member"] = timed_calls(find_member, [(member_id_for(rng.randrange(n)),)
+                                                         for _ in range(ops)], repeat=3)
+        pairs = generate_borrows(ops, n, n, seed)
+        entry["borrow_book"] = timed_calls(borrow_book, pairs)
+        on_loan = [(member_id, isbn) for member_id in sorted({m for m, _ in pairs})
+                   for isbn in find_member(member_id)["borrowed_books"]]
+        rng.shuffle(on_loan)
+        entry["return_book"] = timed_calls(return_book, on_loan)
+        retitles = zip((isbn_for(i) for i in ZipfSampler(n, rng).sample(ops)),
+                       generate_queries(ops, seed + 1))
+        entry["update_book"] = timed_calls(lambda isbn, title: update_book(isbn, title=title),
+                                           list(retitles))
+        entry["delete_member"] = timed_calls(delete_member, [(member_id_for(i),)
+                                                             for i in rng.sample(range(n), min(ops, n))])
+        for op in SUITE_OPS:
+            r = entry[op]
+            print(f"  {op:<14} mean {r['mean_us']:10.2f} us   p50 {r['p50_us']:10.2f} us"
+                  f"   p99 {r['p99_us']:10.2f} us   ({r['succeeded']:,}/{r['calls']:,} ok)")
+        print(f"  load           {entry['load_s']:.2f} s")
+        results[str(n)] = entry
+    books.clear()
+    members.clear()
+    return {"meta": _suite_meta(seed, ops, searches), "results": results}
+
+
+def _suite_meta(seed, ops, searches):
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True, cwd=here).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "backend": os.environ.get("LIBRARY_BACKEND", "memory"),
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "seed": seed,
+        "ops": ops,
+        "searches": searches,
+    }
+
+
+def compare_results(old, new, threshold=0.25):
+    """Print median latency changes; return the (size, op) pairs that got slower than threshold
+
+    Medians are compared rather than means because a single slow call
+    (a GC pause, another process) moves the mean a lot at these timescales.
+    """
+    print(f"comparing {old['meta'].get('commit')} -> {new['meta'].get('commit')} (median latency)")
+    regressions = []
+    for size, entry in new["results"].items():
+        before = old["results"].get(size)
+        if before is None:
+            continue
+        for op in SUITE_OPS:
+            if op not in entry or op not in before:
+                continue
+            a, b = before[op]["p50_us"], entry[op]["p50_us"]
+            change = b / a - 1 if a else 0.0
+            flag = ""
+            if change > threshold:
+                flag = "  REGRESSION"
+                regressions.append((size, op))
+            print(f"  {int(size):>10,} {op:<14} {a:10.2f} -> {b:10.2f} us  {change:+7.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command")
+    suite = commands.add_parser("suite", help="run the regression suite")
+    suite.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    suite.add_argument("--seed", type=int, default=0)
+    suite.add_argument("--ops", type=int, default=20_000, help="calls per operation and size")
+    suite.add_argument("--searches", type=int, default=200, help="search_books calls per size")
+    suite.add_argument("--out", help="write the results to this JSON file")
+    compare = commands.add_parser("compare", help="compare two suite result files")
+    compare.add_argument("old")
+    compare.add_argument("new")
+    compare.add_argument("--threshold", type=float, default=0.25,
+                         help="median slowdown that counts as a regression (default 0.25)")
+    args = parser.parse_args(argv)
+
+    if args.command == "suite":
+        report = run_suite(args.sizes, args.seed, args.ops, args.searches)
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        return 0
+    if args.command == "compare":
+        with open(args.old, encoding="utf-8") as f:
+            old = json.load(f)
+        with open(args.new, encoding="utf-8") as f:
+            new = json.load(f)
+        return 1 if compare_results(old, new, args.threshold) else 0
+    run_all_benchmarks()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
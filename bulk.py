@@ -0,0 +1,250 @@
+# bulk.py
+
+import csv
+import json
+import time
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+from gcpause import gc_paused
+from operations import GENRES, add_books, add_members, books, members
+from store import MAX_COPIES
+
+# Streaming bulk import and export of books and members, as CSV (with a
+# header row) or JSON lines. Files are read and written one row at a
+# time and loaded chunk by chunk through add_books/add_members, so
+# memory stays bounded by the chunk size, however large the file.
+#
+# Each chunk is validated before it is loaded: missing fields, copy
+# counts that are not whole numbers from 0 to MAX_COPIES, genres outside
+# GENRES and keys repeated within the chunk. Keys already in the library (including
+# ones from earlier chunks) are then rejected by add_books/add_members.
+# Rejected rows are counted by reason; with rejects=path they are also
+# written there as JSON lines: {"line": ..., "reason": ..., "row": ...}.
+#
+# Books are loaded with every copy available; an available_copies
+# column, as written by export_books, is ignored. Loans are not part of
+# these files (binary snapshots carry them).
+#
+# The cyclic garbage collector is paused during a load: the millions of
+# new (acyclic) objects would otherwise set off repeated full
+# collections, which cost about a fifth of the load time at 1M rows.
+
+BOOK_COLUMNS = ("isbn", "title", "author", "genre", "total_copies")
+BOOK_EXPORT_COLUMNS = BOOK_COLUMNS + ("available_copies",)
+MEMBER_COLUMNS = ("member_id", "name", "email")
+CHUNK = 10_000
+EXAMPLES = 20  # rejected rows kept in the report
+
+_GENRES = frozenset(GENRES)
+_Row = Tuple[int, Optional[tuple]]  # line number, column values (None: unreadable)
+
+
+def file_format(path: str, format: Optional[str] = None) -> str:
+    """"csv" or "jsonl", from format or else the file extension."""
+    if format is None:
+        format = "csv" if path.lower().endswith(".csv") else "jsonl"
+    if format not in ("csv", "jsonl"):
+        raise ValueError(f"unknown bulk file format {format!r} (expected 'csv' or 'jsonl')")
+    return format
+
+
+def read_rows(path: str, columns: Sequence[str], format: Optional[str] = None) -> Iterator[_Row]:
+    """Yield (line number, values of `columns`) for every row of a file.
+
+    Missing values are None; a line that is not a JSON object gives
+    values None. A CSV file whose header lacks a column is an error.
+    """
+    if file_format(path, format) == "csv":
+        with open(path, newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            header = [name.strip() for name in next(reader, [])]
+            missing = [c for c in columns if c not in header]
+            if missing:
+                raise ValueError(f"{path}: missing column(s) {', '.join(missing)}")
+            positions = [header.index(c) for c in columns]
+            width = max(positions) + 1
+            for row in reader:
+                if not row:
+                    continue
+                if len(row) < width:
+                    row = row + [None] * (width - len(row))
+                yield reader.line_num, tuple(row[i] for i in positions)
+        return
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                obj = json.loads(line)
+            except ValueError:
+                obj = None
+            if not isinstance(obj, dict):
+                yield line_no, None
+                continue
+            yield line_no, tuple(obj.get(c) for c in columns)
+
+
+class _Report:
+    # running totals of a load, returned as a dict by result()
+
+    def __init__(self, columns: Sequence[str], rejects: Optional[str]):
+        self.columns = columns
+        self.loaded = 0
+        self.reasons: Dict[str, int] = {}
+        self.examples: List[Dict] = []
+        self._rejects: Optional[TextIO] = open(rejects, "w", encoding="utf-8") if rejects else None
+        self._start = time.perf_counter()
+
+    def reject(self, line_no: int, values: Optional[tuple], reason: str) -> None:
+        self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        entry = {"line": line_no, "reason": reason,
+                 "row": None if values is None else dict(zip(self.columns, values))}
+        if len(self.examples) < EXAMPLES:
+            self.examples.append(entry)
+        if self._rejects is not None:
+            self._rejects.write(json.dumps(entry) + "\n")
+
+    def close(self) -> None:
+        if self._rejects is not None:
+            self._rejects.close()
+
+    def result(self) -> Dict:
+        return {"loaded": self.loaded, "rejected": sum(self.reasons.values()),
+                "reasons": dict(self.reasons), "examples": self.examples,
+                "seconds": time.perf_counter() - self._start}
+
+
+def _chunks(rows: Iterator[_Row], size: int) -> Iterator[List[_Row]]:
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _text(value) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+@gc_paused()
+def load_books(path: str, format: Optional[str] = None, rejects: Optional[str] = None,
+               chunk_size: int = CHUNK) -> Dict:
+    """Add every valid book row of a file; returns counts of loaded and rejected rows.
+
+    Columns: isbn, title, author, genre, total_copies. The result also
+    has the rejections by reason, the first few rejected rows and the
+    seconds taken.
+    """
+    report = _Report(BOOK_COLUMNS, rejects)
+    try:
+        for chunk in _chunks(read_rows(path, BOOK_COLUMNS, format), chunk_size):
+            valid, lines = [], []
+            seen = set()
+            for line_no, values in chunk:
+                if values is None:
+                    report.reject(line_no, None, "malformed_row")
+                    continue
+                isbn, title, author, genre, copies = fields = tuple(map(_text, values))
+                if None in fields:
+                    report.reject(line_no, values, "missing_field")
+                    continue
+                try:
+                    copies = int(copies)
+                except ValueError:
+                    copies = -1
+                if not 0 <= copies <= MAX_COPIES:
+                    report.reject(line_no, values, "invalid_copies")
+                elif isbn in seen:
+                    report.reject(line_no, values, "duplicate_isbn")
+                else:
+                    seen.add(isbn)
+                    valid.append((isbn, title, author, genre, copies))
+                    lines.append((line_no, values))
+            # genres checked for the whole chunk at once
+            genre_ok = [row[3] in _GENRES for row in valid]
+            if not all(genre_ok):
+                for ok, (line_no, values) in zip(genre_ok, lines):
+                    if not ok:
+                        report.reject(line_no, values, "invalid_genre")
+                valid = [row for row, ok in zip(valid, genre_ok) if ok]
+                lines = [line for line, ok in zip(lines, genre_ok) if ok]
+            for ok, (line_no, values) in zip(add_books(valid), lines):
+                if ok:
+                    report.loaded += 1
+                else:
+                    report.reject(line_no, values, "duplicate_isbn")  # already in the library
+    finally:
+        report.close()
+    return report.result()
+
+
+@gc_paused()
+def load_members(path: str, format: Optional[str] = None, rejects: Optional[str] = None,
+                 chunk_size: int = CHUNK) -> Dict:
+    """Add every valid member row of a file (member_id, name, email); see load_books."""
+    report = _Report(MEMBER_COLUMNS, rejects)
+    try:
+        for chunk in _chunks(read_rows(path, MEMBER_COLUMNS, format), chunk_size):
+            valid, lines = [], []
+            seen = set()
+            for line_no, values in chunk:
+                if values is None:
+                    report.reject(line_no, None, "malformed_row")
+                    continue
+                fields = tuple(map(_text, values))
+                if None in fields:
+                    report.reject(line_no, values, "missing_field")
+                elif fields[0] in seen:
+                    report.reject(line_no, values, "duplicate_member")
+                else:
+                    seen.add(fields[0])
+                    valid.append(fields)
+                    lines.append((line_no, values))
+            for ok, (line_no, values) in zip(add_members(valid), lines):
+                if ok:
+                    report.loaded += 1
+                else:
+                    report.reject(line_no, values, "duplicate_member")
+    finally:
+        report.close()
+    return report.result()
+
+
+def write_rows(path: str, format: Optional[str], columns: Sequence[str],
+               rows: Iterator[tuple]) -> int:
+    """Write rows of `columns` values as CSV or JSON lines; returns the row count."""
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        if file_format(path, format) == "csv":
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+        else:
+            for row in rows:
+                f.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n")
+                count += 1
+    return count
+
+
+def export_books(path: str, format: Optional[str] = None) -> int:
+    """Write every book to a file that load_books reads back; returns the row count."""
+    def rows() -> Iterator[tuple]:
+        for isbn in books:  # iterates a snapshot of the ISBNs
+            try:
+                record = books.record(isbn)
+            except KeyError:
+                continue  # deleted meanwhile
+            yield (isbn,) + tuple(record[c] for c in BOOK_EXPORT_COLUMNS[1:])
+    return write_rows(path, format, BOOK_EXPORT_COLUMNS, rows())
+
+
+def export_members(path: str, format: Optional[str] = None) -> int:
+    """Write every member (without loans) to a file that load_members reads back."""
+    rows = ((m["member_id"], m["name"], m["email"]) for m in members)
+    return write_rows(path, format, MEMBER_COLUMNS, rows)
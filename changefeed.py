@@ -0,0 +1,183 @@
+# changefeed.py
+
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+
+class ChangeFeedGap(LookupError):
+    """The events after `after` were overwritten; the oldest one kept is `oldest`."""
+
+    def __init__(self, after: int, oldest: int):
+        super().__init__(f"change feed events after {after} are gone (oldest kept: {oldest}); "
+                         f"resynchronize and continue from a newer position")
+        self.after = after
+        self.oldest = oldest
+
+
+class ChangeFeed:
+    """In-memory ring buffer of the last `capacity` changes, with sequence numbers.
+
+    Events look like write-ahead log records, {"seq": n, "time": t,
+    "op": name, "args": [...], "kwargs": {...}}, where seq goes up by
+    one per event. Readers ask for the events after an offset (the
+    last seq they have seen), in batches.
+
+    When the buffer is full, each new event overwrites the oldest one.
+    A subscription that still needs that oldest event holds the
+    publisher back (backpressure), for up to `max_wait` seconds in total
+    per publish() or publish_many() call, however many events it has.
+    Publishers hold the library's lock stripes, so this bounds how long
+    a slow subscriber can stall other operations. After that the events
+    are overwritten anyway, and the subscription's next poll raises
+    ChangeFeedGap. Plain read() calls never hold publishers back.
+    """
+
+    def __init__(self, capacity: int = 65_536, max_wait: float = 1.0):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        # signalled when events are published, consumed or a subscription closes
+        self._changed = threading.Condition(self._lock)
+        self._ring: List[Optional[Tuple]] = [None] * capacity
+        self._seq = 0  # last published
+        self._subscriptions: Set["Subscription"] = set()
+        self.overruns = 0  # subscriptions that lost events
+
+    @property
+    def last_seq(self) -> int:
+        return self._seq
+
+    @property
+    def oldest_seq(self) -> int:
+        """Sequence number of the oldest event still kept (last_seq + 1 when empty)."""
+        return max(1, self._seq - self.capacity + 1)
+
+    def publish(self, op: str, args: Tuple, kwargs: Optional[Dict] = None) -> int:
+        """Add one event and return its sequence number."""
+        with self._lock:
+            if self._subscriptions:
+                if self._seq >= self.capacity:
+                    self._wait_for_room(time.monotonic() + self.max_wait)
+                self._changed.notify_all()
+            seq = self._seq = self._seq + 1
+            self._ring[seq % self.capacity] = (time.time(), op, args, kwargs)
+            return seq
+
+    def publish_many(self, records: List[Tuple[str, Tuple, Optional[Dict]]]) -> int:
+        """Add several events in order; returns the last sequence number."""
+        with self._lock:
+            now = time.time()
+            deadline = time.monotonic() + self.max_wait  # for the whole batch
+            for op, args, kwargs in records:
+                if self._subscriptions and self._seq >= self.capacity:
+                    self._wait_for_room(deadline)
+                self._seq += 1
+                self._ring[self._seq % self.capacity] = (now, op, args, kwargs)
+            if self._subscriptions:
+                self._changed.notify_all()
+            return self._seq
+
+    def read(self, after: int, limit: int = 1000) -> List[Dict]:
+        """Up to limit events with seq > after, oldest first."""
+        with self._lock:
+            return self._read(after, limit)
+
+    def ops_since(self, after: int) -> List[Tuple[str, Tuple]]:
+        """(op, args) of every event with seq > after; raises ChangeFeedGap if some are gone."""
+        with self._lock:
+            if after < self.oldest_seq - 1:
+                raise ChangeFeedGap(after, self.oldest_seq)
+            return [self._ring[seq % self.capacity][1:3] for seq in range(after + 1, self._seq + 1)]
+
+    def subscribe(self, after: Optional[int] = None, batch_size: int = 100) -> "Subscription":
+        """Tail the feed from after (None: from the next event)."""
+        with self._lock:
+            subscription = Subscription(self, self._seq if after is None else after, batch_size)
+            self._subscriptions.add(subscription)
+            return subscription
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"last_seq": self._seq, "oldest_seq": self.oldest_seq,
+                    "capacity": self.capacity, "subscriptions": len(self._subscriptions),
+                    "overruns": self.overruns}
+
+    def _wait_for_room(self, deadline: float) -> None:
+        # the next event overwrites seq `doomed`; subscriptions that have
+        # read everything before it but not it yet get until deadline
+        # (monotonic) to catch up
+        while True:
+            doomed = self._seq + 1 - self.capacity  # other publishers may have moved on
+            behind = [s for s in self._subscriptions if s.position == doomed - 1]
+            if not behind:
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.overruns += len(behind)
+                return
+            self._changed.notify_all()
+            self._changed.wait(remaining)
+
+    def _read(self, after: int, limit: int) -> List[Dict]:
+        if limit <= 0:
+            raise ValueError("limit must be positive")
+        if after < self.oldest_seq - 1:
+            raise ChangeFeedGap(after, self.oldest_seq)
+        events = []
+        for seq in range(after + 1, min(self._seq, after + limit) + 1):
+            at, op, args, kwargs = self._ring[seq % self.capacity]
+            events.append({"seq": seq, "time": at, "op": op, "args": list(args),
+                           "kwargs": dict(kwargs) if kwargs else {}})
+        return events
+
+
+class Subscription:
+    """A reader of a ChangeFeed that remembers its position (the last seq it got)."""
+
+    def __init__(self, feed: ChangeFeed, after: int, batch_size: int):
+        if batch_size <= 0:
+            raise ValueError("batch_size must be positive")
+        self.feed = feed
+        self.position = after
+        self.batch_size = batch_size
+        self.closed = False
+
+    def poll(self, timeout: Optional[float] = None) -> List[Dict]:
+        """The next batch of up to batch_size events.
+
+        Waits up to timeout seconds (None: until there is one) for an
+        event; returns [] on timeout or once closed. Raises ChangeFeedGap
+        if events were lost; seek() past them to go on.
+        """
+        changed = self.feed._changed
+        with changed:
+            if not changed.wait_for(lambda: self.closed or self.feed._seq > self.position, timeout):
+                return []
+            if self.closed:
+                return []
+            events = self.feed._read(self.position, self.batch_size)
+            self.position = events[-1]["seq"]
+            changed.notify_all()  # publishers may be waiting for room
+            return events
+
+    def seek(self, after: int) -> None:
+        """Continue with the events after seq `after`."""
+        with self.feed._changed:
+            self.position = after
+            self.feed._changed.notify_all()
+
+    def close(self) -> None:
+        with self.feed._changed:
+            self.closed = True
+            self.feed._subscriptions.discard(self)
+            self.feed._changed.notify_all()
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
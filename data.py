@@ -1,5 +1,9 @@
-# books: dict keyed by ISBN
-books = {
+import os
+
+from store import BookStore, MemberStore
+
+# sample books, keyed by ISBN
+SAMPLE_BOOKS = {
     "978-0545010221": {
         "title": "The Hitchhiker's Guide to the Galaxy",
         "author": "Douglas Adams",
@@ -37,8 +41,8 @@ books = {
     },
 }
 
-# members: list of dicts
-members = [
+# sample members
+SAMPLE_MEMBERS = [
     {"member_id": "M001", "name": "Kadio Kele", "email": "kele@example.com", "borrowed_books": []},
     {"member_id": "M002", "name": "Mama Kele", "email": "mama@example.com", "borrowed_books": []},
     {"member_id": "M003", "name": "Papa Kele", "email": "papa@example.com", "borrowed_books": []},
@@ -46,5 +50,26 @@ members = [
     {"member_id": "M005", "name": "Daughter Kele", "email": "daughter@example.com", "borrowed_books": []},
 ]
 
+# storage backend, chosen at startup:
+#   LIBRARY_BACKEND=memory (default) - column store in this process
+#   LIBRARY_BACKEND=sqlite           - SQLite file at LIBRARY_DB (default library.db)
+# Either way books[isbn] and the member records behave like dicts.
+BACKEND = os.environ.get("LIBRARY_BACKEND", "memory")
+
+if BACKEND == "memory":
+    # books: column store keyed by ISBN; members: ordered store indexed by member_id
+    books = BookStore(SAMPLE_BOOKS)
+    members = MemberStore(SAMPLE_MEMBERS)
+elif BACKEND == "sqlite":
+    from sqlite_store import open_database
+    books, members = open_database(os.environ.get("LIBRARY_DB", "library.db"))
+    if not len(books) and not len(members):  # new database: add the sample data
+        for _isbn, _record in SAMPLE_BOOKS.items():
+            books[_isbn] = _record
+        for _record in SAMPLE_MEMBERS:
+            members.append(_record)
+else:
+    raise ValueError(f"unknown LIBRARY_BACKEND {BACKEND!r} (expected 'memory' or 'sqlite')")
+
 # genres: tuple (immutable, fixed set)
 GENRES = ("Fiction", "Non-Fiction", "Sci-Fi", "Biography", "Mystery", "History", "Historical Fiction")
@@ -0,0 +1,108 @@
+# facets.py
+
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# (genre, total_copies, available_copies) of one book
+FacetValues = Tuple[str, int, int]
+
+
+class FacetIndex:
+    """Books grouped by genre and availability, with running copy totals.
+
+    A book is "available" while at least one copy is in. Each
+    (genre, available) pair keeps the set of its ISBNs, and each genre
+    its total and available copies, so every count is a lookup over the
+    handful of genres rather than a scan of the books. The book store
+    keeps the index in step with its records (see BookStore.facets).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._groups: Dict[Tuple[str, bool], Set[str]] = {}
+            self._copies: Dict[str, List[int]] = {}  # genre -> [total, available]
+
+    def add(self, isbn: str, values: FacetValues) -> None:
+        with self._lock:
+            self._add(isbn, values)
+
+    def remove(self, isbn: str, values: FacetValues) -> None:
+        with self._lock:
+            self._remove(isbn, values)
+
+    def update(self, isbn: str, old: FacetValues, new: FacetValues) -> None:
+        with self._lock:
+            genre, total, available = new
+            if old[0] == genre and (old[2] > 0) == (available > 0):
+                copies = self._copies[genre]  # same group: only the totals move
+                copies[0] += total - old[1]
+                copies[1] += available - old[2]
+            else:
+                self._remove(isbn, old)
+                self._add(isbn, new)
+
+    def available_changed(self, isbn: str, genre: str, old: int, new: int) -> None:
+        """Fast path of update() for a change of available copies only."""
+        with self._lock:
+            self._copies[genre][1] += new - old
+            if (old > 0) != (new > 0):
+                self._groups[(genre, old > 0)].discard(isbn)
+                if not self._groups[(genre, old > 0)]:
+                    del self._groups[(genre, old > 0)]
+                self._groups.setdefault((genre, new > 0), set()).add(isbn)
+
+    def count(self, genre: Optional[str] = None, available: Optional[bool] = None) -> int:
+        """Number of books in genre (None: any) that are/are not available (None: either)."""
+        with self._lock:
+            return sum(len(isbns) for isbns in self._matching(genre, available))
+
+    def isbns(self, genre: Optional[str] = None, available: Optional[bool] = None) -> Set[str]:
+        with self._lock:
+            return set().union(*self._matching(genre, available))
+
+    def filter(self, isbns: Iterable[str], genre: Optional[str] = None,
+               available: Optional[bool] = None) -> List[str]:
+        """The ISBNs among isbns that are in the selected groups, in the same order."""
+        with self._lock:
+            groups = self._matching(genre, available)
+            if len(groups) == 1:
+                group = groups[0]
+                return [isbn for isbn in isbns if isbn in group]
+            return [isbn for isbn in isbns if any(isbn in group for group in groups)]
+
+    def totals(self) -> Dict[str, Dict[str, int]]:
+        """genre -> books, available_books, total_copies, available_copies."""
+        with self._lock:
+            return {genre: {"books": len(self._groups.get((genre, True), ()))
+                                     + len(self._groups.get((genre, False), ())),
+                            "available_books": len(self._groups.get((genre, True), ())),
+                            "total_copies": total, "available_copies": available}
+                    for genre, (total, available) in self._copies.items()}
+
+    def _matching(self, genre: Optional[str], available: Optional[bool]) -> List[Set[str]]:
+        return [isbns for (g, a), isbns in self._groups.items()
+                if (genre is None or g == genre) and (available is None or a == available)]
+
+    def _add(self, isbn: str, values: FacetValues) -> None:
+        genre, total, available = values
+        self._groups.setdefault((genre, available > 0), set()).add(isbn)
+        copies = self._copies.setdefault(genre, [0, 0])
+        copies[0] += total
+        copies[1] += available
+
+    def _remove(self, isbn: str, values: FacetValues) -> None:
+        genre, total, available = values
+        key = (genre, available > 0)
+        group = self._groups[key]
+        group.discard(isbn)
+        if not group:
+            del self._groups[key]
+        copies = self._copies[genre]
+        copies[0] -= total
+        copies[1] -= available
+        if key not in self._groups and (genre, not key[1]) not in self._groups:
+            del self._copies[genre]
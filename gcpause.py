@@ -0,0 +1,21 @@
+# gcpause.py
+
+import gc
+from contextlib import contextmanager
+from typing import Iterator
+
+
+@contextmanager
+def gc_paused() -> Iterator[None]:
+    """Turn the cyclic garbage collector off for the block (or decorated call).
+
+    For bulk loads: millions of new, acyclic objects would otherwise set
+    off repeated full collections that find nothing to free.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
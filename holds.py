@@ -0,0 +1,165 @@
+# holds.py
+
+import heapq
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+WAITING, READY = "waiting", "ready"
+
+
+class HoldQueues:
+    """Members waiting for books, in the order they asked.
+
+    Each ISBN has a FIFO of the members waiting for it (an OrderedDict,
+    so both taking the next member and cancelling anywhere in the queue
+    are O(1)). When a copy comes back, allocate() moves the next member
+    to "ready": the copy stays on the shelf, set aside for them (the
+    caller takes it out of available_copies) until their pickup
+    deadline. Deadlines go on a min-heap, so finding the holds that have
+    run out never scans the others.
+
+    A returned copy goes to a member whose lock stripe the returning
+    call does not hold, so unlike LoanLedger this has a lock of its own.
+    It is owned by the member store.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+
+    def _reset(self) -> None:
+        self._waiting: Dict[str, "OrderedDict[str, None]"] = {}  # isbn -> member_ids
+        self._ready: Dict[str, Dict[str, float]] = {}  # isbn -> {member_id: pickup deadline}
+        self._by_member: Dict[str, Dict[str, str]] = {}  # member_id -> {isbn: WAITING/READY}
+        self._deadlines: List[Tuple[float, str, str]] = []  # heap of (deadline, isbn, member_id)
+
+    def place(self, member_id: str, isbn: str) -> None:
+        """Add member to the end of isbn's queue."""
+        with self._lock:
+            self._place(member_id, isbn)
+
+    def cancel(self, member_id: str, isbn: str) -> Optional[str]:
+        """Drop a hold; returns the state it was in (None: there was none)."""
+        with self._lock:
+            return self._cancel(member_id, isbn)
+
+    def allocate(self, isbn: str, deadline: float) -> Optional[str]:
+        """Set a copy aside for the next member waiting; returns who (None: nobody)."""
+        with self._lock:
+            return self._allocate(isbn, deadline)
+
+    def _place(self, member_id: str, isbn: str) -> None:
+        self._waiting.setdefault(isbn, OrderedDict())[member_id] = None
+        self._by_member.setdefault(member_id, {})[isbn] = WAITING
+
+    def _cancel(self, member_id: str, isbn: str) -> Optional[str]:
+        state = self.status(member_id, isbn)
+        if state == WAITING:
+            queue = self._waiting[isbn]
+            del queue[member_id]
+            if not queue:
+                del self._waiting[isbn]
+        elif state == READY:
+            ready = self._ready[isbn]
+            del ready[member_id]  # its heap entry is skipped when it comes up
+            if not ready:
+                del self._ready[isbn]
+        else:
+            return None
+        holds = self._by_member[member_id]
+        del holds[isbn]
+        if not holds:
+            del self._by_member[member_id]
+        return state
+
+    def _allocate(self, isbn: str, deadline: float) -> Optional[str]:
+        queue = self._waiting.get(isbn)
+        if not queue:
+            return None
+        member_id, _ = queue.popitem(last=False)
+        if not queue:
+            del self._waiting[isbn]
+        self._ready.setdefault(isbn, {})[member_id] = deadline
+        self._by_member[member_id][isbn] = READY
+        heapq.heappush(self._deadlines, (deadline, isbn, member_id))
+        return member_id
+
+    def status(self, member_id: str, isbn: str) -> Optional[str]:
+        return self._by_member.get(member_id, {}).get(isbn)
+
+    def hold_count(self, member_id: str) -> int:
+        """Holds of a member, waiting or ready."""
+        return len(self._by_member.get(member_id, ()))
+
+    def holds_of(self, member_id: str) -> Dict[str, str]:
+        """isbn -> WAITING or READY for one member."""
+        with self._lock:
+            return dict(self._by_member.get(member_id, {}))
+
+    def queue(self, isbn: str) -> List[str]:
+        """Members waiting for isbn, next first."""
+        with self._lock:
+            return list(self._waiting.get(isbn, ()))
+
+    def waiting_count(self, isbn: str) -> int:
+        return len(self._waiting.get(isbn, ()))
+
+    def ready_count(self, isbn: str) -> int:
+        """Copies of isbn set aside for members."""
+        return len(self._ready.get(isbn, ()))
+
+    def ready_counts(self) -> Dict[str, int]:
+        """isbn -> copies set aside, for every ISBN with a ready hold."""
+        with self._lock:
+            return {isbn: len(ready) for isbn, ready in self._ready.items()}
+
+    def ready_for(self, isbn: str) -> Dict[str, float]:
+        """member_id -> pickup deadline of the copies set aside."""
+        with self._lock:
+            return dict(self._ready.get(isbn, {}))
+
+    def deadline(self, member_id: str, isbn: str) -> Optional[float]:
+        """Pickup deadline of a ready hold (None: no ready hold)."""
+        return self._ready.get(isbn, {}).get(member_id)
+
+    def next_deadline(self) -> Optional[float]:
+        """Earliest pickup deadline (possibly of a hold already gone)."""
+        return self._deadlines[0][0] if self._deadlines else None
+
+    def expired(self, now: float) -> List[Tuple[str, str]]:
+        """(member_id, isbn) of the ready holds whose deadline is before now.
+
+        Their heap entries are taken off; the caller is expected to
+        cancel the holds (a hold collected meanwhile is simply skipped).
+        """
+        due = []
+        with self._lock:
+            while self._deadlines and self._deadlines[0][0] <= now:
+                deadline, isbn, member_id = heapq.heappop(self._deadlines)
+                if self._ready.get(isbn, {}).get(member_id) == deadline:
+                    due.append((member_id, isbn))
+        return due
+
+    def dump(self) -> List[list]:
+        """[isbn, member_id, deadline or None] for every hold, in queue order."""
+        with self._lock:
+            rows = [[isbn, member_id, deadline] for isbn, ready in self._ready.items()
+                    for member_id, deadline in ready.items()]
+            rows += [[isbn, member_id, None] for isbn, queue in self._waiting.items()
+                     for member_id in queue]
+        return rows
+
+    def load(self, rows: List[list]) -> None:
+        """Restore holds from dump() rows."""
+        with self._lock:
+            for isbn, member_id, deadline in rows:
+                self._place(member_id, isbn)
+                if deadline is not None:
+                    # a ready hold: it was at the front of the queue
+                    self._waiting[isbn].move_to_end(member_id, last=False)
+                    self._allocate(isbn, deadline)
@@ -0,0 +1,125 @@
+# loadgen.py
+
+import asyncio
+import json
+import random
+import sys
+import time
+from typing import Dict, List, Tuple
+
+# Load generator for server.py: many concurrent clients, each sending its
+# requests `pipeline` at a time over one connection, against books and
+# members created by seed(). Usage: python loadgen.py [port] [clients]
+
+MAX_REPLY = 1 << 22  # search results can make long response lines
+
+
+async def _call_many(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                     requests: List[Tuple[str, list]]) -> List[Dict]:
+    writer.write(b"".join(json.dumps({"id": i, "op": op, "args": args}).encode() + b"\n"
+                          for i, (op, args) in enumerate(requests)))
+    await writer.drain()
+    return [json.loads(await reader.readline()) for _ in requests]
+
+
+async def seed(host: str, port: int, n_books: int, n_members: int) -> None:
+    """Create the books and members the load clients work on."""
+    reader, writer = await asyncio.open_connection(host, port)
+    requests = [("add_book", [f"978-{i:010d}", f"Load Test Volume {i}", f"Author {i % 97}",
+                              "Fiction", 1000]) for i in range(n_books)]
+    requests += [("add_member", [f"L{i:06d}", f"Load Member {i}", f"l{i}@example.com"])
+                 for i in range(n_members)]
+    await _call_many(reader, writer, requests)
+    writer.close()
+    await writer.wait_closed()
+
+
+def _workload(rng: random.Random, count: int, n_books: int, n_members: int) -> List[Tuple[str, list]]:
+    # mostly circulation, some searches and lookups; every borrow is
+    # followed by its return so the catalogue stays in a steady state
+    requests: List[Tuple[str, list]] = []
+    while len(requests) < count:
+        roll = rng.random()
+        if roll < 0.5:
+            pair = [f"L{rng.randrange(n_members):06d}", f"978-{rng.randrange(n_books):010d}"]
+            requests += [("borrow_book", pair), ("return_book", pair)]
+        elif roll < 0.8:
+            requests.append(("find_member", [f"L{rng.randrange(n_members):06d}"]))
+        else:
+            requests.append(("search_books", [f"volume {rng.randrange(n_books)}"]))
+    return requests[:count]
+
+
+class _Barrier:
+    """Holds every client until all of them are connected."""
+
+    def __init__(self, parties: int):
+        self.waiting = parties
+        self.connected = asyncio.Event()
+        self.go = asyncio.Event()
+
+    async def arrive(self) -> None:
+        self.waiting -= 1
+        if not self.waiting:
+            self.connected.set()
+        await self.go.wait()
+
+
+async def _client(host: str, port: int, requests: List[Tuple[str, list]], pipeline: int,
+                  barrier: _Barrier, latencies: List[float]) -> int:
+    reader, writer = await asyncio.open_connection(host, port, limit=MAX_REPLY)
+    await barrier.arrive()
+    errors = 0
+    for i in range(0, len(requests), pipeline):
+        window = requests[i:i + pipeline]
+        sent = time.perf_counter()
+        responses = await _call_many(reader, writer, window)
+        latencies.extend([time.perf_counter() - sent] * len(window))
+        errors += sum("error" in r for r in responses)
+    writer.close()
+    await writer.wait_closed()
+    return errors
+
+
+async def run_load(host: str = "127.0.0.1", port: int = 7878, clients: int = 1000,
+                   requests: int = 50, pipeline: int = 1, n_books: int = 1000,
+                   n_members: int = 1000, seed_data: bool = True) -> Dict:
+    """Run `clients` concurrent connections with `requests` requests each.
+
+    The clock starts once every client is connected. A request's latency
+    runs from sending its pipelined window to reading the last reply of
+    that window. Returns requests/s and p50/p99 latency in milliseconds.
+    """
+    if seed_data:
+        await seed(host, port, n_books, n_members)
+    rng = random.Random(1)
+    workloads = [_workload(rng, requests, n_books, n_members) for _ in range(clients)]
+    latencies: List[float] = []
+    barrier = _Barrier(clients)
+    tasks = [asyncio.create_task(_client(host, port, w, pipeline, barrier, latencies))
+             for w in workloads]
+    await barrier.connected.wait()
+    began = time.perf_counter()
+    barrier.go.set()
+    errors = sum(await asyncio.gather(*tasks))
+    elapsed = time.perf_counter() - began
+    latencies.sort()
+    return {
+        "clients": clients,
+        "pipeline": pipeline,
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": elapsed,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1e3,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1e3,
+    }
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 7878
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    report = asyncio.run(run_load(port=port, clients=clients))
+    print(f"{report['clients']} clients: {report['rps']:,.0f} req/s   "
+          f"p50 {report['p50_ms']:.1f} ms   p99 {report['p99_ms']:.1f} ms   "
+          f"errors {report['errors']}")
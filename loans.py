@@ -0,0 +1,317 @@
+# loans.py
+
+import itertools
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Tuple
+
+DAY = 86_400  # seconds; the due date index has one bucket per day
+
+
+class Loan(NamedTuple):
+    loan_id: int
+    member_id: str
+    isbn: str
+    checkout: Optional[float]  # None for loans made before due dates were kept
+    due: float
+    renewals: int = 0
+
+
+class DueIndex:
+    """Loans with a due date, in one bucket per day.
+
+    The days that have loans are kept in a sorted list, so the loans
+    overdue at some time are in the buckets of the days up to it (only
+    the last of which needs filtering): O(k log k) for k overdue loans,
+    with no scan of the others. Adding, ending or renewing a loan is a
+    dict operation in its day's bucket, plus a bisect when a day gets
+    its first loan or loses its last.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._reset()
+
+    def _reset(self) -> None:
+        self._loans: Dict[int, Loan] = {}
+        self._buckets: Dict[int, Dict[int, Loan]] = {}  # day -> loan_id -> loan
+        self._days: List[int] = []  # sorted days of _buckets
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+
+    def __len__(self) -> int:
+        return len(self._loans)
+
+    def get(self, loan_id: int) -> Optional[Loan]:
+        return self._loans.get(loan_id)
+
+    def add(self, member_id: str, isbn: str, checkout: Optional[float], due: float,
+            renewals: int = 0) -> Loan:
+        loan = Loan(next(self._ids), member_id, isbn, checkout, due, renewals)
+        with self._lock:
+            self._insert(loan)
+        return loan
+
+    def remove(self, loan_id: int) -> Optional[Loan]:
+        with self._lock:
+            loan = self._loans.pop(loan_id, None)
+            if loan is not None:
+                self._unbucket(loan)
+        return loan
+
+    def renew(self, loan_id: int, due: float) -> Loan:
+        """Move a loan to a new due date, counting one more renewal."""
+        with self._lock:
+            loan = self._loans.pop(loan_id)
+            self._unbucket(loan)
+            loan = loan._replace(due=due, renewals=loan.renewals + 1)
+            self._insert(loan)
+            return loan
+
+    def overdue(self, now: float, limit: Optional[int] = None) -> List[Loan]:
+        """Loans due before now, the longest overdue first (at most limit)."""
+        result: List[Loan] = []
+        for batch in self._overdue_days(now):
+            result += batch
+            if limit is not None and len(result) >= limit:
+                return result[:limit]
+        return result
+
+    def iter_overdue(self, now: float) -> Iterator[Loan]:
+        """overdue(), one day's loans at a time; the index is not held in between."""
+        for batch in self._overdue_days(now):
+            yield from batch
+
+    def _overdue_days(self, now: float) -> Iterator[List[Loan]]:
+        today = int(now // DAY)
+        day = None
+        while True:
+            with self._lock:
+                i = 0 if day is None else bisect_right(self._days, day)
+                if i == len(self._days) or self._days[i] > today:
+                    return
+                day = self._days[i]
+                batch = [loan for loan in self._buckets[day].values() if loan.due < now]
+            batch.sort(key=lambda loan: (loan.due, loan.loan_id))
+            yield batch
+
+    def _insert(self, loan: Loan) -> None:
+        self._loans[loan.loan_id] = loan
+        day = int(loan.due // DAY)
+        bucket = self._buckets.get(day)
+        if bucket is None:
+            bucket = self._buckets[day] = {}
+            insort(self._days, day)
+        bucket[loan.loan_id] = loan
+
+    def _unbucket(self, loan: Loan) -> None:
+        day = int(loan.due // DAY)
+        bucket = self._buckets[day]
+        del bucket[loan.loan_id]
+        if not bucket:
+            del self._buckets[day]
+            del self._days[bisect_left(self._days, day)]
+
+
+class LoanLedger:
+    """Which member holds which book, indexed both ways.
+
+    member_id -> {isbn: copies} and isbn -> {member_id: copies}, plus a
+    running total for each side, so "how many loans does this member
+    have", "how many copies of this book are out", "does this member
+    hold this book" and "who has this book" never scan the members.
+
+    Loans are made and ended through add() and remove(), which also keep
+    the member's borrowed_books list in step. Loans made with a due date
+    are also in a DueIndex; copies tracked from member records (and
+    binary snapshots) have none until they are renewed or given one by
+    load_due(). The ledger has no lock of its own: callers serialize
+    changes per member and per ISBN, as the lock stripes in
+    operations.py do.
+    """
+
+    def __init__(self):
+        self._by_member: Dict[str, Dict[str, int]] = {}
+        self._by_isbn: Dict[str, Dict[str, int]] = {}
+        self._member_total: Dict[str, int] = {}
+        self._isbn_total: Dict[str, int] = {}
+        self._dated: Dict[Tuple[str, str], List[int]] = {}  # (member_id, isbn) -> loan_ids
+        self._due = DueIndex()
+
+    def add(self, member: Mapping, isbn: str, checkout: Optional[float] = None,
+            due: Optional[float] = None) -> None:
+        member["borrowed_books"].append(isbn)
+        self._count(member["member_id"], isbn, 1)
+        if due is not None:
+            self._date(member["member_id"], isbn, checkout, due)
+
+    def remove(self, member: Mapping, isbn: str) -> bool:
+        """End one loan of isbn to member; False if there is none.
+
+        Copies without a due date are ended first, then the one due first.
+        """
+        member_id = member["member_id"]
+        held = self.held(member_id, isbn)
+        if not held:
+            return False
+        member["borrowed_books"].remove(isbn)
+        self._count(member_id, isbn, -1)
+        key = (member_id, isbn)
+        ids = self._dated.get(key)
+        if ids is not None and len(ids) == held:
+            loan_id = ids[0] if held == 1 else self.loan(member_id, isbn).loan_id
+            ids.remove(loan_id)
+            if not ids:
+                del self._dated[key]
+            self._due.remove(loan_id)
+        return True
+
+    def loan(self, member_id: str, isbn: str) -> Optional[Loan]:
+        """The member's loan of isbn that is due first (None: no dated loan)."""
+        loans = [self._due.get(loan_id) for loan_id in self._dated.get((member_id, isbn), ())]
+        return min(loans, key=lambda loan: (loan.due, loan.loan_id), default=None)
+
+    def renew(self, member_id: str, isbn: str, due: float) -> Optional[Loan]:
+        """Give the member's copy of isbn due first a new due date (None: not on loan).
+
+        Without a dated copy, an undated one gets its first due date.
+        """
+        if not self.held(member_id, isbn):
+            return None
+        loan = self.loan(member_id, isbn)
+        if loan is None:
+            return self._date(member_id, isbn, None, due, renewals=1)
+        return self._due.renew(loan.loan_id, due)
+
+    def dated_loans(self, member_id: str) -> List[Loan]:
+        """The member's loans that have a due date, due first."""
+        return sorted((self._due.get(loan_id) for isbn in self.loans_of(member_id)
+                       for loan_id in self._dated.get((member_id, isbn), ())),
+                      key=lambda loan: (loan.due, loan.loan_id))
+
+    def overdue(self, now: float, limit: Optional[int] = None) -> List[Loan]:
+        return self._due.overdue(now, limit)
+
+    def iter_overdue(self, now: float) -> Iterator[Loan]:
+        return self._due.iter_overdue(now)
+
+    def dump_due(self) -> List[list]:
+        """[member_id, isbn, checkout, due, renewals] for every dated loan."""
+        return [[loan.member_id, loan.isbn, loan.checkout, loan.due, loan.renewals]
+                for ids in list(self._dated.values()) for loan in map(self._due.get, ids)
+                if loan is not None]
+
+    def load_due(self, rows: Iterable[list]) -> None:
+        """Give tracked copies the due dates of dump_due() rows."""
+        for member_id, isbn, checkout, due, renewals in rows:
+            if len(self._dated.get((member_id, isbn), ())) < self.held(member_id, isbn):
+                self._date(member_id, isbn, checkout, due, renewals)
+
+    def loan_count(self, member_id: str) -> int:
+        return self._member_total.get(member_id, 0)
+
+    def copies_out(self, isbn: str) -> int:
+        return self._isbn_total.get(isbn, 0)
+
+    def held(self, member_id: str, isbn: str) -> int:
+        return self._by_member.get(member_id, {}).get(isbn, 0)
+
+    def borrowers(self, isbn: str) -> Dict[str, int]:
+        """member_id -> copies of isbn that member has."""
+        return dict(self._by_isbn.get(isbn, {}))
+
+    def loans_of(self, member_id: str) -> Dict[str, int]:
+        """isbn -> copies the member has."""
+        return dict(self._by_member.get(member_id, {}))
+
+    # ---------- kept in step by the member store ----------
+    def track(self, member_id: str, isbns: Iterable[str]) -> None:
+        for isbn in isbns:
+            self._count(member_id, isbn, 1)
+
+    def untrack(self, member_id: str) -> None:
+        for isbn, copies in self.loans_of(member_id).items():
+            self._count(member_id, isbn, -copies)
+            for loan_id in self._dated.pop((member_id, isbn), ()):
+                self._due.remove(loan_id)
+
+    def clear(self) -> None:
+        self._by_member.clear()
+        self._by_isbn.clear()
+        self._member_total.clear()
+        self._isbn_total.clear()
+        self._dated.clear()
+        self._due.clear()
+
+    def _date(self, member_id: str, isbn: str, checkout: Optional[float], due: float,
+              renewals: int = 0) -> Loan:
+        loan = self._due.add(member_id, isbn, checkout, due, renewals)
+        self._dated.setdefault((member_id, isbn), []).append(loan.loan_id)
+        return loan
+
+    def _count(self, member_id: str, isbn: str, delta: int) -> None:
+        _bump(self._by_member, member_id, isbn, delta)
+        _bump(self._by_isbn, isbn, member_id, delta)
+        total = self._member_total.get(member_id, 0) + delta
+        if total:
+            self._member_total[member_id] = total
+        else:
+            del self._member_total[member_id]
+        total = self._isbn_total.get(isbn, 0) + delta
+        if total:
+            self._isbn_total[isbn] = total
+        else:
+            del self._isbn_total[isbn]
+
+
+def _bump(index: Dict[str, Dict[str, int]], key: str, other: str, delta: int) -> None:
+    # add delta to index[key][other], dropping entries that reach zero
+    entry = index.get(key)
+    if entry is None:
+        index[key] = {other: delta}
+        return
+    copies = entry.get(other, 0) + delta
+    if copies:
+        entry[other] = copies
+    elif len(entry) == 1:
+        del index[key]
+    else:
+        del entry[other]
+
+
+def verify_loans(ledger, books, members, holds) -> List[str]:
+    """Compare a ledger with the members' lists and the books' copy counters.
+
+    Copies set aside for ready holds are off the shelf but not on loan.
+    Returns a description of every mismatch (empty when consistent).
+    The data must not change while this runs.
+    """
+    problems = []
+    on_loan: Counter = Counter()
+    for m in members:
+        member_id = m["member_id"]
+        listed = Counter(m["borrowed_books"])
+        on_loan.update(listed)
+        if dict(listed) != ledger.loans_of(member_id):
+            problems.append(f"member {member_id}: borrowed_books {dict(listed)} "
+                            f"but ledger has {ledger.loans_of(member_id)}")
+        if ledger.loan_count(member_id) != sum(listed.values()):
+            problems.append(f"member {member_id}: ledger count {ledger.loan_count(member_id)} "
+                            f"for {sum(listed.values())} loans")
+    for isbn in books:
+        record = books.record(isbn)
+        out = record["total_copies"] - record["available_copies"] - holds.ready_count(isbn)
+        if ledger.copies_out(isbn) != out:
+            problems.append(f"book {isbn}: {out} copies out by the counters "
+                            f"but {ledger.copies_out(isbn)} in the ledger")
+        if sum(ledger.borrowers(isbn).values()) != ledger.copies_out(isbn):
+            problems.append(f"book {isbn}: borrowers do not add up to copies out")
+        if on_loan.pop(isbn, 0) != out:
+            problems.append(f"book {isbn}: {out} copies out but members list a different number")
+    for isbn in on_loan:
+        problems.append(f"book {isbn}: on loan but not in the catalogue")
+    return problems
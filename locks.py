@@ -0,0 +1,41 @@
+# locks.py
+
+import threading
+from contextlib import ExitStack, contextmanager
+from typing import ContextManager, Hashable, Iterable, Iterator
+
+
+class LockStripes:
+    """A fixed pool of locks shared by hashing keys onto it.
+
+    Two operations only contend when their keys land on the same stripe,
+    so there is no global lock. To stay deadlock-free, callers take
+    member stripes before book stripes, and use locked_all() when they
+    need several keys from one pool.
+    """
+
+    def __init__(self, size: int = 64):
+        self._locks = [threading.Lock() for _ in range(size)]
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    def locked(self, key: Hashable) -> ContextManager:
+        return self._locks[hash(key) % len(self._locks)]
+
+    @contextmanager
+    def locked_all(self, keys: Iterable[Hashable]) -> Iterator[None]:
+        """Hold the stripes of all keys, taken in stripe order."""
+        stripes = sorted({hash(key) % len(self._locks) for key in keys})
+        with ExitStack() as stack:
+            for i in stripes:
+                stack.enter_context(self._locks[i])
+            yield
+
+    @contextmanager
+    def locked_every(self) -> Iterator[None]:
+        """Hold every stripe, which stops all operations using this pool."""
+        with ExitStack() as stack:
+            for lock in self._locks:
+                stack.enter_context(lock)
+            yield
@@ -0,0 +1,262 @@
+# metrics.py
+
+import cProfile
+import functools
+import itertools
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+# Instrumentation for the functions in operations.py.
+#
+# Decorated functions count calls, failures (by reason) and exceptions
+# and record their latency in a histogram. While disabled, which is the
+# default, a decorated call costs one extra function call and a flag
+# test. Set LIBRARY_METRICS=1 to enable at startup, or call enable().
+#
+# Histogram buckets are powers of two in nanoseconds, each split into 4
+# sub-buckets, so bucket bounds are within 25% of the true latency.
+
+SUB_BUCKETS = 4
+_SUB_BITS = 2
+
+_enabled = os.environ.get("LIBRARY_METRICS", "") not in ("", "0")
+_local = threading.local()
+_registry: Dict[str, "OpStats"] = {}
+
+# sampling profiler, see start_profiling()
+_profiler: Optional[cProfile.Profile] = None
+_profile_lock = threading.Lock()  # one profiled call at a time
+_profile_every = 0
+_trace_memory = False
+_call_counter = itertools.count()
+
+
+def _bucket(ns: int) -> int:
+    bits = ns.bit_length()
+    if bits <= _SUB_BITS + 1:
+        return ns
+    return ((bits - _SUB_BITS) << _SUB_BITS) + ((ns >> (bits - _SUB_BITS - 1)) & (SUB_BUCKETS - 1))
+
+
+def _bucket_upper(bucket: int) -> int:
+    """Largest latency (ns) that falls into bucket."""
+    if bucket < SUB_BUCKETS * 2:
+        return bucket
+    bits = (bucket >> _SUB_BITS) + _SUB_BITS
+    sub = bucket & (SUB_BUCKETS - 1)
+    return ((SUB_BUCKETS + sub + 1) << (bits - _SUB_BITS - 1)) - 1
+
+
+class OpStats:
+    """Counters and latency histogram of one operation."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls = 0
+            self.failures = 0
+            self.errors = 0
+            self.reasons: Dict[str, int] = {}
+            self.histogram: Dict[int, int] = {}
+            self.total_ns = 0
+            self.max_ns = 0
+            self.sampled = 0
+            self.sampled_bytes = 0
+
+    def record(self, elapsed_ns: int, reasons: List[str], error: bool = False) -> None:
+        bucket = _bucket(elapsed_ns)
+        with self._lock:
+            self.calls += 1
+            self.total_ns += elapsed_ns
+            if elapsed_ns > self.max_ns:
+                self.max_ns = elapsed_ns
+            self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+            if error:
+                self.errors += 1
+            for reason in reasons:
+                self.failures += 1
+                self.reasons[reason] = self.reasons.get(reason, 0) + 1
+
+    def percentile(self, fraction: float) -> int:
+        """Upper bound (ns) of the latency below which `fraction` of calls fall."""
+        with self._lock:
+            items = sorted(self.histogram.items())
+            rank = fraction * self.calls
+        seen = 0
+        for bucket, count in items:
+            seen += count
+            if seen >= rank:
+                return _bucket_upper(bucket)
+        return 0
+
+    def snapshot(self) -> Dict:
+        p50, p90, p99 = (self.percentile(f) / 1e3 for f in (0.5, 0.9, 0.99))
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "failures": self.failures,
+                "errors": self.errors,
+                "failure_reasons": dict(self.reasons),
+                "latency_us": {
+                    "mean": self.total_ns / self.calls / 1e3 if self.calls else 0.0,
+                    "p50": p50, "p90": p90, "p99": p99,
+                    "max": self.max_ns / 1e3,
+                },
+                # upper bound in microseconds -> calls
+                "histogram_us": {f"{_bucket_upper(b) / 1e3:g}": n for b, n in sorted(self.histogram.items())},
+                "sampled_calls": self.sampled,
+                "sampled_bytes_per_call": self.sampled_bytes / self.sampled if self.sampled else 0.0,
+            }
+
+
+def instrumented(fn: Callable) -> Callable:
+    """Decorator: count and time every call of fn while metrics are enabled."""
+    stats = _registry.setdefault(fn.__name__, OpStats(fn.__name__))
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return fn(*args, **kwargs)
+        return _measure(stats, fn, args, kwargs)
+
+    return wrapper
+
+
+def fail(reason: str) -> bool:
+    """Note why the current operation failed; returns False for `return fail(...)`."""
+    if _enabled:
+        reasons = getattr(_local, "reasons", None)
+        if reasons is not None:
+            reasons.append(reason)
+    return False
+
+
+def _measure(stats: OpStats, fn: Callable, args, kwargs):
+    outer = getattr(_local, "reasons", None)
+    _local.reasons = reasons = []
+    clock = time.perf_counter_ns
+    sample = _profile_every and next(_call_counter) % _profile_every == 0
+    start = clock()
+    try:
+        if sample:
+            result = _sampled(stats, fn, args, kwargs)
+        else:
+            result = fn(*args, **kwargs)
+    except BaseException:
+        stats.record(clock() - start, reasons, error=True)
+        raise
+    finally:
+        _local.reasons = outer
+    if result is False and not reasons:
+        reasons.append("unspecified")
+    stats.record(clock() - start, reasons)
+    return result
+
+
+def _sampled(stats: OpStats, fn: Callable, args, kwargs):
+    profiler = _profiler
+    if profiler is None or not _profile_lock.acquire(blocking=False):
+        return fn(*args, **kwargs)  # another call is being profiled
+    try:
+        before = tracemalloc.get_traced_memory()[0] if _trace_memory else 0
+        result = profiler.runcall(fn, *args, **kwargs)
+        if _trace_memory:
+            with stats._lock:
+                stats.sampled_bytes += tracemalloc.get_traced_memory()[0] - before
+        with stats._lock:
+            stats.sampled += 1
+        return result
+    finally:
+        _profile_lock.release()
+
+
+# ---------- switches ----------
+def enable() -> None:
+    global _enabled
+    _enabled = True
+
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def reset() -> None:
+    """Zero every counter and drop the collected profile."""
+    global _profiler
+    for stats in _registry.values():
+        stats.reset()
+    with _profile_lock:
+        if _profiler is not None:
+            _profiler = cProfile.Profile()
+
+
+def start_profiling(every: int = 100, memory: bool = False) -> None:
+    """Run every `every`-th instrumented call under cProfile.
+
+    With memory=True tracemalloc is started too, and the sampled calls
+    also measure how much memory they leave allocated. Only has an
+    effect while metrics are enabled.
+    """
+    global _profiler, _profile_every, _trace_memory
+    with _profile_lock:
+        _profiler = cProfile.Profile()
+        _trace_memory = memory
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _profile_every = max(1, every)
+
+
+def stop_profiling() -> None:
+    global _profile_every, _trace_memory
+    with _profile_lock:
+        _profile_every = 0
+        if _trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        _trace_memory = False
+
+
+# ---------- export ----------
+def snapshot(top: int = 20) -> Dict:
+    """All counters as a JSON-able dict, plus the top profile/memory entries."""
+    result = {
+        "enabled": _enabled,
+        "operations": {name: stats.snapshot() for name, stats in sorted(_registry.items())
+                       if stats.calls},
+    }
+    with _profile_lock:
+        if _profiler is not None and any(stats.sampled for stats in _registry.values()):
+            result["profile"] = _top_functions(_profiler, top)
+        if _trace_memory and tracemalloc.is_tracing():
+            result["memory"] = [
+                {"where": str(stat.traceback), "bytes": stat.size, "blocks": stat.count}
+                for stat in tracemalloc.take_snapshot().statistics("lineno")[:top]]
+    return result
+
+
+def export_json(path: str, top: int = 20) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(snapshot(top), f, indent=2)
+
+
+def _top_functions(profiler: cProfile.Profile, top: int) -> List[Dict]:
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, line, name), (_, calls, tottime, cumtime, _) in stats.stats.items():
+        rows.append({"function": f"{os.path.basename(filename)}:{line}({name})", "calls": calls,
+                     "tottime_ms": tottime * 1e3, "cumtime_ms": cumtime * 1e3})
+    rows.sort(key=lambda row: row["cumtime_ms"], reverse=True)
+    return rows[:top]
@@ -0,0 +1,289 @@
+# mmap_snapshot.py
+
+import mmap
+import struct
+import zlib
+from array import array
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Set, Tuple
+
+from search_index import INDEXED_FIELDS, tokenize
+
+# File layout (little-endian):
+#   header
+#   book table    - one fixed-width BOOK record per book
+#   member table  - one fixed-width MEMBER record per member
+#   book index    - open-addressing hash table, u32 slots of record_no + 1
+#   member index  - same, keyed by member_id
+#   term table    - sorted search terms, each with a slice of the postings
+#   postings      - u32 book record numbers, grouped by term
+#   string heap   - UTF-8 strings referenced by (offset, length) pairs
+# Strings are limited to 64 KiB each and the heap to 4 GiB. The term
+# table lets search_books answer from the file without loading it.
+
+MAGIC = b"LIBSNAP1"
+HEADER = struct.Struct("<8sIIIIIIQQQQQQQ")
+BOOK = struct.Struct("<IIIHHHBxii")      # isbn/title/author (off, len), genre, total, available
+MEMBER = struct.Struct("<IIIIHHHH")      # member_id/name/email/borrowed (off, len)
+TERM = struct.Struct("<IIIHxx")          # term off, postings start, postings count, term len
+SLOT = struct.Struct("<I")
+SEP = "\x1f"  # joins genre names and borrowed ISBNs in the heap
+
+
+def _hash(key: bytes) -> int:
+    return zlib.crc32(key)  # stable across processes, unlike hash()
+
+
+def _table_size(n: int) -> int:
+    size = 8
+    while size < 2 * n:
+        size *= 2
+    return size
+
+
+class _Heap:
+    def __init__(self):
+        self.parts: List[bytes] = []
+        self.size = 0
+
+    def add(self, text: str) -> Tuple[int, int]:
+        data = text.encode()
+        if len(data) > 0xFFFF:
+            raise ValueError(f"string too long for snapshot: {text[:40]!r}...")
+        offset = self.size
+        self.parts.append(data)
+        self.size += len(data)
+        return offset, len(data)
+
+
+def _build_index(keys: List[bytes]) -> bytearray:
+    size = _table_size(len(keys))
+    table = bytearray(size * SLOT.size)
+    mask = size - 1
+    for record_no, key in enumerate(keys):
+        slot = _hash(key) & mask
+        while SLOT.unpack_from(table, slot * SLOT.size)[0]:
+            slot = (slot + 1) & mask
+        SLOT.pack_into(table, slot * SLOT.size, record_no + 1)
+    return table
+
+
+def write_snapshot(path: str, books: Mapping, members: Iterable[Mapping],
+                   set_aside: Optional[Mapping[str, int]] = None) -> None:
+    """Write books (isbn -> record) and members to a binary snapshot file.
+
+    set_aside (isbn -> copies) are written as available: the file has no
+    holds to keep them for.
+    """
+    set_aside = set_aside or {}
+    heap = _Heap()
+    genres: Dict[str, int] = {}
+    book_rows, isbn_keys = [], []
+    postings: Dict[str, List[int]] = {}
+    for isbn, info in books.items():
+        record_no = len(book_rows)
+        for term in {t for field in INDEXED_FIELDS for t in tokenize(info[field])}:
+            postings.setdefault(term, []).append(record_no)
+        genre = genres.setdefault(info["genre"], len(genres))
+        if genre > 0xFF:
+            raise ValueError("too many distinct genres for snapshot")
+        i_off, i_len = heap.add(isbn)
+        t_off, t_len = heap.add(info["title"])
+        a_off, a_len = heap.add(info["author"])
+        book_rows.append(BOOK.pack(i_off, t_off, a_off, i_len, t_len, a_len, genre,
+                                   info["total_copies"], info["available_copies"] + set_aside.get(isbn, 0)))
+        isbn_keys.append(isbn.encode())
+    member_rows, member_keys = [], []
+    for m in members:
+        offsets = [heap.add(m[key]) for key in ("member_id", "name", "email")]
+        offsets.append(heap.add(SEP.join(m["borrowed_books"])))
+        member_rows.append(MEMBER.pack(*(o for o, _ in offsets), *(n for _, n in offsets)))
+        member_keys.append(m["member_id"].encode())
+    genre_off, genre_len = heap.add(SEP.join(genres))
+    term_rows, posting_array = [], array("I")
+    for term in sorted(postings):
+        t_off, t_len = heap.add(term)
+        term_rows.append(TERM.pack(t_off, len(posting_array), len(postings[term]), t_len))
+        posting_array.extend(postings[term])
+    if heap.size > 0xFFFFFFFF:
+        raise ValueError("snapshot string heap exceeds 4 GiB")
+    if posting_array.itemsize != 4:
+        raise RuntimeError("snapshot postings need a 4-byte array('I')")
+
+    book_index = _build_index(isbn_keys)
+    member_index = _build_index(member_keys)
+    member_table = HEADER.size + len(book_rows) * BOOK.size
+    book_index_off = member_table + len(member_rows) * MEMBER.size
+    member_index_off = book_index_off + len(book_index)
+    term_table = member_index_off + len(member_index)
+    postings_off = term_table + len(term_rows) * TERM.size
+    heap_off = postings_off + len(posting_array) * 4
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(book_rows), len(member_rows),
+                            len(book_index) // SLOT.size, len(member_index) // SLOT.size,
+                            len(term_rows), genre_len, genre_off, member_table,
+                            book_index_off, member_index_off, term_table, postings_off,
+                            heap_off))
+        f.write(b"".join(book_rows))
+        f.write(b"".join(member_rows))
+        f.write(book_index)
+        f.write(member_index)
+        f.write(b"".join(term_rows))
+        posting_array.tofile(f)
+        f.write(b"".join(heap.parts))
+
+
+class MappedSnapshot:
+    """Read-only, memory-mapped view of a snapshot file.
+
+    Opening only maps the file and reads the header; records are decoded
+    one at a time when they are asked for.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.book_count, self.member_count, self._book_slots, self._member_slots,
+         self._term_count, genre_len, genre_off, self._member_table, self._book_index,
+         self._member_index, self._term_table, self._postings,
+         self._heap) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a library snapshot")
+        self._genres = self._str(genre_off, genre_len).split(SEP)
+
+    def close(self) -> None:
+        self._mm.close()
+
+    # ---------- books ----------
+    def has_book(self, isbn: str) -> bool:
+        return self._find_book(isbn) is not None
+
+    def book(self, isbn: str) -> Optional[Dict]:
+        """Decode one book record, or None if the ISBN is not in the file."""
+        record_no = self._find_book(isbn)
+        return None if record_no is None else self._book(record_no)[1]
+
+    def isbns(self) -> Iterator[str]:
+        for record_no in range(self.book_count):
+            yield self._isbn(record_no)
+
+    def books(self) -> Iterator[Tuple[str, Dict]]:
+        for record_no in range(self.book_count):
+            yield self._book(record_no)
+
+    def _book(self, record_no: int) -> Tuple[str, Dict]:
+        (i_off, t_off, a_off, i_len, t_len, a_len, genre, total,
+         available) = BOOK.unpack_from(self._mm, HEADER.size + record_no * BOOK.size)
+        return self._str(i_off, i_len), {
+            "title": self._str(t_off, t_len),
+            "author": self._str(a_off, a_len),
+            "genre": self._genres[genre],
+            "total_copies": total,
+            "available_copies": available,
+        }
+
+    def _find_book(self, isbn: str) -> Optional[int]:
+        key = isbn.encode()
+        mask = self._book_slots - 1
+        slot = _hash(key) & mask
+        while True:
+            entry = SLOT.unpack_from(self._mm, self._book_index + slot * SLOT.size)[0]
+            if not entry:
+                return None
+            i_off, _, _, i_len = BOOK.unpack_from(self._mm, HEADER.size + (entry - 1) * BOOK.size)[:4]
+            if self._bytes(i_off, i_len) == key:
+                return entry - 1
+            slot = (slot + 1) & mask
+
+    def search(self, query: str) -> Set[str]:
+        """ISBNs whose title/author/genre words start with every query word.
+
+        Same matching rules as SearchIndex.search(prefix=True).
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return set()
+        matches = sorted((self._prefix_postings(term.encode()) for term in terms), key=len)
+        hits = matches[0]
+        for records in matches[1:]:
+            hits &= records
+        return {self._isbn(record_no) for record_no in hits}
+
+    def _prefix_postings(self, prefix: bytes) -> Set[int]:
+        # binary search for the first term >= prefix, then walk forward
+        lo, hi = 0, self._term_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid)[0] < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        records: Set[int] = set()
+        while lo < self._term_count:
+            term, start, count = self._term(lo)
+            if not term.startswith(prefix):
+                break
+            postings = array("I")
+            offset = self._postings + start * 4
+            postings.frombytes(self._mm[offset:offset + count * 4])
+            records.update(postings)
+            lo += 1
+        return records
+
+    def _term(self, i: int) -> Tuple[bytes, int, int]:
+        t_off, start, count, t_len = TERM.unpack_from(self._mm, self._term_table + i * TERM.size)
+        return self._bytes(t_off, t_len), start, count
+
+    def _isbn(self, record_no: int) -> str:
+        i_off, _, _, i_len = BOOK.unpack_from(self._mm, HEADER.size + record_no * BOOK.size)[:4]
+        return self._str(i_off, i_len)
+
+    # ---------- members ----------
+    def has_member(self, member_id: str) -> bool:
+        return self._find_member(member_id) is not None
+
+    def member(self, member_id: str) -> Optional[Dict]:
+        record_no = self._find_member(member_id)
+        return None if record_no is None else self._member(record_no)
+
+    def member_ids(self) -> Iterator[str]:
+        for record_no in range(self.member_count):
+            off, _, _, _, length = MEMBER.unpack_from(self._mm, self._member_table + record_no * MEMBER.size)[:5]
+            yield self._str(off, length)
+
+    def members(self) -> Iterator[Dict]:
+        for record_no in range(self.member_count):
+            yield self._member(record_no)
+
+    def loans(self) -> Iterator[Tuple[str, List[str]]]:
+        """(member_id, borrowed ISBNs) for every member with loans."""
+        for record_no in range(self.member_count):
+            fields = MEMBER.unpack_from(self._mm, self._member_table + record_no * MEMBER.size)
+            if fields[7]:
+                yield self._str(fields[0], fields[4]), self._str(fields[3], fields[7]).split(SEP)
+
+    def _member(self, record_no: int) -> Dict:
+        fields = MEMBER.unpack_from(self._mm, self._member_table + record_no * MEMBER.size)
+        member_id, name, email, borrowed = (self._str(fields[i], fields[i + 4]) for i in range(4))
+        return {"member_id": member_id, "name": name, "email": email,
+                "borrowed_books": borrowed.split(SEP) if borrowed else []}
+
+    def _find_member(self, member_id: str) -> Optional[int]:
+        key = member_id.encode()
+        mask = self._member_slots - 1
+        slot = _hash(key) & mask
+        while True:
+            entry = SLOT.unpack_from(self._mm, self._member_index + slot * SLOT.size)[0]
+            if not entry:
+                return None
+            off, _, _, _, length = MEMBER.unpack_from(self._mm, self._member_table + (entry - 1) * MEMBER.size)[:5]
+            if self._bytes(off, length) == key:
+                return entry - 1
+            slot = (slot + 1) & mask
+
+    def _bytes(self, offset: int, length: int) -> bytes:
+        start = self._heap + offset
+        return self._mm[start:start + length]
+
+    def _str(self, offset: int, length: int) -> str:
+        return self._bytes(offset, length).decode()
@@ -1,119 +1,1349 @@
 # operations.py
 
-from typing import Dict, List, Tuple, Optional
+import base64
+import heapq
+import json
+import threading
+import time
+from bisect import bisect_right
+from changefeed import ChangeFeed, ChangeFeedGap, Subscription
+from contextlib import contextmanager
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Set, Tuple, Optional
 from data import books, members, GENRES
+from holds import READY
+from loans import DAY, Loan, verify_loans
+from locks import LockStripes
+from metrics import fail, instrumented
+from mmap_snapshot import MappedSnapshot, write_snapshot
+from query_cache import QueryCache, normalize
+from search_index import SearchIndex, record_terms
+from store import MAX_COPIES, BookResult
+from wal import WriteAheadLog, read_log, read_snapshot
+
+# the public functions are @instrumented (see metrics.py); when one returns
+# False it says why with fail(reason), which metrics counts per reason
+
+# striped locks so circulation from several threads stays consistent;
+# member stripes are always taken before book stripes
+_member_locks = LockStripes()
+_book_locks = LockStripes()
+
+# inverted index behind search_books, kept up to date by the book functions;
+# the SQLite backend keeps its own in the database
+_search_index = getattr(books, "search_index", None)
+if _search_index is None:
+    _search_index = SearchIndex()
+
+# normalized query -> ISBNs, invalidated by the book functions (see query_cache.py)
+_query_cache = QueryCache()
+
+def _rebuild_indexes() -> None:
+    _query_cache.clear()
+    _search_index.clear()
+    for isbn, info in books.items():
+        _search_index.add(isbn, info)
+
+if isinstance(_search_index, SearchIndex) or (len(books) and not len(_search_index)):
+    _rebuild_indexes()
+
+# who has which book, kept by the member store and updated by borrow/return
+_ledger = members.ledger
+
+# who is waiting for which book, also kept by the member store (see Holds below)
+_holds = members.holds
+
+# every book each member has ever borrowed, and which books go together
+# (see Recommendations below); also kept by the member store
+_history = members.history
+
+def _indexed_terms(isbn: str) -> FrozenSet[str]:
+    # terms a book is found under now; snapshot books are not in _search_index
+    terms = _search_index.terms_of(isbn)
+    if not terms and isbn in books:
+        terms = record_terms(books.record(isbn))
+    return terms
+
+# write-ahead log, set by open_storage(); None means in-memory only
+_wal: Optional[WriteAheadLog] = None
+
+# every change, in order, for subscribers (see changes() and subscribe())
+_feed = ChangeFeed()
+
+def _log(op: str, *args, **kwargs) -> None:
+    # called while the operation still holds its locks, so the log and
+    # feed order matches the order conflicting operations were applied in
+    _feed.publish(op, args, kwargs)
+    if _wal is not None:
+        _wal.append(op, list(args), kwargs)
 
 # ---------- Book functions ----------
+@instrumented
 def add_book(isbn: str, title: str, author: str, genre: str, total_copies: int) -> bool:
-    if isbn in books:
-        return False  # ISBN must be unique
-    if genre not in GENRES:
-        return False
+    with _book_locks.locked(isbn):
+        if isbn in books:
+            return fail("duplicate_isbn")  # ISBN must be unique
+        if genre not in GENRES:
+            return fail("invalid_genre")
+        if not 0 <= int(total_copies) <= MAX_COPIES:
+            return fail("invalid_copies")
+        _put_book(isbn, title, author, genre, int(total_copies))
+        _log("add_book", isbn, title, author, genre, int(total_copies))
+        return True
+
+def _put_book(isbn: str, title: str, author: str, genre: str, total_copies: int) -> None:
+    old_terms = _search_index.terms_of(isbn)  # left over if books was cleared directly
     books[isbn] = {
         "title": title,
         "author": author,
         "genre": genre,
-        "total_copies": int(total_copies),
-        "available_copies": int(total_copies)
+        "total_copies": total_copies,
+        "available_copies": total_copies
     }
-    return True
+    _query_cache.invalidate(old_terms, _search_index.add(isbn, books[isbn]))
+
+@instrumented
+def search_books(query: str, mode: str = "index") -> List[Dict]:
+    # mode "index": every word must match the start of a title/author/genre word
+    # mode "substring": plain substring test on title/author (full scan)
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"unknown search mode {mode!r}")
+    if mode == "substring" or not normalize(query):
+        return _substring_search(query)
+    results = []
+    for isbn in _index_search(query):  # rows are read now, so copy counts are current
+        try:
+            row = books.record(isbn)
+        except KeyError:
+            continue  # deleted meanwhile, or books was cleared directly
+        row["isbn"] = isbn
+        results.append(row)
+    return results
 
-def search_books(query: str) -> List[Dict]:
+def _index_search(query: str) -> Tuple[str, ...]:
+    # matching ISBNs in ISBN order, from the cache when possible
+    key = normalize(query)
+    isbns = _query_cache.get(key)
+    if isbns is None:
+        generation = _query_cache.generation
+        hits = _search_index.search(key)
+        snapshot = books.backing
+        if snapshot is not None:
+            # books still served from a mapped snapshot and never re-indexed
+            hits |= {isbn for isbn in snapshot.search(key)
+                     if isbn not in _search_index and isbn in books}
+        isbns = tuple(sorted(hits))
+        _query_cache.put(key, isbns, generation)
+    return isbns
+
+def _substring_search(query: str) -> List[Dict]:
     q = query.lower()
     results = []
-    for isbn, info in books.items():
-        if q in info["title"].lower() or q in info["author"].lower():
-            row = info.copy()
-            row["isbn"] = isbn
-            results.append(row)
+    for isbn in list(books):  # snapshot, other threads may add/delete
+        try:
+            info = books[isbn]
+            if q in info["title"].lower() or q in info["author"].lower():
+                row = info.copy()
+                row["isbn"] = isbn
+                results.append(row)
+        except KeyError:
+            continue
     return results
 
+@instrumented
+def fuzzy_search(query: str, limit: int = 10) -> List[Dict]:
+    """Books with a word close to every query word, for misspelled searches ("Knuht").
+
+    Each query word may be off by max_edits() typos (1 from 3 letters,
+    2 from 6). Returns the best `limit` books, fewest typos first, each
+    row with a "typos" count. Books still served from a lazily imported
+    snapshot are only found once updated.
+    """
+    if limit <= 0:
+        raise ValueError("limit must be positive")
+    results = []
+    for isbn, typos in _search_index.fuzzy(query, limit):
+        try:
+            row = books.record(isbn)
+        except KeyError:
+            continue
+        row["isbn"] = isbn
+        row["typos"] = typos
+        results.append(row)
+    return results
+
+# ---------- Streaming and paginated search ----------
+# Results are BookResult views: read-only, live (copy counts are read on
+# access) and a couple of pointers each, instead of one copied dict per
+# match. Pages resume after the last key seen (keyset pagination), so
+# books added or deleted between pages never cause repeats or skips.
+
+SEARCH_MODES = ("index", "substring")
+SEARCH_ORDERS = ("isbn", "title")
+
+def _matching_isbns(query: str, mode: str, genre: Optional[str] = None,
+                    available: Optional[bool] = None) -> Tuple[str, ...]:
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"unknown search mode {mode!r}")
+    if genre is not None and genre not in GENRES:
+        raise ValueError(f"unknown genre {genre!r}")
+    if not query:
+        # no text to match: the facet index has the books directly
+        return tuple(sorted(_facets().isbns(genre, available)))
+    if mode == "index" and normalize(query):
+        isbns = _index_search(query)
+    else:
+        q = query.lower()
+        matched = []
+        for isbn in list(books):
+            try:
+                record = books.record(isbn)
+            except KeyError:
+                continue
+            if q in record["title"].lower() or q in record["author"].lower():
+                matched.append(isbn)
+        isbns = tuple(sorted(matched))
+    if genre is None and available is None:
+        return isbns
+    return tuple(_facets().filter(isbns, genre, available))
+
+def _title_key(isbn: str) -> Optional[Tuple[str, str]]:
+    try:
+        return BookResult(books, isbn)["title"].lower(), isbn
+    except KeyError:
+        return None
+
+def _ordered(isbns: Tuple[str, ...], order: str, after=None, limit: Optional[int] = None) -> Iterator[str]:
+    # matching ISBNs in the requested order, starting after the key `after`
+    if order == "isbn":
+        for i in range(bisect_right(isbns, after) if after else 0, len(isbns)):
+            yield isbns[i]
+        return
+    if order != "title":
+        raise ValueError(f"unknown search order {order!r}")
+    keys = (key for key in map(_title_key, isbns) if key is not None and (after is None or key > after))
+    # a page only needs the smallest `limit` keys, not a full sort
+    for _, isbn in (heapq.nsmallest(limit, keys) if limit is not None else sorted(keys)):
+        yield isbn
+
+@instrumented
+def iter_books(query: str, mode: str = "index", order: str = "isbn",
+               genre: Optional[str] = None, available: Optional[bool] = None) -> Iterator[BookResult]:
+    """Yield matching books one at a time as read-only live views.
+
+    Same matching as search_books; ordered by ISBN or by title (ties by
+    ISBN). genre and available narrow the results (see count_books).
+    The arguments are checked and the matches found by the call itself;
+    only the views are produced lazily.
+    """
+    if order not in SEARCH_ORDERS:
+        raise ValueError(f"unknown search order {order!r}")
+    return _iter_results(_matching_isbns(query, mode, genre, available), order)
+
+def _iter_results(isbns: Tuple[str, ...], order: str) -> Iterator[BookResult]:
+    for isbn in _ordered(isbns, order):
+        if isbn in books:
+            yield BookResult(books, isbn)
+
+@instrumented
+def search_page(query: str, limit: int = 20, cursor: Optional[str] = None,
+                order: str = "isbn", mode: str = "index", genre: Optional[str] = None,
+                available: Optional[bool] = None) -> Dict:
+    """One page of search results: {"results": [BookResult, ...], "next": cursor}.
+
+    Pass "next" back as cursor to get the following page; it is None
+    after the last page. A cursor only works for the search (query,
+    order, mode and filters) it came from.
+    """
+    if limit <= 0:
+        raise ValueError("limit must be positive")
+    search = [normalize(query) if mode == "index" else query.lower(), order, mode, genre, available]
+    after = _decode_cursor(cursor, search) if cursor else None
+    isbns = _matching_isbns(query, mode, genre, available)
+    results = []
+    for isbn in _ordered(isbns, order, after, limit + 1):
+        if isbn in books:
+            results.append(BookResult(books, isbn))
+            if len(results) > limit:
+                break
+    more = len(results) > limit
+    del results[limit:]
+    next_cursor = None
+    if more:
+        last = results[-1].isbn
+        next_cursor = _encode_cursor(search, last if order == "isbn" else _title_key(last))
+    return {"results": results, "next": next_cursor}
+
+def _encode_cursor(search: list, after) -> str:
+    data = json.dumps([search, after], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode()
+
+def _decode_cursor(cursor: str, search: list):
+    try:
+        c_search, after = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("invalid search cursor") from None
+    if c_search != search:
+        raise ValueError("cursor belongs to a different search")
+    return tuple(after) if search[1] == "title" else after
+
+# ---------- Facets ----------
+# The book store groups books by genre and by availability (at least one
+# copy in) as they are written, so the counts below need no scan.
+
+def _facets():
+    if not books.facets_ready:
+        with _quiesced():  # first use after a lazy snapshot import
+            return books.facets
+    return books.facets
+
+@instrumented
+def count_books(query: str = "", genre: Optional[str] = None,
+                available: Optional[bool] = None, mode: str = "index") -> int:
+    """Number of books matching query (all books if empty), genre and availability.
+
+    available=True counts books with a copy in, False those with every
+    copy out. Without a query this is a constant-time lookup.
+    """
+    if not query:
+        if genre is not None and genre not in GENRES:
+            raise ValueError(f"unknown genre {genre!r}")
+        return _facets().count(genre, available)
+    isbns = _matching_isbns(query, mode, genre, available)
+    if genre is None and available is None:
+        return sum(1 for isbn in isbns if isbn in books)
+    return len(isbns)  # the facet filter already dropped deleted books
+
+@instrumented
+def genre_counts() -> Dict[str, Dict[str, int]]:
+    """Per genre: books, available_books, total_copies and available_copies."""
+    totals = _facets().totals()
+    empty = {"books": 0, "available_books": 0, "total_copies": 0, "available_copies": 0}
+    return {genre: totals.get(genre, dict(empty)) for genre in GENRES}
+
+@instrumented
 def update_book(isbn: str, **kwargs) -> bool:
-    if isbn not in books:
-        return False
+    with _book_locks.locked(isbn):
+        if isbn not in books:
+            return fail("unknown_isbn")
+        book = books[isbn]
+        # Allowed updates: title, author, genre, total_copies
+        if "genre" in kwargs and kwargs["genre"] not in GENRES:
+            return fail("invalid_genre")
+        if "total_copies" in kwargs:
+            if int(kwargs["total_copies"]) > MAX_COPIES:
+                return fail("invalid_copies")
+            if book["available_copies"] + int(kwargs["total_copies"]) - book["total_copies"] < 0:
+                # cannot set total lower than borrowed count
+                return fail("total_below_on_loan")
+        _change_book(isbn, kwargs)
+        _log("update_book", isbn, **kwargs)
+        if "total_copies" in kwargs:
+            _fill_holds(isbn)
+        return True
+
+def _change_book(isbn: str, changes: Dict) -> None:
+    # apply update_book changes that have been checked
     book = books[isbn]
-    # Allowed updates: title, author, genre, total_copies
-    if "genre" in kwargs and kwargs["genre"] not in GENRES:
-        return False
+    old_terms = _indexed_terms(isbn)
     # handle total_copies change (maintain available_copies)
-    if "total_copies" in kwargs:
-        new_total = int(kwargs["total_copies"])
+    if "total_copies" in changes:
+        new_total = int(changes["total_copies"])
         diff = new_total - book["total_copies"]
         book["total_copies"] = new_total
         book["available_copies"] += diff
-        if book["available_copies"] < 0:
-            # cannot set total lower than borrowed count
-            return False
     for key in ("title", "author", "genre"):
-        if key in kwargs:
-            book[key] = kwargs[key]
-    return True
+        if key in changes:
+            book[key] = changes[key]
+    _query_cache.invalidate(old_terms, _search_index.add(isbn, book))
 
+@instrumented
 def delete_book(isbn: str) -> bool:
-    if isbn not in books:
-        return False
-    if books[isbn]["available_copies"] != books[isbn]["total_copies"]:
-        # some copies are currently borrowed
-        return False
-    del books[isbn]
-    return True
+    with _book_locks.locked(isbn):
+        if isbn not in books:
+            return fail("unknown_isbn")
+        if _ledger.copies_out(isbn):
+            # some copies are currently borrowed
+            return fail("copies_on_loan")
+        if _holds.waiting_count(isbn) or _holds.ready_count(isbn):
+            return fail("has_holds")
+        old_terms = _indexed_terms(isbn)
+        del books[isbn]
+        _search_index.remove(isbn)
+        _query_cache.invalidate(old_terms, frozenset())
+        _log("delete_book", isbn)
+        return True
+
+def configure_cache(maxsize: Optional[int] = None, ttl: Optional[float] = None) -> None:
+    """Set the search cache's size limit (0 disables it) and/or entry lifetime in seconds."""
+    if maxsize is not None:
+        _query_cache.resize(maxsize)
+    if ttl is not None:
+        _query_cache.ttl = ttl
+
+def cache_stats() -> Dict:
+    """Search cache size, hits, misses, hit rate, evictions and invalidations."""
+    return _query_cache.stats()
 
 # ---------- Member functions ----------
+@instrumented
 def add_member(member_id: str, name: str, email: str) -> bool:
-    if any(m["member_id"] == member_id for m in members):
-        return False
-    members.append({"member_id": member_id, "name": name, "email": email, "borrowed_books": []})
-    return True
+    with _member_locks.locked(member_id):
+        if member_id in members:
+            return fail("duplicate_member")
+        members.append({"member_id": member_id, "name": name, "email": email, "borrowed_books": []})
+        _log("add_member", member_id, name, email)
+        return True
 
+@instrumented
 def find_member(member_id: str) -> Optional[Dict]:
-    for m in members:
-        if m["member_id"] == member_id:
-            return m
-    return None
+    return members.get(member_id)
 
+@instrumented
 def update_member(member_id: str, **kwargs) -> bool:
-    m = find_member(member_id)
-    if not m:
-        return False
-    if "name" in kwargs:
-        m["name"] = kwargs["name"]
-    if "email" in kwargs:
-        m["email"] = kwargs["email"]
-    return True
+    with _member_locks.locked(member_id):
+        m = members.get(member_id)
+        if not m:
+            return fail("unknown_member")
+        _change_member(m, kwargs)
+        _log("update_member", member_id, **kwargs)
+        return True
+
+def _change_member(m, changes: Dict) -> None:
+    if "name" in changes:
+        m["name"] = changes["name"]
+    if "email" in changes:
+        m["email"] = changes["email"]
 
+@instrumented
 def delete_member(member_id: str) -> bool:
-    m = find_member(member_id)
-    if not m:
-        return False
-    if m["borrowed_books"]:
-        # cannot delete while member has borrowed books
-        return False
-    members.remove(m)
-    return True
+    with _member_locks.locked(member_id):
+        m = members.get(member_id)
+        if not m:
+            return fail("unknown_member")
+        if _ledger.loan_count(member_id):
+            # cannot delete while member has borrowed books
+            return fail("has_loans")
+        held = _holds.holds_of(member_id)
+        with _book_locks.locked_all(held), books.transaction():
+            # their holds go too, and set-aside copies to the next in line
+            released = [isbn for isbn in held if _holds.cancel(member_id, isbn) == READY]
+            members.delete(member_id)
+            _log("delete_member", member_id)
+            for isbn in released:
+                _release_copy(isbn)
+        return True
 
 # ---------- Borrow / Return ----------
+# Holds count towards MAX_BORROW (see Holds below), and copies set aside
+# for a hold can only be borrowed by that member. A loan is due back
+# LOAN_SECONDS after checkout; `at` is the checkout time (default: now),
+# logged so that replay gives every loan the same due date again.
 MAX_BORROW = 3
+LOAN_SECONDS = 14 * DAY
 
-def borrow_book(member_id: str, isbn: str) -> bool:
-    m = find_member(member_id)
-    if not m or isbn not in books:
-        return False
-    if len(m["borrowed_books"]) >= MAX_BORROW:
-        return False
-    if books[isbn]["available_copies"] <= 0:
-        return False
-    # borrow
-    m["borrowed_books"].append(isbn)
-    books[isbn]["available_copies"] -= 1
-    return True
+@instrumented
+def borrow_book(member_id: str, isbn: str, at: Optional[float] = None) -> bool:
+    _expire_holds()
+    at = time.time() if at is None else at
+    with _member_locks.locked(member_id), _book_locks.locked(isbn), books.transaction():
+        m = members.get(member_id)
+        if not m:
+            return fail("unknown_member")
+        if isbn not in books:
+            return fail("unknown_isbn")
+        hold = _holds.status(member_id, isbn)
+        if hold != READY:
+            # a waiting hold turns into the loan, so it does not count twice
+            if _ledger.loan_count(member_id) + _holds.hold_count(member_id) - (hold is not None) >= MAX_BORROW:
+                return fail("borrow_limit")
+            if books[isbn]["available_copies"] <= 0:
+                return fail("no_copies")
+        _lend(m, isbn, at, hold)
+        _log("borrow_book", member_id, isbn, at=at)
+        return True
 
+def _lend(m, isbn: str, at: float, hold: Optional[str]) -> None:
+    # the loan of a checked borrow; a hold of the member's turns into it,
+    # and a ready one brings its copy, already off the shelf
+    if hold is not None:
+        _holds.cancel(m["member_id"], isbn)
+    _ledger.add(m, isbn, at, at + LOAN_SECONDS)
+    _history.record(m["member_id"], isbn)
+    if hold != READY:
+        books[isbn]["available_copies"] -= 1
+
+@instrumented
 def return_book(member_id: str, isbn: str) -> bool:
-    m = find_member(member_id)
-    if not m or isbn not in books:
-        return False
-    if isbn not in m["borrowed_books"]:
-        return False
-    m["borrowed_books"].remove(isbn)
+    with _member_locks.locked(member_id), _book_locks.locked(isbn), books.transaction():
+        m = members.get(member_id)
+        if not m:
+            return fail("unknown_member")
+        if isbn not in books:
+            return fail("unknown_isbn")
+        if not _ledger.remove(m, isbn):
+            return fail("not_borrowed")
+        books[isbn]["available_copies"] += 1
+        _log("return_book", member_id, isbn)
+        _fill_holds(isbn)
+        return True
+
+# ---------- Loan ledger ----------
+@instrumented
+def borrowers(isbn: str) -> Dict[str, int]:
+    """Who has copies of a book: member_id -> number of copies."""
+    return _ledger.borrowers(isbn)
+
+@instrumented
+def loan_count(member_id: str) -> int:
+    """Number of books a member has on loan."""
+    return _ledger.loan_count(member_id)
+
+def check_loans() -> List[str]:
+    """Check the loan ledger against member lists and book copy counters.
+
+    Returns a description of every inconsistency found (empty if none).
+    """
+    with _quiesced():
+        return verify_loans(_ledger, books, members, _holds)
+
+# ---------- Due dates ----------
+# Every loan has a due date in a per-day index (see DueIndex in loans.py),
+# so the overdue loans come out oldest first without looking at the
+# others. A loan can be renewed MAX_RENEWALS times, LOAN_SECONDS from the
+# renewal, unless it is overdue or someone is waiting for the book.
+# Loans restored from binary snapshots have no due date and are never
+# overdue until renewed. See fines.py for the batch fines job.
+
+MAX_RENEWALS = 2
+
+@instrumented
+def renew_loan(member_id: str, isbn: str, at: Optional[float] = None) -> bool:
+    at = time.time() if at is None else at
+    with _member_locks.locked(member_id), _book_locks.locked(isbn), books.transaction():
+        if member_id not in members:
+            return fail("unknown_member")
+        if not _ledger.held(member_id, isbn):
+            return fail("not_borrowed")
+        loan = _ledger.loan(member_id, isbn)  # the copy renewed (None: an undated one)
+        if loan is not None:
+            if loan.renewals >= MAX_RENEWALS:
+                return fail("renewal_limit")
+            if loan.due < at:
+                return fail("overdue")
+        if _holds.waiting_count(isbn):
+            return fail("has_holds")
+        _ledger.renew(member_id, isbn, at + LOAN_SECONDS)
+        _log("renew_loan", member_id, isbn, at=at)
+        return True
+
+def _loan_row(loan: Loan, now: float) -> Dict:
+    return {"member_id": loan.member_id, "isbn": loan.isbn, "checkout": loan.checkout,
+            "due": loan.due, "renewals": loan.renewals,
+            "days_overdue": max(0.0, (now - loan.due) / DAY)}
+
+@instrumented
+def overdue_loans(now: Optional[float] = None, limit: Optional[int] = None) -> List[Dict]:
+    """Loans due before now (default: the current time), the longest overdue first."""
+    now = time.time() if now is None else now
+    return [_loan_row(loan, now) for loan in _ledger.overdue(now, limit)]
+
+def iter_overdue(now: Optional[float] = None) -> Iterator[Loan]:
+    """Every loan due before now as Loan tuples, oldest first, without building a list."""
+    return _ledger.iter_overdue(time.time() if now is None else now)
+
+@instrumented
+def member_loans(member_id: str) -> List[Dict]:
+    """A member's loans with due dates, due first."""
+    now = time.time()
+    return [_loan_row(loan, now) for loan in _ledger.dated_loans(member_id)]
+
+# ---------- Holds ----------
+# A member can join the waiting list of a book that has no copy on the
+# shelf. Each returned copy goes straight to the next member waiting: it
+# is set aside for them (no longer counted in available_copies) for
+# HOLD_PICKUP_SECONDS, during which only they can borrow it. After that
+# the hold lapses and the copy goes to the next member. Lapsed holds are
+# found on a heap of deadlines when the next hold or borrow call comes
+# (or by expire_holds()). Waiting and ready holds both count towards
+# MAX_BORROW, so every member is always able to collect their holds.
+
+HOLD_PICKUP_SECONDS = 3 * 24 * 3600
+
+# set while open_storage() replays the log: expiries and allocations
+# (with their deadlines) are replayed from their own log records, not
+# from the clock
+_replaying = False
+
+@instrumented
+def place_hold(member_id: str, isbn: str) -> bool:
+    """Join the waiting list for a book with no copy available."""
+    _expire_holds()
+    with _member_locks.locked(member_id), _book_locks.locked(isbn), books.transaction():
+        if member_id not in members:
+            return fail("unknown_member")
+        if isbn not in books:
+            return fail("unknown_isbn")
+        if _holds.status(member_id, isbn) is not None:
+            return fail("already_held")
+        if _ledger.loan_count(member_id) + _holds.hold_count(member_id) >= MAX_BORROW:
+            return fail("borrow_limit")
+        if books[isbn]["available_copies"] > 0:
+            return fail("copies_available")  # borrow it instead
+        _holds.place(member_id, isbn)
+        _log("place_hold", member_id, isbn)
+        return True
+
+@instrumented
+def cancel_hold(member_id: str, isbn: str) -> bool:
+    with _member_locks.locked(member_id), _book_locks.locked(isbn), books.transaction():
+        state = _holds.cancel(member_id, isbn)
+        if state is None:
+            return fail("no_hold")
+        _log("cancel_hold", member_id, isbn)
+        if state == READY:
+            _release_copy(isbn)
+        return True
+
+@instrumented
+def member_holds(member_id: str) -> Dict[str, str]:
+    """isbn -> "waiting" or "ready" (a copy is set aside) for one member."""
+    _expire_holds()
+    return _holds.holds_of(member_id)
+
+@instrumented
+def hold_queue(isbn: str) -> Dict:
+    """Members with a copy set aside ({member_id: pickup deadline}) and those waiting, in order."""
+    _expire_holds()
+    return {"ready": _holds.ready_for(isbn), "waiting": _holds.queue(isbn)}
+
+def expire_holds(now: Optional[float] = None) -> int:
+    """Lapse the holds not picked up by now (default: the current time); returns how many."""
+    return _expire_holds(time.time() if now is None else now)
+
+def _fill_holds(isbn: str) -> None:
+    # available copies go to the members waiting; called with the ISBN's
+    # stripe held. Replay skips this: the hold_ready records that follow
+    # carry the allocations, with their deadlines.
+    if _replaying:
+        return
+    while books[isbn]["available_copies"] > 0:
+        deadline = time.time() + HOLD_PICKUP_SECONDS
+        member_id = _holds.allocate(isbn, deadline)
+        if member_id is None:
+            return
+        books[isbn]["available_copies"] -= 1
+        _log("hold_ready", member_id, isbn, deadline)
+
+def _hold_ready(member_id: str, isbn: str, deadline: float) -> None:
+    # replays one allocation of _fill_holds (member_id is next in line)
+    with _member_locks.locked(member_id), _book_locks.locked(isbn), books.transaction():
+        _holds.allocate(isbn, deadline)
+        books[isbn]["available_copies"] -= 1
+
+def _release_copy(isbn: str) -> None:
+    # the copy of a ready hold that was cancelled goes back on the shelf
     books[isbn]["available_copies"] += 1
-    return True
+    _fill_holds(isbn)
+
+def _expire_holds(now: Optional[float] = None) -> int:
+    # called before taking any lock: lapsing a hold takes its own stripes
+    if _replaying:
+        return 0
+    if now is None:
+        deadline = _holds.next_deadline()
+        if deadline is None or deadline > time.time():
+            return 0
+        now = time.time()
+    return sum(_expire_hold(member_id, isbn, now) for member_id, isbn in _holds.expired(now))
+
+def _expire_hold(member_id: str, isbn: str, now: Optional[float] = None) -> bool:
+    with _member_locks.locked(member_id), _book_locks.locked(isbn), books.transaction():
+        deadline = _holds.deadline(member_id, isbn)
+        if deadline is None or (now is not None and deadline > now):
+            return False  # collected or cancelled meanwhile
+        _holds.cancel(member_id, isbn)
+        _log("expire_hold", member_id, isbn)
+        _release_copy(isbn)
+        return True
+
+# ---------- Batch borrow / return ----------
+# Each pair is (member_id, isbn). Members and books are looked up once per
+# batch and the checks run against running counters, so later items see
+# the effect of earlier ones. Returns one bool per pair. With atomic=True
+# nothing is applied unless every pair succeeds (all False otherwise).
+# The whole batch holds the stripes of every member and ISBN it touches.
+
+def _log_batch(op: str, pairs: List[tuple], results: List[bool],
+               kwargs: Optional[Dict] = None) -> None:
+    # a batch replays exactly like its successful items done one by one
+    records = [(op, list(pair), kwargs) for pair, ok in zip(pairs, results) if ok]
+    if records:
+        _feed.publish_many(records)
+        if _wal is not None:
+            _wal.append_many(records)
+
+@contextmanager
+def _batch_locks(pairs: List[Tuple[str, str]]) -> Iterator[None]:
+    with _member_locks.locked_all(m for m, _ in pairs), _book_locks.locked_all(i for _, i in pairs):
+        yield
+
+@instrumented
+def borrow_many(pairs: Iterable[Tuple[str, str]], atomic: bool = False,
+                at: Optional[float] = None) -> List[bool]:
+    _expire_holds()
+    pairs = list(pairs)
+    at = time.time() if at is None else at
+    due = at + LOAN_SECONDS
+    with _batch_locks(pairs), books.transaction():
+        resolved: Dict[str, Optional[Dict]] = {}
+        loans: Dict[str, int] = {}       # member_id -> running loans + holds
+        free: Dict[str, int] = {}        # isbn -> running available copies
+        taken: Dict[str, int] = {}       # isbn -> copies off the shelf in this batch
+        claimed: Dict[Tuple[str, str], str] = {}  # holds turned into loans
+        results = []
+        for member_id, isbn in pairs:
+            pair = (member_id, isbn)
+            count = loans.get(member_id)
+            if count is None:
+                m = resolved[member_id] = members.get(member_id)
+                count = loans[member_id] = (_ledger.loan_count(member_id) + _holds.hold_count(member_id)
+                                            if m else MAX_BORROW)
+            copies = free.get(isbn)
+            if copies is None:
+                copies = free[isbn] = books[isbn]["available_copies"] if isbn in books else 0
+            hold = (_holds.status(member_id, isbn)
+                    if resolved[member_id] and pair not in claimed else None)
+            # as in borrow_book: a ready hold has its copy, a waiting one its slot
+            ok = hold == READY or (copies > 0 and (hold is not None or count < MAX_BORROW))
+            if ok:
+                if hold is None:
+                    loans[member_id] = count + 1
+                else:
+                    claimed[pair] = hold
+                if hold != READY:
+                    free[isbn] = copies - 1
+                    taken[isbn] = taken.get(isbn, 0) + 1
+                if not atomic:
+                    _ledger.add(resolved[member_id], isbn, at, due)
+                    if hold is not None:
+                        _holds.cancel(member_id, isbn)
+            else:
+                fail("unknown_member" if resolved[member_id] is None else
+                     "unknown_isbn" if isbn not in books else
+                     "borrow_limit" if hold is None and count >= MAX_BORROW else "no_copies")
+            results.append(ok)
+        if atomic:
+            if not all(results):
+                return [False] * len(pairs)
+            for member_id, isbn in pairs:
+                _ledger.add(resolved[member_id], isbn, at, due)
+            for member_id, isbn in claimed:
+                _holds.cancel(member_id, isbn)
+        for isbn, copies in taken.items():
+            books[isbn]["available_copies"] -= copies
+        _history.record_many(pair for pair, ok in zip(pairs, results) if ok)
+        _log_batch("borrow_book", pairs, results, {"at": at})
+        return results
+
+@instrumented
+def return_many(pairs: Iterable[Tuple[str, str]], atomic: bool = False) -> List[bool]:
+    pairs = list(pairs)
+    with _batch_locks(pairs), books.transaction():
+        resolved: Dict[str, Optional[Dict]] = {}
+        on_loan: Dict[Tuple[str, str], int] = {}  # (member_id, isbn) -> copies still held
+        returned: Dict[str, int] = {}             # isbn -> copies coming back
+        results = []
+        for pair in pairs:
+            member_id, isbn = pair
+            if member_id not in resolved:
+                resolved[member_id] = members.get(member_id)
+            held = on_loan.get(pair)
+            if held is None:
+                held = on_loan[pair] = (_ledger.held(member_id, isbn)
+                                        if resolved[member_id] and isbn in books else 0)
+            ok = held > 0
+            if ok:
+                on_loan[pair] = held - 1
+                returned[isbn] = returned.get(isbn, 0) + 1
+                if not atomic:
+                    _ledger.remove(resolved[member_id], isbn)
+            else:
+                fail("unknown_member" if resolved[member_id] is None else
+                     "unknown_isbn" if isbn not in books else "not_borrowed")
+            results.append(ok)
+        if atomic:
+            if not all(results):
+                return [False] * len(pairs)
+            for member_id, isbn in pairs:
+                _ledger.remove(resolved[member_id], isbn)
+        for isbn, count in returned.items():
+            books[isbn]["available_copies"] += count
+        _log_batch("return_book", pairs, results)
+        for isbn in returned:
+            _fill_holds(isbn)
+        return results
+
+# ---------- Batch add ----------
+# For bulk loading (see bulk.py): the same checks as add_book/add_member
+# for many rows under one set of lock stripes and one log write. Returns
+# one bool per row; later rows see earlier ones, so a repeated key fails
+# as a duplicate.
+
+@instrumented
+def add_books(rows: Iterable[Tuple[str, str, str, str, int]]) -> List[bool]:
+    """add_book for many (isbn, title, author, genre, total_copies) rows."""
+    rows = [(isbn, title, author, genre, int(copies)) for isbn, title, author, genre, copies in rows]
+    with _book_locks.locked_all(row[0] for row in rows), books.transaction():
+        results = []
+        try:
+            for isbn, title, author, genre, copies in rows:
+                if isbn in books:
+                    results.append(fail("duplicate_isbn"))
+                elif genre not in GENRES:
+                    results.append(fail("invalid_genre"))
+                elif not 0 <= copies <= MAX_COPIES:
+                    results.append(fail("invalid_copies"))
+                else:
+                    record = {"title": title, "author": author, "genre": genre,
+                              "total_copies": copies, "available_copies": copies}
+                    books[isbn] = record
+                    _search_index.add(isbn, record)
+                    results.append(True)
+        finally:
+            # if a row raised, the rows before it are in and must be logged
+            if any(results):
+                # many results change at once, so drop the whole cache (this
+                # also covers ISBNs left in the index by a direct books.clear())
+                _query_cache.clear()
+            _log_batch("add_book", rows, results)
+        return results
+
+@instrumented
+def add_members(rows: Iterable[Tuple[str, str, str]]) -> List[bool]:
+    """add_member for many (member_id, name, email) rows."""
+    rows = list(rows)
+    with _member_locks.locked_all(row[0] for row in rows), books.transaction():
+        results = []
+        for member_id, name, email in rows:
+            if member_id in members:
+                results.append(fail("duplicate_member"))
+            else:
+                members.append({"member_id": member_id, "name": name, "email": email, "borrowed_books": []})
+                results.append(True)
+        _log_batch("add_member", rows, results)
+        return results
+
+# ---------- Transactions ----------
+# Several book, member and circulation changes applied as one: all of them
+# or none. Inside `with transaction() as tx:` the tx methods stage changes
+# on private copies of the records they touch (reads go through tx too,
+# and see the staged changes); nothing outside tx changes until the block
+# ends and commit() runs. Copies, MAX_BORROW and GENRES are checked on the
+# final state only, so "return 2, borrow 3" works in either order.
+#
+# Optimistic: no lock is held while changes are staged. The change feed
+# sequence number at the start is the transaction's version; at commit the
+# events since then are checked for any that touch a book or member the
+# transaction read, and if there is one it raises TransactionConflict (run
+# it again). Only the commit itself holds the stripes, briefly.
+
+class TransactionError(Exception):
+    """A transaction was not applied; reasons holds (reason, key) pairs."""
+
+    def __init__(self, reasons: List[Tuple[str, str]]):
+        super().__init__("transaction not applied: " +
+                         ", ".join(f"{reason} ({key})" for reason, key in reasons))
+        self.reasons = reasons
+
+class TransactionConflict(TransactionError):
+    """Books or members the transaction read were changed meanwhile; retry it."""
+
+# the keys change feed events are about, by op
+_PAIR_OPS = frozenset({"borrow_book", "return_book", "renew_loan", "place_hold",
+                       "cancel_hold", "expire_hold", "hold_ready"})
+_BOOK_OPS = frozenset({"add_book", "update_book", "delete_book"})
+_MEMBER_OPS = frozenset({"add_member", "update_member", "delete_member"})
+
+class Transaction:
+    """Changes staged by transaction(); used by one thread."""
+
+    def __init__(self):
+        _expire_holds()  # before the version is taken, not in the middle of the commit
+        self._version = _feed.last_seq
+        self._books: Dict[str, Optional[Dict]] = {}    # isbn -> staged copy (None: no such book)
+        self._members: Dict[str, Optional[Dict]] = {}  # member_id -> staged copy (None: no such member)
+        self._loans: Dict[Tuple[str, str], int] = {}   # (member_id, isbn) -> borrowed - returned
+        self._claimed: Dict[Tuple[str, str], str] = {}  # holds turned into loans -> their state
+        self._changed: Set[str] = set()  # ISBNs whose copies change
+        self._resized: Set[str] = set()  # ISBNs whose total_copies change
+        self._ops: List[Tuple[str, tuple, Dict]] = []
+        self.closed = False
+
+    def _book(self, isbn: str) -> Optional[Dict]:
+        if isbn not in self._books:
+            try:
+                self._books[isbn] = books.record(isbn)
+            except KeyError:
+                self._books[isbn] = None
+        return self._books[isbn]
+
+    def _member(self, member_id: str) -> Optional[Dict]:
+        if member_id not in self._members:
+            m = members.get(member_id)
+            self._members[member_id] = (None if m is None else
+                                        {"member_id": member_id, "name": m["name"], "email": m["email"]})
+        return self._members[member_id]
+
+    def _stage(self, op: str, args: tuple, kwargs: Optional[Dict] = None) -> bool:
+        self._ops.append((op, args, kwargs or {}))
+        return True
+
+    def _check_open(self) -> None:
+        if self.closed:
+            raise RuntimeError("transaction already committed or rolled back")
+
+    def book(self, isbn: str) -> Optional[Dict]:
+        """The book as this transaction sees it, or None."""
+        self._check_open()
+        book = self._book(isbn)
+        return None if book is None else dict(book)
+
+    def member(self, member_id: str) -> Optional[Dict]:
+        """The member as this transaction sees it (borrowed_books included), or None."""
+        self._check_open()
+        m = self._member(member_id)
+        if m is None:
+            return None
+        held = dict(_ledger.loans_of(member_id)) if member_id in members else {}
+        for (loaner, isbn), delta in self._loans.items():
+            if loaner == member_id:
+                held[isbn] = held.get(isbn, 0) + delta
+        return dict(m, borrowed_books=[isbn for isbn, n in held.items() for _ in range(n)])
+
+    def add_book(self, isbn: str, title: str, author: str, genre: str, total_copies: int) -> bool:
+        self._check_open()
+        if self._book(isbn) is not None:
+            return fail("duplicate_isbn")
+        copies = int(total_copies)
+        if not 0 <= copies <= MAX_COPIES:  # checked here: commit must not fail halfway
+            return fail("invalid_copies")
+        self._books[isbn] = {"title": title, "author": author, "genre": genre,
+                             "total_copies": copies, "available_copies": copies}
+        self._changed.add(isbn)
+        return self._stage("add_book", (isbn, title, author, genre, copies))
+
+    def update_book(self, isbn: str, **kwargs) -> bool:
+        self._check_open()
+        book = self._book(isbn)
+        if book is None:
+            return fail("unknown_isbn")
+        if "total_copies" in kwargs:
+            total = int(kwargs["total_copies"])
+            if total > MAX_COPIES:
+                return fail("invalid_copies")
+            book["available_copies"] += total - book["total_copies"]
+            book["total_copies"] = total
+            self._resized.add(isbn)
+        for key in ("title", "author", "genre"):
+            if key in kwargs:
+                book[key] = kwargs[key]
+        self._changed.add(isbn)
+        return self._stage("update_book", (isbn,), kwargs)
+
+    def add_member(self, member_id: str, name: str, email: str) -> bool:
+        self._check_open()
+        if self._member(member_id) is not None:
+            return fail("duplicate_member")
+        self._members[member_id] = {"member_id": member_id, "name": name, "email": email}
+        return self._stage("add_member", (member_id, name, email))
+
+    def update_member(self, member_id: str, **kwargs) -> bool:
+        self._check_open()
+        m = self._member(member_id)
+        if m is None:
+            return fail("unknown_member")
+        _change_member(m, kwargs)
+        return self._stage("update_member", (member_id,), kwargs)
+
+    def borrow_book(self, member_id: str, isbn: str, at: Optional[float] = None) -> bool:
+        """Stage a loan; copies and the borrow limit are checked at commit."""
+        self._check_open()
+        if self._member(member_id) is None:
+            return fail("unknown_member")
+        book = self._book(isbn)
+        if book is None:
+            return fail("unknown_isbn")
+        pair = (member_id, isbn)
+        hold = None
+        if pair not in self._claimed:
+            hold = _holds.status(member_id, isbn)
+            if hold is not None:
+                self._claimed[pair] = hold
+        if hold != READY:  # a ready hold's copy is already off the shelf
+            book["available_copies"] -= 1
+        self._loans[pair] = self._loans.get(pair, 0) + 1
+        self._changed.add(isbn)
+        return self._stage("borrow_book", pair, {"at": time.time() if at is None else at})
+
+    def return_book(self, member_id: str, isbn: str) -> bool:
+        self._check_open()
+        if self._member(member_id) is None:
+            return fail("unknown_member")
+        book = self._book(isbn)
+        if book is None:
+            return fail("unknown_isbn")
+        pair = (member_id, isbn)
+        if _ledger.held(member_id, isbn) + self._loans.get(pair, 0) <= 0:
+            return fail("not_borrowed")
+        book["available_copies"] += 1
+        self._loans[pair] = self._loans.get(pair, 0) - 1
+        self._changed.add(isbn)
+        return self._stage("return_book", pair)
+
+    def rollback(self) -> None:
+        """Drop every staged change."""
+        self.closed = True
+        self._ops = []
+
+    def commit(self) -> None:
+        """Apply every staged change, or raise TransactionError and apply none."""
+        self._check_open()
+        self.closed = True
+        if not self._ops:
+            return
+        with _member_locks.locked_all(self._members), _book_locks.locked_all(self._books), \
+                books.transaction():
+            self._check_version()
+            taken = self._check_invariants()
+            for op, args, kwargs in self._ops:
+                self._apply(op, args, kwargs)
+            _feed.publish_many(self._ops)
+            if _wal is not None:
+                # one record, so replay never sees part of a transaction
+                _wal.append("transaction", [[[op, list(args), kwargs] for op, args, kwargs in self._ops]])
+            for isbn in self._changed:
+                if taken.get(isbn, 0) < 0 or isbn in self._resized:  # copies came back
+                    _fill_holds(isbn)
+
+    def _check_version(self) -> None:
+        try:
+            events = _feed.ops_since(self._version)
+        except ChangeFeedGap:
+            raise TransactionConflict([("feed_overrun", str(self._version))]) from None
+        conflicts = []
+        for op, args in events:
+            if op in _PAIR_OPS:
+                touched = args[0] in self._members or args[1] in self._books
+            elif op in _BOOK_OPS:
+                touched = args[0] in self._books
+            elif op in _MEMBER_OPS:
+                touched = args[0] in self._members
+            else:
+                touched = True  # e.g. "reset": everything changed
+            if touched:
+                conflicts.append((op, ", ".join(map(str, args[:2]))))
+        if conflicts:
+            raise TransactionConflict(conflicts)
+
+    def _check_invariants(self) -> Dict[str, int]:
+        taken: Dict[str, int] = {}  # isbn -> copies borrowed - returned
+        added: Dict[str, int] = {}  # member_id -> loans borrowed - returned
+        for (member_id, isbn), n in self._loans.items():
+            taken[isbn] = taken.get(isbn, 0) + n
+            added[member_id] = added.get(member_id, 0) + n
+        for member_id, _ in self._claimed:
+            added[member_id] -= 1  # the hold becomes the loan
+        reasons = []
+        for isbn in sorted(self._changed):
+            book = self._books[isbn]
+            if book["genre"] not in GENRES:
+                reasons.append(("invalid_genre", isbn))
+            if book["available_copies"] < 0:  # copies set aside for holds are not available
+                reasons.append(("total_below_on_loan" if isbn in self._resized else "no_copies", isbn))
+        for member_id in sorted(added):
+            if added[member_id] > 0 and \
+                    _ledger.loan_count(member_id) + _holds.hold_count(member_id) + added[member_id] > MAX_BORROW:
+                reasons.append(("borrow_limit", member_id))
+        if reasons:
+            raise TransactionError(reasons)
+        return taken
+
+    def _apply(self, op: str, args: tuple, kwargs: Dict) -> None:
+        # the checks passed, so each op goes through as staged
+        if op == "add_book":
+            _put_book(*args)
+        elif op == "update_book":
+            _change_book(args[0], kwargs)
+        elif op == "add_member":
+            members.append({"member_id": args[0], "name": args[1], "email": args[2], "borrowed_books": []})
+        elif op == "update_member":
+            _change_member(members.get(args[0]), kwargs)
+        elif op == "borrow_book":
+            member_id, isbn = args
+            _lend(members.get(member_id), isbn, kwargs["at"], _holds.status(member_id, isbn))
+        else:  # return_book
+            member_id, isbn = args
+            _ledger.remove(members.get(member_id), isbn)
+            books[isbn]["available_copies"] += 1
+
+@contextmanager
+def transaction() -> Iterator[Transaction]:
+    """Stage changes on the yielded Transaction; they are committed when the block ends.
+
+    An exception in the block (or tx.rollback()) discards them. The
+    commit raises TransactionError if the result would break a rule
+    (err.reasons says which) and TransactionConflict if another change
+    got in first; either way nothing is applied.
+    """
+    tx = Transaction()
+    try:
+        yield tx
+    except BaseException:
+        tx.rollback()
+        raise
+    if not tx.closed:
+        tx.commit()
+
+@instrumented
+def run_transaction(steps: Iterable[list]) -> List[bool]:
+    """Run [op, args, kwargs] steps (op: a Transaction method) as one transaction.
+
+    Returns one bool per step. If any step fails, nothing is applied (as
+    with atomic borrow_many). The commit can raise as in transaction().
+    """
+    with transaction() as tx:
+        results = []
+        for op, args, *kwargs in steps:
+            if op not in _TRANSACTION_OPS:
+                raise ValueError(f"unknown transaction op {op!r}")
+            results.append(getattr(tx, op)(*args, **(kwargs[0] if kwargs else {})))
+        if not all(results):
+            tx.rollback()
+    return results
+
+_TRANSACTION_OPS = frozenset({"add_book", "update_book", "add_member", "update_member",
+                              "borrow_book", "return_book"})
+
+# ---------- Recommendations ----------
+# "Members who borrowed this also borrowed": every borrow adds to the loan
+# history (a member borrowing the same book again changes nothing), and
+# with it the count of members who borrowed both, for each pair of books
+# (see CoBorrowIndex in recommend.py). Members' current loans count as
+# history from the start; older loans can be added with add_loan_history.
+
+@instrumented
+def related_books(isbn: str, limit: int = 10) -> List[Dict]:
+    """The books most members who borrowed isbn also borrowed, most shared first.
+
+    Each row has "co_borrowers", the number of members who borrowed both.
+    """
+    if limit <= 0:
+        raise ValueError("limit must be positive")
+    k = limit
+    while True:
+        related = _history.related(isbn, k)
+        rows = []
+        for other, count in related:
+            try:
+                row = books.record(other)
+            except KeyError:
+                continue  # deleted since it was borrowed
+            row["isbn"] = other
+            row["co_borrowers"] = count
+            rows.append(row)
+            if len(rows) == limit:
+                return rows
+        if len(related) < k:
+            return rows
+        k *= 4
+
+@instrumented
+def add_loan_history(pairs: Iterable[Tuple[str, str]]) -> int:
+    """Add past (member_id, isbn) loans in bulk; returns how many were new.
+
+    The members and books need not exist any more. The co-borrowing
+    counts are rebuilt once at the end, which is much faster than
+    borrowing them one by one.
+    """
+    pairs = [(member_id, isbn) for member_id, isbn in pairs]
+    added = _history.load(pairs)
+    if added:
+        _log("add_loan_history", pairs)
+    return added
+
+def loan_history(member_id: str) -> List[str]:
+    """Every ISBN a member has borrowed, in the order first borrowed."""
+    return _history.history_of(member_id)
+
+def rebuild_recommendations() -> Dict:
+    """Recompute the co-borrowing counts from the loan history; returns their stats."""
+    start = time.perf_counter()
+    _history.rebuild()
+    return dict(_history.stats(), seconds=time.perf_counter() - start)
+
+# ---------- Change feed ----------
+# Every successful change above is also published as an event with a
+# sequence number, in the same form as a log record ({"seq", "time",
+# "op", "args", "kwargs"}), so other services can sync incrementally
+# instead of rescanning the catalogue. An "op": "reset" event means the
+# whole state was replaced (a snapshot was loaded): start over from a
+# full read. Only the last 65,536 events are kept; asking for older
+# ones raises ChangeFeedGap (also a full resync).
+
+@instrumented
+def changes(after: Optional[int] = None, limit: int = 1000) -> Dict:
+    """Events after sequence number `after`, as {"events": [...], "next": seq}.
+
+    Pass "next" back as after to get the following events. With
+    after=None nothing is returned, only the current position.
+    """
+    if after is None:
+        return {"events": [], "next": _feed.last_seq}
+    events = _feed.read(after, limit)
+    return {"events": events, "next": events[-1]["seq"] if events else after}
+
+def subscribe(after: Optional[int] = None, batch_size: int = 100) -> Subscription:
+    """Tail the change feed in this process from `after` (None: from now).
+
+    poll() on the result waits for and returns the next batch of up to
+    batch_size events. Changes wait (up to a second each) for an open
+    subscription that has fallen a whole buffer behind, so keep polling
+    it, and close() it when done.
+    """
+    return _feed.subscribe(after, batch_size)
+
+def change_feed_stats() -> Dict:
+    return _feed.stats()
+
+# ---------- Persistent storage ----------
+# open_storage() makes every successful change above go through a
+# write-ahead log in `directory`. On open, the last snapshot and the log
+# after it are replayed, so a restart picks up where the process stopped.
+
+_checkpointer: Optional[threading.Thread] = None
+
+@contextmanager
+def _quiesced() -> Iterator[None]:
+    # every stripe in the usual order: no operation can be half applied
+    with _member_locks.locked_every(), _book_locks.locked_every():
+        yield
+
+def _dump_state() -> Dict:
+    return {
+        "books": {isbn: books.record(isbn) for isbn in books},
+        "members": [dict(m.copy(), borrowed_books=list(m["borrowed_books"])) for m in members],
+        "holds": _holds.dump(),
+        "loans": _ledger.dump_due(),
+        "history": _history.dump(),
+    }
+
+def _load_state(state: Dict) -> None:
+    books.clear()
+    for isbn, record in state["books"].items():
+        books[isbn] = record
+    members.clear()
+    for record in state["members"]:
+        members.append(record)
+    _ledger.load_due(state.get("loans", []))
+    _holds.load(state.get("holds", []))
+    _history.load((member_id, isbn) for member_id, isbns in state.get("history", []) for isbn in isbns)
+    _rebuild_indexes()
+    _feed.publish("reset", ())
+
+_REPLAY = {
+    "add_book": add_book, "update_book": update_book, "delete_book": delete_book,
+    "add_member": add_member, "update_member": update_member, "delete_member": delete_member,
+    "borrow_book": borrow_book, "return_book": return_book, "renew_loan": renew_loan,
+    "place_hold": place_hold, "cancel_hold": cancel_hold, "expire_hold": _expire_hold,
+    "hold_ready": _hold_ready,
+    "transaction": run_transaction, "add_loan_history": add_loan_history,
+}
+
+def open_storage(directory: str, fsync: str = "batch", checkpoint_every: int = 100_000,
+                 **wal_options) -> int:
+    """Recover state from directory and log all changes there from now on.
+
+    If the directory has no snapshot yet, the current in-memory data is
+    saved as the first one. Returns the number of log records replayed.
+    """
+    global _wal, _checkpointer, _replaying
+    close_storage()
+    lsn, state = read_snapshot(directory)
+    if state:
+        with _quiesced():
+            _load_state(state)
+    replayed = 0
+    _replaying = True
+    try:
+        for record in read_log(directory, after_lsn=lsn):
+            _REPLAY[record["op"]](*record["args"], **record.get("kwargs", {}))
+            replayed += 1
+    finally:
+        _replaying = False
+    wal = WriteAheadLog(directory, fsync=fsync, checkpoint_every=checkpoint_every, **wal_options)
+    with _quiesced():
+        _wal = wal
+        if not state:
+            wal.checkpoint(_dump_state())
+    if checkpoint_every:
+        _checkpointer = threading.Thread(target=_checkpoint_loop, args=(wal,), daemon=True)
+        _checkpointer.start()
+    return replayed
+
+def checkpoint() -> int:
+    """Snapshot the current state and truncate the log; returns the lsn."""
+    with _quiesced():
+        if _wal is None:
+            raise RuntimeError("storage is not open")
+        return _wal.checkpoint(_dump_state())
+
+def close_storage() -> None:
+    """Flush the log and go back to in-memory only operation."""
+    global _wal, _checkpointer
+    with _quiesced():
+        wal, _wal = _wal, None
+    if _checkpointer is not None:
+        _checkpointer.join()
+        _checkpointer = None
+    if wal is not None:
+        wal.close()
+
+def _checkpoint_loop(wal: WriteAheadLog) -> None:
+    while _wal is wal:
+        if wal.checkpoint_due.wait(0.1):
+            with _quiesced():
+                if _wal is wal:
+                    wal.checkpoint(_dump_state())
+
+# ---------- Binary snapshots ----------
+# A binary snapshot (see mmap_snapshot.py) can be opened lazily: the file
+# is memory-mapped and books/members are only decoded when first used,
+# so a large catalogue is ready to serve in milliseconds.
+
+def export_snapshot(path: str) -> None:
+    """Write all books and members to a binary snapshot file (holds are not included)."""
+    with _quiesced():
+        write_snapshot(path, books, members, _holds.ready_counts())
+
+def import_snapshot(path: str, lazy: bool = True) -> None:
+    """Replace all books and members with the contents of a snapshot.
+
+    Snapshots hold no loan history: afterwards it has the snapshot's
+    current loans only, and related_books() counts just those.
 
+    With lazy=False, or with a store that cannot serve from a mapped file
+    (SQLite), every record is copied in and the file is closed again.
+    """
+    snapshot = MappedSnapshot(path)
+    with _quiesced():
+        if lazy and hasattr(books, "attach"):
+            books.attach(snapshot)
+            members.attach(snapshot)
+            _search_index.clear()  # the snapshot carries its own term index
+            _query_cache.clear()
+            _feed.publish("reset", ())
+            return
+        try:
+            _load_state({"books": dict(snapshot.books()), "members": list(snapshot.members())})
+        finally:
+            snapshot.close()
@@ -0,0 +1,125 @@
+# query_cache.py
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Optional, Set, Tuple
+
+from search_index import tokenize
+
+
+def normalize(query: str) -> str:
+    """Cache key of a query: its distinct terms, sorted ("Night  river" == "river night")."""
+    return " ".join(sorted(set(tokenize(query))))
+
+
+def _matches(query_terms: Tuple[str, ...], book_terms: FrozenSet[str]) -> bool:
+    # same rule as SearchIndex.search(prefix=True)
+    return all(any(term.startswith(q) for term in book_terms) for q in query_terms)
+
+
+class QueryCache:
+    """Bounded LRU cache of normalized query -> sorted tuple of ISBNs.
+
+    Only the ISBNs are cached; callers read the books themselves, so
+    copy counts are always current. invalidate() is told the old and new
+    terms of a changed book and drops exactly the cached queries whose
+    result that change adds the book to or removes it from. Entries
+    older than `ttl` seconds (None: no limit) count as misses.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[Tuple[str, ...], float]]" = OrderedDict()
+        self._by_term: Dict[str, Set[str]] = {}  # query term -> cached keys using it
+        # bumped by every change; a result computed before a change is not stored
+        self.generation = 0
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Tuple[str, ...]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[1] > self.ttl:
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, isbns: Tuple[str, ...], generation: int) -> None:
+        """Store a result computed when self.generation was `generation`."""
+        with self._lock:
+            if generation != self.generation or self.maxsize <= 0:
+                return
+            if key not in self._entries:
+                for term in key.split():
+                    self._by_term.setdefault(term, set()).add(key)
+            self._entries[key] = (isbns, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, old_terms: FrozenSet[str], new_terms: FrozenSet[str]) -> None:
+        """A book's terms went from old_terms to new_terms (empty: added/deleted)."""
+        changed = old_terms ^ new_terms
+        if not changed:
+            return
+        with self._lock:
+            self.generation += 1
+            # a query's result can only change if one of its terms is a
+            # prefix of a term the book gained or lost
+            candidates: Set[str] = set()
+            for term in changed:
+                for end in range(1, len(term) + 1):
+                    keys = self._by_term.get(term[:end])
+                    if keys:
+                        candidates |= keys
+            for key in candidates:
+                query_terms = tuple(key.split())
+                if _matches(query_terms, old_terms) != _matches(query_terms, new_terms):
+                    self._drop(key)
+                    self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._by_term.clear()
+
+    def resize(self, maxsize: int) -> None:
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._entries) > max(0, maxsize):
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _drop(self, key: str) -> None:
+        del self._entries[key]
+        for term in key.split():
+            keys = self._by_term[term]
+            keys.discard(key)
+            if not keys:
+                del self._by_term[term]
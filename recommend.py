@@ -0,0 +1,226 @@
+# recommend.py
+
+import heapq
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from itertools import chain, compress
+from typing import Dict, Iterable, List, Tuple
+
+from gcpause import gc_paused
+
+# rows at least this long keep their last ranking until they change
+RANKED_ROW = 1_000
+
+
+def _bump(row: Tuple[array, array], other: int) -> None:
+    # add one to a row's entry for other, inserting it if new
+    others, counts = row
+    i = bisect_left(others, other)
+    if i < len(others) and others[i] == other:
+        counts[i] += 1
+    else:
+        others.insert(i, other)
+        counts.insert(i, 1)
+
+
+class CoBorrowIndex:
+    """Loan history and the ISBN co-occurrence matrix built from it.
+
+    The history is the set of (member_id, isbn) pairs ever borrowed,
+    kept after the loan ends (and after the member is deleted). ISBNs
+    are interned to small ints, and each member's history is an
+    array('i') of them in the order first borrowed.
+
+    The matrix counts, for every two books, the members who borrowed
+    both. It is sparse and symmetric, stored as a dict of rows: book ->
+    (array of the other books' ids in ascending order, array of the
+    counts). A new pair bumps one entry in the rows of each book the
+    member borrowed before (a bisect, plus an insert when the entry is
+    new). related() takes the top k of one row; for the long rows of
+    popular books, the result is kept until the row next changes.
+
+    rebuild() recomputes every row from the history in bulk: each row is
+    one Counter over the histories of the book's borrowers, concatenated
+    (counted in C), turned into arrays with sorted() and map(). load()
+    adds historical loans that way: history first, matrix once.
+
+    Like HoldQueues this has a lock of its own. It is owned by the
+    member store.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self._ids: Dict[str, int] = {}  # isbn -> book id
+        self._isbns: List[str] = []     # book id -> isbn
+        self._history: Dict[str, array] = {}  # member_id -> ids of the books borrowed
+        self._readers = array("i")      # book id -> members who borrowed it
+        self._rows: Dict[int, Tuple[array, array]] = {}  # book id -> (other ids, counts)
+        self._ranked: Dict[int, Tuple[int, list]] = {}  # book id -> (k, related()) of long rows
+        self._pairs = 0  # (member, book) pairs in the history
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+
+    def __len__(self) -> int:
+        return self._pairs
+
+    def record(self, member_id: str, isbn: str) -> bool:
+        """Note a loan; False if the member had borrowed the book before."""
+        with self._lock:
+            new = self._add(member_id, isbn, True)
+        if new:
+            self._persist([(member_id, isbn)])
+        return new
+
+    def record_many(self, pairs: Iterable[Tuple[str, str]]) -> int:
+        """record() for several (member_id, isbn) pairs; returns how many were new."""
+        with self._lock:
+            new = [pair for pair in pairs if self._add(*pair, True)]
+        if new:
+            self._persist(new)
+        return len(new)
+
+    def load(self, pairs: Iterable[Tuple[str, str]]) -> int:
+        """Add historical loans in bulk, then rebuild the matrix once; returns the new pairs."""
+        new = self._load(pairs)
+        if new:
+            self._persist(new)
+        return len(new)
+
+    def _load(self, pairs: Iterable[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        with self._lock, gc_paused():
+            new = []
+            histories = self._history
+            started = set()  # members with no history before: nothing to check against
+            for member_id, isbn in dict.fromkeys(pairs):  # repeats dropped, in order
+                book = self._ids.get(isbn)
+                if book is None:
+                    book = self._book(isbn)
+                history = histories.get(member_id)
+                if history is None:
+                    histories[member_id] = array("i", (book,))
+                    started.add(member_id)
+                elif member_id in started or book not in history:
+                    history.append(book)
+                else:
+                    continue
+                new.append((member_id, isbn))
+            self._pairs += len(new)
+            self._rebuild()  # also counts the readers
+        return new
+
+    def rebuild(self) -> None:
+        """Recompute the whole matrix from the history."""
+        with self._lock, gc_paused():
+            self._rebuild()
+
+    def _persist(self, pairs: List[Tuple[str, str]]) -> None:
+        pass  # in memory only; see SQLiteCoBorrowIndex
+
+    def _book(self, isbn: str) -> int:
+        book = self._ids.get(isbn)
+        if book is None:
+            book = self._ids[isbn] = len(self._isbns)
+            self._isbns.append(isbn)
+            self._readers.append(0)
+        return book
+
+    def _add(self, member_id: str, isbn: str, incremental: bool) -> bool:
+        book = self._book(isbn)
+        history = self._history.get(member_id)
+        if history is None:
+            history = self._history[member_id] = array("i")
+        elif book in history:
+            return False
+        if incremental and history:
+            rows, ranked = self._rows, self._ranked
+            ranked.pop(book, None)
+            row = rows.get(book)
+            if row is None:
+                rows[book] = (array("i", sorted(history)), array("i", [1] * len(history)))
+            else:
+                for other in history:
+                    _bump(row, other)
+            for other in history:
+                row = rows.get(other)
+                if row is None:
+                    rows[other] = (array("i", (book,)), array("i", (1,)))
+                else:
+                    ranked.pop(other, None)
+                    _bump(row, book)
+        history.append(book)
+        self._readers[book] += 1
+        self._pairs += 1
+        return True
+
+    def _rebuild(self) -> None:
+        histories: List[List[array]] = [[] for _ in self._isbns]  # book -> its borrowers' histories
+        for history in self._history.values():
+            for book in history:
+                histories[book].append(history)
+        rows = {}
+        for book, borrowed in enumerate(histories):
+            counts = Counter(chain.from_iterable(borrowed))
+            del counts[book]
+            if counts:
+                others = array("i", sorted(counts))
+                rows[book] = (others, array("i", map(counts.__getitem__, others)))
+        self._rows = rows
+        self._ranked = {}
+        self._readers = array("i", map(len, histories))
+
+    def related(self, isbn: str, k: int = 10) -> List[Tuple[str, int]]:
+        """Up to k (isbn, members who borrowed both) pairs, the most shared first.
+
+        Books with the same count come in ISBN order.
+        """
+        with self._lock:
+            book = self._ids.get(isbn)
+            row = None if book is None else self._rows.get(book)
+            if row is None or k <= 0:
+                return []
+            ranked = self._ranked.get(book)
+            if ranked is not None and ranked[0] >= k:
+                return ranked[1][:k]
+            others, counts = row
+            isbns = self._isbns
+            best = heapq.nlargest(k, range(len(counts)), key=counts.__getitem__)
+            floor = counts[best[-1]]
+            top = sorted(((isbns[others[i]], counts[i]) for i in best if counts[i] > floor),
+                         key=lambda pair: (-pair[1], pair[0]))
+            # the last places may be tied with entries nlargest left out
+            tied = compress(others, map(floor.__eq__, counts))
+            result = top + [(other, floor) for other in
+                            heapq.nsmallest(k - len(top), map(isbns.__getitem__, tied))]
+            if len(others) >= RANKED_ROW:
+                self._ranked[book] = (k, result)
+            return result
+
+    def borrower_count(self, isbn: str) -> int:
+        """Members who have ever borrowed isbn."""
+        book = self._ids.get(isbn)
+        return 0 if book is None else self._readers[book]
+
+    def history_of(self, member_id: str) -> List[str]:
+        """ISBNs a member has ever borrowed, in the order first borrowed."""
+        with self._lock:
+            return [self._isbns[book] for book in self._history.get(member_id, ())]
+
+    def dump(self) -> List[list]:
+        """[member_id, [isbn, ...]] for every member with a history."""
+        with self._lock:
+            isbns = self._isbns
+            return [[member_id, [isbns[book] for book in history]]
+                    for member_id, history in self._history.items()]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries = sum(len(others) for others, _ in self._rows.values())
+            return {"members": len(self._history), "books": len(self._isbns), "loans": self._pairs,
+                    "entries": entries, "bytes": 8 * entries + 4 * self._pairs}
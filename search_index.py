@@ -0,0 +1,283 @@
+# search_index.py
+
+import heapq
+import re
+import threading
+from bisect import bisect_left, insort
+from typing import Dict, FrozenSet, List, Mapping, Optional, Set, Tuple
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# book fields that are searchable
+INDEXED_FIELDS = ("title", "author", "genre")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase alphanumeric terms."""
+    return _TOKEN.findall(text.lower())
+
+
+def record_terms(record) -> FrozenSet[str]:
+    """All search terms of a book record."""
+    # one pass over the fields joined by a separator that is never part of a term
+    return frozenset(tokenize(" ".join([str(record[field]) for field in INDEXED_FIELDS])))
+
+
+# ---------- fuzzy matching ----------
+# A misspelled query word is matched against the indexed terms within a
+# few edits of it (insert, delete, substitute, or swap two neighbours).
+# Candidates come from the trigrams of the terms: one edit changes at
+# most 4 of a word's padded trigrams, so a term within k edits shares
+# at least n - 4k of the n query trigrams. When that is 1 or more, the
+# term must be in one of the 4k + 1 query trigrams that have the fewest
+# terms, and only those few candidates get the edit distance computed.
+# When it is not (6 letters with 2 typos: "bacdfe" shares no trigram
+# with "abcdef"), every term of a length within k is a candidate. Searches allow no typo at
+# first, then one, then two per word, and stop as soon as they have
+# enough books: the looser passes could only add books ranked lower.
+
+def trigrams(term: str) -> FrozenSet[str]:
+    """Trigrams of a term padded with "$$" ("cat": $$c $ca cat at$ t$$)."""
+    padded = f"$${term}$$"
+    return frozenset([padded[i:i + 3] for i in range(len(padded) - 2)])
+
+
+def max_edits(term: str) -> int:
+    """Typos allowed in a query word: none up to 2 characters, 1 up to 5, then 2."""
+    return 0 if len(term) <= 2 else 1 if len(term) <= 5 else 2
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Edits from a to b (swapping neighbours counts as one); limit + 1 if over limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        row = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            cost = previous[j - 1] + (ca != cb)
+            if previous[j] + 1 < cost:
+                cost = previous[j] + 1
+            if row[j - 1] + 1 < cost:
+                cost = row[j - 1] + 1
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb and before[j - 2] + 1 < cost:
+                cost = before[j - 2] + 1
+            row[j] = cost
+        if min(row) > limit:
+            return limit + 1
+        before, previous = previous, row
+    return min(previous[-1], limit + 1)
+
+
+class TrigramIndex:
+    """Trigram -> terms, for finding the terms close to a misspelled one.
+
+    Not locked: SearchIndex updates and reads it under its own lock.
+    """
+
+    def __init__(self):
+        self._terms: Dict[str, Set[str]] = {}
+        self._lengths: Dict[int, Set[str]] = {}  # term length -> terms
+
+    def add(self, term: str) -> None:
+        for gram in trigrams(term):
+            terms = self._terms.get(gram)
+            if terms is None:
+                terms = self._terms[gram] = set()
+            terms.add(term)
+        self._lengths.setdefault(len(term), set()).add(term)
+
+    def remove(self, term: str) -> None:
+        for gram in trigrams(term):
+            terms = self._terms[gram]
+            terms.discard(term)
+            if not terms:
+                del self._terms[gram]
+        terms = self._lengths[len(term)]
+        terms.discard(term)
+        if not terms:
+            del self._lengths[len(term)]
+
+    def clear(self) -> None:
+        self._terms.clear()
+        self._lengths.clear()
+
+    def similar(self, term: str, edits: Optional[int] = None) -> Dict[str, int]:
+        """Indexed terms within `edits` (default max_edits(term)) of term -> their distance."""
+        if edits is None:
+            edits = max_edits(term)
+        grams = trigrams(term)
+        if edits == 0:
+            return {term: 0} if term in self._terms.get(f"$${term[:1]}", ()) else {}
+        need = len(grams) - 4 * edits  # trigrams a match shares at least
+        shortest, longest = len(term) - edits, len(term) + edits
+        candidates = set()
+        if need <= 0:  # a match may share no trigram at all
+            letters = set(term)
+            for length in range(shortest, longest + 1):
+                # each letter of term that a candidate lacks costs an edit
+                candidates.update(candidate for candidate in self._lengths.get(length, ())
+                                  if len(letters.difference(candidate)) <= edits)
+        else:
+            rarest = sorted(grams, key=lambda gram: len(self._terms.get(gram, ())))
+            for gram in rarest[:len(grams) - need + 1]:
+                candidates |= self._terms.get(gram, set())
+        close = {}
+        for candidate in candidates:
+            if not shortest <= len(candidate) <= longest:
+                continue
+            if need > 1 and len(trigrams(candidate) & grams) < need:
+                continue
+            distance = edit_distance(term, candidate, edits)
+            if distance <= edits:
+                close[candidate] = distance
+        return close
+
+
+def fuzzy_top(terms: Set[str], similar, postings: Mapping[str, Set[str]],
+              limit: int) -> List[Tuple[str, int]]:
+    """Top `limit` (isbn, typos) for query words, in passes of 0, 1, 2 typos per word.
+
+    similar(term, edits) gives the indexed terms close to a query word
+    and postings maps an indexed term to its ISBNs.
+    """
+    if limit <= 0:
+        return []
+    most = max(map(max_edits, terms), default=0)
+    for edits in range(most + 1):
+        top = rank_fuzzy([similar(term, min(edits, max_edits(term))) for term in terms],
+                         postings, limit)
+        if len(top) == limit and top[-1][1] <= edits:
+            break  # books with more typos would rank after these
+    return top
+
+
+def rank_fuzzy(matches: List[Dict[str, int]], postings: Mapping[str, Set[str]],
+               limit: int) -> List[Tuple[str, int]]:
+    """Top `limit` (isbn, typos) of the books with a close term for every query word.
+
+    matches has one {term: distance} per query word (see similar());
+    books with fewer typos in total come first, then by ISBN.
+    """
+    if not matches or not all(matches):
+        return []
+    # books by their typos so far (None: all of them), narrowed word by
+    # word with set operations
+    tiers: Dict[int, Optional[Set[str]]] = {0: None}
+    for close in matches:
+        word, seen = {}, set()
+        for distance in sorted(set(close.values())):
+            found = set().union(*[postings[term] for term, d in close.items() if d == distance])
+            word[distance] = found - seen
+            seen |= found
+        combined: Dict[int, Set[str]] = {}
+        for typos, books in tiers.items():
+            for distance, found in word.items():
+                both = found if books is None else books & found
+                if both:
+                    combined.setdefault(typos + distance, set()).update(both)
+        tiers = combined
+    top: List[Tuple[str, int]] = []
+    for typos in sorted(tiers):
+        top += [(isbn, typos) for isbn in heapq.nsmallest(limit - len(top), tiers[typos])]
+        if len(top) == limit:
+            break
+    return top
+
+
+class SearchIndex:
+    """Inverted index of title/author/genre terms to ISBN posting sets.
+
+    Queries are tokenized the same way as the records; every query term
+    must match (AND), and with prefix=True a query term also matches any
+    indexed term it is a prefix of ("pyth" finds "python"). fuzzy()
+    also finds terms with a typo or two, through a TrigramIndex of the
+    terms. All methods are thread-safe.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Set[str]] = {}
+        self._terms_of: Dict[str, FrozenSet[str]] = {}
+        self._sorted_terms: List[str] = []  # for prefix lookups
+        self._trigrams = TrigramIndex()  # for fuzzy lookups
+
+    def __len__(self) -> int:
+        return len(self._terms_of)
+
+    def __contains__(self, isbn: str) -> bool:
+        return isbn in self._terms_of
+
+    def add(self, isbn: str, record: Dict) -> FrozenSet[str]:
+        """Index a book, replacing any terms it was indexed under before.
+
+        Returns the book's new terms.
+        """
+        terms = record_terms(record)
+        with self._lock:
+            old = self._terms_of.get(isbn, frozenset())
+            for term in old - terms:
+                self._unpost(term, isbn)
+            for term in terms - old:
+                posting = self._postings.get(term)
+                if posting is None:
+                    posting = self._postings[term] = set()
+                    insort(self._sorted_terms, term)
+                    self._trigrams.add(term)
+                posting.add(isbn)
+            self._terms_of[isbn] = terms
+        return terms
+
+    def remove(self, isbn: str) -> None:
+        with self._lock:
+            for term in self._terms_of.pop(isbn, ()):
+                self._unpost(term, isbn)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._postings.clear()
+            self._terms_of.clear()
+            self._sorted_terms.clear()
+            self._trigrams.clear()
+
+    def terms_of(self, isbn: str) -> FrozenSet[str]:
+        return self._terms_of.get(isbn, frozenset())
+
+    def search(self, query: str, prefix: bool = True) -> Set[str]:
+        """Return the ISBNs matching every term of the query."""
+        terms = set(tokenize(query))
+        if not terms:
+            return set()
+        with self._lock:
+            postings = [self._match(term, prefix) for term in terms]
+            postings.sort(key=len)
+            result = set(postings[0])
+            for posting in postings[1:]:
+                result &= posting
+                if not result:
+                    break
+        return result
+
+    def fuzzy(self, query: str, limit: int = 10) -> List[Tuple[str, int]]:
+        """Top `limit` (isbn, typos) for the query, allowing max_edits() per word."""
+        terms = set(tokenize(query))
+        with self._lock:
+            return fuzzy_top(terms, self._trigrams.similar, self._postings, limit)
+
+    def _match(self, term: str, prefix: bool) -> Set[str]:
+        if not prefix:
+            return self._postings.get(term, set())
+        matched: Set[str] = set()
+        i = bisect_left(self._sorted_terms, term)
+        while i < len(self._sorted_terms) and self._sorted_terms[i].startswith(term):
+            matched |= self._postings[self._sorted_terms[i]]
+            i += 1
+        return matched
+
+    def _unpost(self, term: str, isbn: str) -> None:
+        posting = self._postings[term]
+        posting.discard(isbn)
+        if not posting:
+            del self._postings[term]
+            del self._sorted_terms[bisect_left(self._sorted_terms, term)]
+            self._trigrams.remove(term)
@@ -0,0 +1,167 @@
+# server.py
+
+import asyncio
+import json
+import sys
+from collections.abc import Mapping, Sequence
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import metrics
+import operations
+
+# Protocol: JSON lines over TCP. Each request is one line
+#   {"id": 7, "op": "borrow_book", "args": ["M001", "978-..."], "kwargs": {}}
+# and gets exactly one response line, in request order:
+#   {"id": 7, "result": true}   or   {"id": 7, "error": "..."}
+# Clients may pipeline: send many requests without waiting for replies.
+# {"op": "metrics"} returns the instrumentation snapshot (metrics.py).
+
+OPERATIONS: Dict[str, Callable] = {name: getattr(operations, name) for name in (
+    "add_book", "search_books", "search_page", "update_book", "delete_book",
+    "add_member", "find_member", "update_member", "delete_member",
+    "borrow_book", "return_book", "borrow_many", "return_many",
+    "count_books", "genre_counts", "add_books", "add_members", "changes", "fuzzy_search",
+    "place_hold", "cancel_hold", "member_holds", "hold_queue",
+    "renew_loan", "overdue_loans", "member_loans", "run_transaction", "related_books",
+)}
+OPERATIONS["metrics"] = metrics.snapshot
+
+MAX_LINE = 1 << 20   # longest request line accepted, in bytes
+MAX_BATCH = 64       # requests handed to the executor in one call
+MAX_PENDING = 1024   # queued requests per connection before reading pauses
+
+
+def _encode(value: Any) -> Any:
+    # member records and SQLite loan lists are mappings/sequences, not dict/list
+    if isinstance(value, Mapping):
+        return dict(value)
+    if isinstance(value, Sequence) and not isinstance(value, str):
+        return list(value)
+    raise TypeError(f"cannot encode {type(value).__name__}")
+
+
+def handle(line: bytes) -> bytes:
+    """Run one request line and return its response line."""
+    request_id = None
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ValueError("request must be a JSON object")
+        request_id = request.get("id")
+        op = OPERATIONS.get(request.get("op"))
+        if op is None:
+            raise ValueError(f"unknown operation {request.get('op')!r}")
+        response = {"id": request_id, "result": op(*request.get("args", ()),
+                                                   **request.get("kwargs", {}))}
+    except Exception as e:  # one bad request must not drop the connection
+        response = {"id": request_id, "error": f"{type(e).__name__}: {e}"}
+    return json.dumps(response, separators=(",", ":"), default=_encode).encode() + b"\n"
+
+
+def handle_batch(lines: List[bytes]) -> bytes:
+    return b"".join([handle(line) for line in lines])
+
+
+class _Connection(asyncio.Protocol):
+    """One client connection.
+
+    Complete lines are queued as they arrive. At most one batch per
+    connection runs on the executor at a time, which keeps responses in
+    request order; everything that queued up meanwhile goes in the next
+    batch, so a pipelining client costs one executor hop per batch rather
+    than per request.
+    """
+
+    def __init__(self, executor: Optional[Executor]):
+        self._executor = executor
+        self._transport: Optional[asyncio.Transport] = None
+        self._buffer = b""
+        self._pending: List[bytes] = []
+        self._running = False
+        self._reading = True
+        self._writing = True
+        self._eof = False
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        self._transport = transport
+
+    def data_received(self, data: bytes) -> None:
+        *lines, self._buffer = (self._buffer + data).split(b"\n")
+        if len(self._buffer) > MAX_LINE:
+            self._transport.close()
+            return
+        self._pending.extend(line for line in lines if line.strip())
+        if len(self._pending) >= MAX_PENDING and self._reading:
+            self._reading = False
+            self._transport.pause_reading()
+        self._next_batch()
+
+    def eof_received(self) -> bool:
+        self._eof = True
+        self._next_batch()
+        return True  # keep the transport open to send the remaining replies
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self._transport = None
+
+    def pause_writing(self) -> None:
+        self._writing = False
+
+    def resume_writing(self) -> None:
+        self._writing = True
+        self._next_batch()
+
+    def _next_batch(self) -> None:
+        if self._running or not self._writing or self._transport is None:
+            return
+        if not self._pending:
+            if self._eof:
+                self._transport.close()
+            return
+        batch = self._pending[:MAX_BATCH]
+        del self._pending[:MAX_BATCH]
+        self._running = True
+        future = asyncio.get_running_loop().run_in_executor(self._executor, handle_batch, batch)
+        future.add_done_callback(self._batch_done)
+
+    def _batch_done(self, future: asyncio.Future) -> None:
+        self._running = False
+        if self._transport is None:
+            return  # client went away
+        self._transport.write(future.result())
+        if not self._reading and len(self._pending) < MAX_PENDING // 2:
+            self._reading = True
+            self._transport.resume_reading()
+        self._next_batch()
+
+
+async def start_server(host: str = "127.0.0.1", port: int = 7878,
+                       executor: Optional[Executor] = None,
+                       backlog: int = 1024) -> asyncio.AbstractServer:
+    """Start serving the library on host:port (port 0 picks a free one).
+
+    The operations run on `executor` (default: the loop's default
+    executor), so a slow call such as an fsync, a SQLite write or a
+    contended lock never stalls the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.create_server(lambda: _Connection(executor), host, port, backlog=backlog)
+
+
+async def _main(host: str, port: int, workers: int = 4) -> None:
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=workers, thread_name_prefix="library"))
+    server = await start_server(host, port)
+    print("listening on %s:%d" % server.sockets[0].getsockname()[:2], flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    # python server.py [port] [host]
+    try:
+        asyncio.run(_main(sys.argv[2] if len(sys.argv) > 2 else "127.0.0.1",
+                          int(sys.argv[1]) if len(sys.argv) > 1 else 7878))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,332 @@
+# sharding.py
+
+import multiprocessing
+import os
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Sharded mode: books are split across worker processes by a stable hash
+# of the ISBN and members by a hash of the member_id. Each worker keeps
+# its part in its own in-memory stores and runs the usual functions from
+# operations.py on it, so search and bookkeeping use every core and the
+# catalogue is spread over several heaps.
+#
+# ShardedLibrary is the coordinator: it routes each call to the shard
+# that owns the key, and runs search_books on every shard in parallel
+# before merging the results. When a member and a book live on different
+# shards, a borrow runs in three steps:
+#   1. the member's shard reserves one of the member's MAX_BORROW slots
+#   2. the book's shard takes a copy (on failure the slot is released)
+#   3. the member's shard records the loan in place of the reservation
+# A return ends the loan on the member's shard and then gives the copy
+# back to the book's shard. Reservations count towards the limit, so
+# concurrent borrows by one member never go over it, and a book's
+# copies only go out once the member side has agreed. A member with a
+# reservation cannot be deleted until step 3 has run.
+#
+# Worker state lives only in memory; open_storage() is not available in
+# this mode. Sharded borrows and returns do not use holds, are not
+# published on a change feed and are not added to the loan history.
+
+BATCH = 10_000  # calls per message when loading in bulk
+
+
+def shard_of(key: str, shards: int) -> int:
+    """Shard that owns an ISBN or member_id (the same in every process)."""
+    return zlib.crc32(key.encode()) % shards
+
+
+# ---------- worker side ----------
+# Each worker handles one message at a time, so these steps need no
+# locks of their own. `ops` is the worker's operations module.
+
+def _handlers(ops) -> Dict:
+    books, members, ledger = ops.books, ops.members, ops.members.ledger
+    reserved: Dict[str, int] = {}  # member_id -> borrows between steps 1 and 3
+
+    def reserve(member_id: str) -> Optional[str]:
+        if member_id not in members:
+            return "unknown_member"
+        held = reserved.get(member_id, 0)
+        if ledger.loan_count(member_id) + held >= ops.MAX_BORROW:
+            return "borrow_limit"
+        reserved[member_id] = held + 1
+        return None
+
+    def release(member_id: str) -> None:
+        held = reserved.pop(member_id) - 1
+        if held:
+            reserved[member_id] = held
+
+    def take_copy(isbn: str) -> Optional[str]:
+        if isbn not in books:
+            return "unknown_isbn"
+        book = books[isbn]
+        if book["available_copies"] <= 0:
+            return "no_copies"
+        book["available_copies"] -= 1
+        return None
+
+    def record_loan(member_id: str, isbn: str) -> None:
+        release(member_id)
+        now = time.time()
+        ledger.add(members.get(member_id), isbn, now, now + ops.LOAN_SECONDS)
+
+    def end_loan(member_id: str, isbn: str) -> Optional[str]:
+        m = members.get(member_id)
+        if m is None:
+            return "unknown_member"
+        if not ledger.remove(m, isbn):
+            return "not_borrowed"
+        return None
+
+    def return_copy(isbn: str) -> None:
+        books[isbn]["available_copies"] += 1
+
+    def borrow_local(member_id: str, isbn: str) -> Optional[str]:
+        reason = reserve(member_id)
+        if reason is None:
+            reason = take_copy(isbn)
+            if reason is None:
+                record_loan(member_id, isbn)
+            else:
+                release(member_id)
+        return reason
+
+    def return_local(member_id: str, isbn: str) -> Optional[str]:
+        reason = end_loan(member_id, isbn)
+        if reason is None:
+            return_copy(isbn)
+        elif reason == "not_borrowed" and isbn not in books:
+            reason = "unknown_isbn"
+        return reason
+
+    def delete_book(isbn: str) -> bool:
+        # loans of this shard's books may be recorded on other shards,
+        # so look at the copy counters rather than the local ledger
+        if isbn in books and books[isbn]["available_copies"] < books[isbn]["total_copies"]:
+            return False
+        return ops.delete_book(isbn)
+
+    def delete_member(member_id: str) -> bool:
+        # a borrow between steps 1 and 3 has a copy out for them already
+        if reserved.get(member_id):
+            return False
+        return ops.delete_member(member_id)
+
+    def find_member(member_id: str) -> Optional[Dict]:
+        m = members.get(member_id)
+        return None if m is None else dict(m.copy(), borrowed_books=list(m["borrowed_books"]))
+
+    return {
+        "add_book": ops.add_book, "search_books": ops.search_books,
+        "update_book": ops.update_book, "delete_book": delete_book,
+        "count_books": ops.count_books,
+        "add_member": ops.add_member, "find_member": find_member,
+        "update_member": ops.update_member, "delete_member": delete_member,
+        "reserve": reserve, "release": release, "take_copy": take_copy,
+        "record_loan": record_loan, "end_loan": end_loan, "return_copy": return_copy,
+        "borrow_local": borrow_local, "return_local": return_local,
+    }
+
+
+def _worker_main(conn) -> None:
+    # imported here: the worker must get fresh in-memory stores, whatever
+    # backend the coordinator's process uses
+    import operations
+    operations.books.clear()  # drop the sample data
+    operations.members.clear()
+    handlers = _handlers(operations)
+    while True:
+        try:
+            calls = conn.recv()
+        except EOFError:
+            return
+        if calls is None:
+            return
+        try:
+            conn.send(("ok", [handlers[op](*args, **kwargs) for op, args, kwargs in calls]))
+        except Exception as exc:  # reported to the caller, the worker keeps going
+            conn.send(("error", exc))
+
+
+# ---------- coordinator ----------
+class ShardedLibrary:
+    """The library functions over `workers` shard processes.
+
+    Mirrors the book, member and borrow/return functions of
+    operations.py. Safe to use from several threads: each shard handles
+    one message at a time, and fan-out calls take the shards in order.
+    The workers are started with "spawn", so, as with any such
+    multiprocessing code, a script that creates one must do it under
+    `if __name__ == "__main__":`.
+    """
+
+    def __init__(self, workers: Optional[int] = None):
+        self.shards = workers or os.cpu_count() or 1
+        context = multiprocessing.get_context("spawn")
+        self._conns = []
+        self._procs = []
+        self._locks = [threading.Lock() for _ in range(self.shards)]
+        backend = os.environ.get("LIBRARY_BACKEND")
+        os.environ["LIBRARY_BACKEND"] = "memory"  # inherited by the workers as they start
+        try:
+            for _ in range(self.shards):
+                parent, child = context.Pipe()
+                process = context.Process(target=_worker_main, args=(child,), daemon=True)
+                process.start()
+                child.close()
+                self._conns.append(parent)
+                self._procs.append(process)
+        finally:
+            if backend is None:
+                del os.environ["LIBRARY_BACKEND"]
+            else:
+                os.environ["LIBRARY_BACKEND"] = backend
+
+    def close(self) -> None:
+        for conn, lock in zip(self._conns, self._locks):
+            with lock:
+                try:
+                    conn.send(None)
+                except OSError:
+                    pass
+                conn.close()
+        for process in self._procs:
+            process.join()
+
+    def __enter__(self) -> "ShardedLibrary":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # ---------- messaging ----------
+    def _call(self, shard: int, op: str, *args, **kwargs):
+        return self._send(shard, [(op, args, kwargs)])[0]
+
+    def _send(self, shard: int, calls: List[Tuple[str, tuple, Dict]]) -> List:
+        with self._locks[shard]:
+            self._conns[shard].send(calls)
+            return _unwrap(self._conns[shard].recv())
+
+    def _scatter(self, calls: Dict[int, List[Tuple[str, tuple, Dict]]]) -> Dict[int, List]:
+        # every shard works on its calls at the same time
+        shards = sorted(calls)
+        for shard in shards:
+            self._locks[shard].acquire()
+        try:
+            for shard in shards:
+                self._conns[shard].send(calls[shard])
+            replies = {shard: self._conns[shard].recv() for shard in shards}
+        finally:
+            for shard in shards:
+                self._locks[shard].release()
+        return {shard: _unwrap(reply) for shard, reply in replies.items()}
+
+    def _book_shard(self, isbn: str) -> int:
+        return shard_of(isbn, self.shards)
+
+    def _member_shard(self, member_id: str) -> int:
+        return shard_of(member_id, self.shards)
+
+    def _bulk(self, op: str, rows: Iterable[tuple], shard_of_row) -> List[bool]:
+        # route rows in batches, one message per shard per batch
+        results: List[bool] = []
+        batch: List[tuple] = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == BATCH:
+                results += self._bulk_batch(op, batch, shard_of_row)
+                batch = []
+        if batch:
+            results += self._bulk_batch(op, batch, shard_of_row)
+        return results
+
+    def _bulk_batch(self, op: str, rows: List[tuple], shard_of_row) -> List[bool]:
+        owners = [shard_of_row(row) for row in rows]
+        calls: Dict[int, List] = {}
+        for owner, row in zip(owners, rows):
+            calls.setdefault(owner, []).append((op, tuple(row), {}))
+        replies = {shard: iter(results) for shard, results in self._scatter(calls).items()}
+        return [next(replies[owner]) for owner in owners]
+
+    # ---------- books ----------
+    def add_book(self, isbn: str, title: str, author: str, genre: str, total_copies: int) -> bool:
+        return self._call(self._book_shard(isbn), "add_book", isbn, title, author, genre, total_copies)
+
+    def add_books(self, rows: Iterable[Tuple[str, str, str, str, int]]) -> List[bool]:
+        """add_book for many (isbn, title, author, genre, copies) rows."""
+        return self._bulk("add_book", rows, lambda row: self._book_shard(row[0]))
+
+    def search_books(self, query: str, mode: str = "index") -> List[Dict]:
+        """search_books on every shard at once, merged in ISBN order.
+
+        (Index results come back from each shard already in ISBN order,
+        which sort() merges in linear time.)
+        """
+        replies = self._scatter({shard: [("search_books", (query, mode), {})]
+                                 for shard in range(self.shards)})
+        results = [row for reply in replies.values() for row in reply[0]]
+        results.sort(key=lambda row: row["isbn"])
+        return results
+
+    def count_books(self, query: str = "", genre: Optional[str] = None,
+                    available: Optional[bool] = None) -> int:
+        replies = self._scatter({shard: [("count_books", (query, genre, available), {})]
+                                 for shard in range(self.shards)})
+        return sum(reply[0] for reply in replies.values())
+
+    def update_book(self, isbn: str, **kwargs) -> bool:
+        return self._call(self._book_shard(isbn), "update_book", isbn, **kwargs)
+
+    def delete_book(self, isbn: str) -> bool:
+        return self._call(self._book_shard(isbn), "delete_book", isbn)
+
+    # ---------- members ----------
+    def add_member(self, member_id: str, name: str, email: str) -> bool:
+        return self._call(self._member_shard(member_id), "add_member", member_id, name, email)
+
+    def add_members(self, rows: Iterable[Tuple[str, str, str]]) -> List[bool]:
+        """add_member for many (member_id, name, email) rows."""
+        return self._bulk("add_member", rows, lambda row: self._member_shard(row[0]))
+
+    def find_member(self, member_id: str) -> Optional[Dict]:
+        return self._call(self._member_shard(member_id), "find_member", member_id)
+
+    def update_member(self, member_id: str, **kwargs) -> bool:
+        return self._call(self._member_shard(member_id), "update_member", member_id, **kwargs)
+
+    def delete_member(self, member_id: str) -> bool:
+        return self._call(self._member_shard(member_id), "delete_member", member_id)
+
+    # ---------- borrow / return ----------
+    def borrow_book(self, member_id: str, isbn: str) -> bool:
+        member_shard, book_shard = self._member_shard(member_id), self._book_shard(isbn)
+        if member_shard == book_shard:
+            return self._call(member_shard, "borrow_local", member_id, isbn) is None
+        if self._call(member_shard, "reserve", member_id) is not None:
+            return False
+        if self._call(book_shard, "take_copy", isbn) is not None:
+            self._call(member_shard, "release", member_id)
+            return False
+        self._call(member_shard, "record_loan", member_id, isbn)
+        return True
+
+    def return_book(self, member_id: str, isbn: str) -> bool:
+        member_shard, book_shard = self._member_shard(member_id), self._book_shard(isbn)
+        if member_shard == book_shard:
+            return self._call(member_shard, "return_local", member_id, isbn) is None
+        if self._call(member_shard, "end_loan", member_id, isbn) is not None:
+            return False
+        self._call(book_shard, "return_copy", isbn)
+        return True
+
+
+def _unwrap(reply: Tuple[str, object]):
+    status, result = reply
+    if status == "error":
+        raise result
+    return result
@@ -0,0 +1,765 @@
+# sqlite_store.py
+
+import queue
+import sqlite3
+import threading
+from collections.abc import Mapping, MutableMapping, Sequence
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from holds import READY, WAITING
+from loans import Loan
+from recommend import CoBorrowIndex
+from search_index import edit_distance, fuzzy_top, record_terms, tokenize, trigrams
+from store import BOOK_FIELDS, BookView
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    isbn TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    author TEXT NOT NULL,
+    genre TEXT NOT NULL,
+    total_copies INTEGER NOT NULL,
+    available_copies INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS members (
+    member_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS loans (
+    loan_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    member_id TEXT NOT NULL,
+    isbn TEXT NOT NULL,
+    checkout REAL,
+    due REAL,  -- NULL for loans made before due dates were kept
+    renewals INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS loans_by_member ON loans (member_id, loan_id);
+CREATE INDEX IF NOT EXISTS loans_by_isbn ON loans (isbn);
+CREATE TABLE IF NOT EXISTS book_terms (
+    term TEXT NOT NULL,
+    isbn TEXT NOT NULL,
+    PRIMARY KEY (term, isbn)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS book_terms_by_isbn ON book_terms (isbn);
+CREATE TABLE IF NOT EXISTS term_grams (
+    gram TEXT NOT NULL,
+    term TEXT NOT NULL,  -- every distinct term of book_terms, under each of its trigrams
+    PRIMARY KEY (gram, term)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS books_by_genre ON books (genre, available_copies, total_copies);
+CREATE TABLE IF NOT EXISTS holds (
+    hold_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    isbn TEXT NOT NULL,
+    member_id TEXT NOT NULL,
+    ready_until REAL  -- pickup deadline; NULL while waiting
+);
+CREATE UNIQUE INDEX IF NOT EXISTS holds_by_member ON holds (member_id, isbn);
+CREATE INDEX IF NOT EXISTS holds_by_isbn ON holds (isbn, ready_until, hold_id);
+CREATE INDEX IF NOT EXISTS holds_by_deadline ON holds (ready_until) WHERE ready_until IS NOT NULL;
+CREATE TABLE IF NOT EXISTS loan_history (
+    member_id TEXT NOT NULL,
+    isbn TEXT NOT NULL,  -- every book the member has ever borrowed
+    PRIMARY KEY (member_id, isbn)
+) WITHOUT ROWID;
+"""
+
+# columns added since the first version of the schema, for older files
+UPGRADES = {"loans": (("checkout", "REAL"), ("due", "REAL"), ("renewals", "INTEGER NOT NULL DEFAULT 0"))}
+INDEXES = """
+CREATE INDEX IF NOT EXISTS loans_by_due ON loans (due, loan_id) WHERE due IS NOT NULL;
+"""
+
+MEMBER_FIELDS = ("member_id", "name", "email", "borrowed_books")
+
+
+class Database:
+    """A small pool of SQLite connections to one database file.
+
+    Statements use fixed SQL strings, so each connection's statement
+    cache reuses the prepared statements. Inside transaction() the
+    thread keeps one connection; outside it, every statement borrows a
+    connection just for that statement.
+    """
+
+    def __init__(self, path: str, pool_size: int = 4):
+        self.path = path
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._local = threading.local()
+        for _ in range(pool_size):
+            self._pool.put(self._connect())
+        with self.connection() as conn:
+            conn.executescript(SCHEMA)
+            for table, columns in UPGRADES.items():
+                present = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+                for column, kind in columns:
+                    if column not in present:
+                        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+            conn.executescript(INDEXES)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False,
+                               cached_statements=256, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            yield conn  # inside this thread's transaction
+            return
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """Run the block in one transaction (nested calls join the outer one)."""
+        if getattr(self._local, "conn", None) is not None:
+            yield
+            return
+        conn = self._pool.get()
+        self._local.conn = conn
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            self._local.conn = None
+            self._pool.put(conn)
+
+    def query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def execute(self, sql: str, params: tuple = ()) -> int:
+        with self.connection() as conn:
+            return conn.execute(sql, params).rowcount
+
+    def executemany(self, sql: str, rows: Iterable[tuple]) -> None:
+        with self.connection() as conn:
+            conn.executemany(sql, rows)
+
+    def close(self) -> None:
+        while not self._pool.empty():
+            self._pool.get().close()
+
+
+class SQLiteBookStore(MutableMapping):
+    """BookStore-compatible mapping over the books table."""
+
+    backing = None  # binary snapshots are loaded eagerly into the table
+    facets_ready = True
+
+    def __init__(self, db: Database):
+        self.db = db
+        self.search_index = SQLiteSearchIndex(db)
+        self.facets = SQLiteFacets(db)
+
+    def transaction(self):
+        return self.db.transaction()
+
+    def __len__(self) -> int:
+        return self.db.query("SELECT COUNT(*) FROM books")[0][0]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter([row[0] for row in self.db.query("SELECT isbn FROM books ORDER BY rowid")])
+
+    def __contains__(self, isbn) -> bool:
+        return bool(self.db.query("SELECT 1 FROM books WHERE isbn = ?", (isbn,)))
+
+    def __getitem__(self, isbn: str) -> BookView:
+        if isbn not in self:
+            raise KeyError(isbn)
+        return BookView(self, isbn)
+
+    def __setitem__(self, isbn: str, record: Mapping) -> None:
+        self.db.execute(
+            "INSERT INTO books (isbn, title, author, genre, total_copies, available_copies) "
+            "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (isbn) DO UPDATE SET title = excluded.title, "
+            "author = excluded.author, genre = excluded.genre, "
+            "total_copies = excluded.total_copies, available_copies = excluded.available_copies",
+            (isbn, *(record[field] for field in BOOK_FIELDS)))
+
+    def __delitem__(self, isbn: str) -> None:
+        if not self.db.execute("DELETE FROM books WHERE isbn = ?", (isbn,)):
+            raise KeyError(isbn)
+
+    def __repr__(self) -> str:
+        return f"SQLiteBookStore({self.db.path!r})"
+
+    def clear(self) -> None:
+        # like BookStore.clear, leaves the search index to operations.py,
+        # which needs a re-added ISBN's old terms to invalidate its cache
+        self.db.execute("DELETE FROM books")
+
+    def record(self, isbn: str) -> Dict:
+        rows = self.db.query("SELECT title, author, genre, total_copies, available_copies "
+                             "FROM books WHERE isbn = ?", (isbn,))
+        if not rows:
+            raise KeyError(isbn)
+        return dict(zip(BOOK_FIELDS, rows[0]))
+
+    def _get_field(self, isbn: str, key: str):
+        if key not in BOOK_FIELDS:
+            raise KeyError(key)
+        rows = self.db.query(f"SELECT {key} FROM books WHERE isbn = ?", (isbn,))
+        if not rows:
+            raise KeyError(isbn)
+        return rows[0][0]
+
+    def _set_field(self, isbn: str, key: str, value) -> None:
+        if key not in BOOK_FIELDS:
+            raise KeyError(key)
+        if key in ("total_copies", "available_copies"):
+            value = int(value)
+        if not self.db.execute(f"UPDATE books SET {key} = ? WHERE isbn = ?", (value, isbn)):
+            raise KeyError(isbn)
+
+
+class SQLiteFacets:
+    """FacetIndex-compatible queries over the books table.
+
+    The books_by_genre index covers genre, availability and copy counts,
+    so counts are answered from the index alone (a range scan per genre
+    rather than FacetIndex's constant-time lookups). The table is the
+    index, so there is nothing to add, remove or clear.
+    """
+
+    _WHERE = ("WHERE (?1 IS NULL OR genre = ?1) "
+              "AND (?2 IS NULL OR (available_copies > 0) = ?2)")
+
+    def __init__(self, db: Database):
+        self.db = db
+
+    def count(self, genre: Optional[str] = None, available: Optional[bool] = None) -> int:
+        return self.db.query("SELECT COUNT(*) FROM books " + self._WHERE, (genre, available))[0][0]
+
+    def isbns(self, genre: Optional[str] = None, available: Optional[bool] = None) -> Set[str]:
+        return {row[0] for row in self.db.query("SELECT isbn FROM books " + self._WHERE,
+                                                (genre, available))}
+
+    def filter(self, isbns: Iterable[str], genre: Optional[str] = None,
+               available: Optional[bool] = None) -> List[str]:
+        selected = self.isbns(genre, available)
+        return [isbn for isbn in isbns if isbn in selected]
+
+    def totals(self) -> Dict[str, Dict[str, int]]:
+        return {genre: {"books": n, "available_books": n_available,
+                        "total_copies": total, "available_copies": available}
+                for genre, n, n_available, total, available in self.db.query(
+                    "SELECT genre, COUNT(*), SUM(available_copies > 0), SUM(total_copies), "
+                    "SUM(available_copies) FROM books GROUP BY genre")}
+
+
+class SQLiteSearchIndex:
+    """SearchIndex-compatible term index kept in the book_terms table.
+
+    The trigrams of the distinct terms, for fuzzy(), are in term_grams.
+    """
+
+    def __init__(self, db: Database):
+        self.db = db
+        with db.transaction():
+            if (not db.query("SELECT 1 FROM term_grams LIMIT 1")
+                    and db.query("SELECT 1 FROM book_terms LIMIT 1")):
+                # a database from before fuzzy search
+                self._add_grams(row[0] for row in db.query("SELECT DISTINCT term FROM book_terms"))
+
+    def __len__(self) -> int:
+        return self.db.query("SELECT COUNT(DISTINCT isbn) FROM book_terms")[0][0]
+
+    def __contains__(self, isbn: str) -> bool:
+        return bool(self.db.query("SELECT 1 FROM book_terms WHERE isbn = ? LIMIT 1", (isbn,)))
+
+    def add(self, isbn: str, record: Mapping) -> frozenset:
+        terms = record_terms(record)
+        with self.db.transaction():
+            old = self.terms_of(isbn)
+            self.db.execute("DELETE FROM book_terms WHERE isbn = ?", (isbn,))
+            self._drop_unused(old - terms)
+            self._add_grams(terms - old - self._known(terms - old))
+            self.db.executemany("INSERT INTO book_terms (term, isbn) VALUES (?, ?)",
+                                ((term, isbn) for term in terms))
+        return terms
+
+    def remove(self, isbn: str) -> None:
+        with self.db.transaction():
+            old = self.terms_of(isbn)
+            self.db.execute("DELETE FROM book_terms WHERE isbn = ?", (isbn,))
+            self._drop_unused(old)
+
+    def clear(self) -> None:
+        with self.db.transaction():
+            self.db.execute("DELETE FROM book_terms")
+            self.db.execute("DELETE FROM term_grams")
+
+    def terms_of(self, isbn: str) -> frozenset:
+        return frozenset(row[0] for row in self.db.query(
+            "SELECT term FROM book_terms WHERE isbn = ?", (isbn,)))
+
+    def search(self, query: str, prefix: bool = True) -> Set[str]:
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            return set()
+        if prefix:
+            # \U0010ffff sorts after any continuation of the prefix
+            part = "SELECT isbn FROM book_terms WHERE term >= ? AND term < ?"
+            params = tuple(p for term in terms for p in (term, term + "\U0010ffff"))
+        else:
+            part = "SELECT isbn FROM book_terms WHERE term = ?"
+            params = tuple(terms)
+        sql = " INTERSECT ".join([part] * len(terms))
+        return {row[0] for row in self.db.query(sql, params)}
+
+    def fuzzy(self, query: str, limit: int = 10) -> List[Tuple[str, int]]:
+        """Same as SearchIndex.fuzzy, with the trigram count filter done in SQL."""
+        return fuzzy_top(set(tokenize(query)), self._similar, _Postings(self.db), limit)
+
+    def _similar(self, term: str, edits: int) -> Dict[str, int]:
+        if edits == 0:
+            return {term: 0} if self._known({term}) else {}
+        grams = sorted(trigrams(term))
+        need = len(grams) - 4 * edits  # see search_index: a match may share no trigram if <= 0
+        if need <= 0:
+            # every term has exactly one "$$x" gram, so this reads each term once
+            rows = self.db.query(
+                "SELECT term FROM term_grams WHERE gram >= '$$' AND gram < '$%' "
+                "AND length(term) BETWEEN ? AND ?", (len(term) - edits, len(term) + edits))
+        else:
+            rows = self.db.query(
+                f"SELECT term FROM term_grams WHERE gram IN ({', '.join('?' * len(grams))}) "
+                "AND length(term) BETWEEN ? AND ? GROUP BY term HAVING COUNT(*) >= ?",
+                tuple(grams) + (len(term) - edits, len(term) + edits, need))
+        letters = set(term)
+        close = {}
+        for (candidate,) in rows:
+            if len(letters.difference(candidate)) > edits:
+                continue  # each letter of term that candidate lacks costs an edit
+            distance = edit_distance(term, candidate, edits)
+            if distance <= edits:
+                close[candidate] = distance
+        return close
+
+    def _known(self, terms: Set[str]) -> Set[str]:
+        # the terms some book already has
+        if not terms:
+            return set()
+        terms = sorted(terms)
+        return {row[0] for row in self.db.query(
+            f"SELECT DISTINCT term FROM book_terms WHERE term IN ({', '.join('?' * len(terms))})",
+            tuple(terms))}
+
+    def _add_grams(self, terms: Iterable[str]) -> None:
+        self.db.executemany("INSERT OR IGNORE INTO term_grams (gram, term) VALUES (?, ?)",
+                            ((gram, term) for term in terms for gram in trigrams(term)))
+
+    def _drop_unused(self, terms: Set[str]) -> None:
+        # after a book lost these terms: those no other book has leave term_grams
+        unused = terms - self._known(terms)
+        self.db.executemany("DELETE FROM term_grams WHERE gram = ? AND term = ?",
+                            ((gram, term) for term in unused for gram in trigrams(term)))
+
+
+class _Postings(dict):
+    # term -> ISBNs of book_terms, read on first use
+    def __init__(self, db: Database):
+        super().__init__()
+        self.db = db
+
+    def __missing__(self, term: str) -> Set[str]:
+        isbns = self[term] = {row[0] for row in self.db.query(
+            "SELECT isbn FROM book_terms WHERE term = ?", (term,))}
+        return isbns
+
+
+class LoanList(Sequence):
+    """Live list of the ISBNs a member has on loan (the loans table)."""
+
+    def __init__(self, db: Database, member_id: str):
+        self.db = db
+        self.member_id = member_id
+
+    def _isbns(self) -> List[str]:
+        return [row[0] for row in self.db.query(
+            "SELECT isbn FROM loans WHERE member_id = ? ORDER BY loan_id", (self.member_id,))]
+
+    def __len__(self) -> int:
+        return self.db.query("SELECT COUNT(*) FROM loans WHERE member_id = ?", (self.member_id,))[0][0]
+
+    def __getitem__(self, index):
+        return self._isbns()[index]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._isbns())
+
+    def __contains__(self, isbn) -> bool:
+        return bool(self.db.query("SELECT 1 FROM loans WHERE member_id = ? AND isbn = ? LIMIT 1",
+                                  (self.member_id, isbn)))
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (list, tuple, LoanList)):
+            return self._isbns() == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return repr(self._isbns())
+
+    def count(self, isbn: str) -> int:
+        return self.db.query("SELECT COUNT(*) FROM loans WHERE member_id = ? AND isbn = ?",
+                             (self.member_id, isbn))[0][0]
+
+    def copy(self) -> List[str]:
+        return self._isbns()
+
+    def append(self, isbn: str) -> None:
+        self.db.execute("INSERT INTO loans (member_id, isbn) VALUES (?, ?)", (self.member_id, isbn))
+
+    def remove(self, isbn: str) -> None:
+        # oldest loan of that ISBN first, like list.remove
+        if not self.db.execute(
+                "DELETE FROM loans WHERE loan_id = (SELECT MIN(loan_id) FROM loans "
+                "WHERE member_id = ? AND isbn = ?)", (self.member_id, isbn)):
+            raise ValueError(f"{isbn!r} is not on loan to {self.member_id!r}")
+
+
+LOAN_COLUMNS = "loan_id, member_id, isbn, checkout, due, renewals"
+
+
+class SQLiteLoanLedger:
+    """LoanLedger-compatible view of the loans table.
+
+    The table is indexed by member and by ISBN, so every question is
+    one index lookup; track/untrack/clear are no-ops because the member
+    store already writes the rows.
+    """
+
+    def __init__(self, db: Database):
+        self.db = db
+
+    def add(self, member: Mapping, isbn: str, checkout: Optional[float] = None,
+            due: Optional[float] = None) -> None:
+        self.db.execute("INSERT INTO loans (member_id, isbn, checkout, due) VALUES (?, ?, ?, ?)",
+                        (member["member_id"], isbn, checkout, due))
+
+    def remove(self, member: Mapping, isbn: str) -> bool:
+        # undated copies first, then the one due first, as LoanLedger does
+        return bool(self.db.execute(
+            "DELETE FROM loans WHERE loan_id = (SELECT loan_id FROM loans WHERE member_id = ? "
+            "AND isbn = ? ORDER BY due IS NOT NULL, due, loan_id LIMIT 1)", (member["member_id"], isbn)))
+
+    def loan(self, member_id: str, isbn: str) -> Optional[Loan]:
+        rows = self.db.query(f"SELECT {LOAN_COLUMNS} FROM loans WHERE member_id = ? AND isbn = ? "
+                             "AND due IS NOT NULL ORDER BY due, loan_id LIMIT 1", (member_id, isbn))
+        return Loan(*rows[0]) if rows else None
+
+    def renew(self, member_id: str, isbn: str, due: float) -> Optional[Loan]:
+        with self.db.transaction():
+            rows = self.db.query("SELECT loan_id FROM loans WHERE member_id = ? AND isbn = ? "
+                                 "ORDER BY due IS NULL, due, loan_id LIMIT 1", (member_id, isbn))
+            if not rows:
+                return None
+            self.db.execute("UPDATE loans SET due = ?, renewals = renewals + 1 WHERE loan_id = ?",
+                            (due, rows[0][0]))
+            return Loan(*self.db.query(f"SELECT {LOAN_COLUMNS} FROM loans WHERE loan_id = ?",
+                                       (rows[0][0],))[0])
+
+    def dated_loans(self, member_id: str) -> List[Loan]:
+        return [Loan(*row) for row in self.db.query(
+            f"SELECT {LOAN_COLUMNS} FROM loans WHERE member_id = ? AND due IS NOT NULL "
+            "ORDER BY due, loan_id", (member_id,))]
+
+    def overdue(self, now: float, limit: Optional[int] = None) -> List[Loan]:
+        return [Loan(*row) for row in self.db.query(
+            f"SELECT {LOAN_COLUMNS} FROM loans WHERE due IS NOT NULL AND due < ? "
+            "ORDER BY due, loan_id LIMIT ?", (now, -1 if limit is None else limit))]
+
+    def iter_overdue(self, now: float, page: int = 10_000) -> Iterator[Loan]:
+        # keyset pages over the due index; no connection is held in between
+        after = (float("-inf"), 0)
+        while True:
+            rows = self.db.query(
+                f"SELECT {LOAN_COLUMNS} FROM loans WHERE due IS NOT NULL AND due < ? "
+                "AND (due > ? OR (due = ? AND loan_id > ?)) ORDER BY due, loan_id LIMIT ?",
+                (now, after[0], after[0], after[1], page))
+            for row in rows:
+                yield Loan(*row)
+            if len(rows) < page:
+                return
+            after = (rows[-1][4], rows[-1][0])
+
+    def dump_due(self) -> List[list]:
+        return [list(row) for row in self.db.query(
+            "SELECT member_id, isbn, checkout, due, renewals FROM loans WHERE due IS NOT NULL")]
+
+    def load_due(self, rows: Iterable[list]) -> None:
+        for member_id, isbn, checkout, due, renewals in rows:
+            self.db.execute(
+                "UPDATE loans SET checkout = ?, due = ?, renewals = ? WHERE loan_id = (SELECT "
+                "MIN(loan_id) FROM loans WHERE member_id = ? AND isbn = ? AND due IS NULL)",
+                (checkout, due, renewals, member_id, isbn))
+
+    def loan_count(self, member_id: str) -> int:
+        return self.db.query("SELECT COUNT(*) FROM loans WHERE member_id = ?", (member_id,))[0][0]
+
+    def copies_out(self, isbn: str) -> int:
+        return self.db.query("SELECT COUNT(*) FROM loans WHERE isbn = ?", (isbn,))[0][0]
+
+    def held(self, member_id: str, isbn: str) -> int:
+        return self.db.query("SELECT COUNT(*) FROM loans WHERE member_id = ? AND isbn = ?",
+                             (member_id, isbn))[0][0]
+
+    def borrowers(self, isbn: str) -> Dict[str, int]:
+        return dict(self.db.query(
+            "SELECT member_id, COUNT(*) FROM loans WHERE isbn = ? GROUP BY member_id", (isbn,)))
+
+    def loans_of(self, member_id: str) -> Dict[str, int]:
+        return dict(self.db.query(
+            "SELECT isbn, COUNT(*) FROM loans WHERE member_id = ? GROUP BY isbn", (member_id,)))
+
+    def track(self, member_id: str, isbns: Iterable[str]) -> None:
+        pass
+
+    def untrack(self, member_id: str) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+
+class SQLiteHoldQueues:
+    """HoldQueues-compatible view of the holds table.
+
+    A queue is the waiting rows of an ISBN in hold_id order, and the
+    partial index on ready_until stands in for the deadline heap.
+    """
+
+    def __init__(self, db: Database):
+        self.db = db
+
+    def clear(self) -> None:
+        self.db.execute("DELETE FROM holds")
+
+    def place(self, member_id: str, isbn: str) -> None:
+        self.db.execute("INSERT INTO holds (isbn, member_id) VALUES (?, ?)", (isbn, member_id))
+
+    def cancel(self, member_id: str, isbn: str) -> Optional[str]:
+        with self.db.transaction():
+            state = self.status(member_id, isbn)
+            if state is not None:
+                self.db.execute("DELETE FROM holds WHERE member_id = ? AND isbn = ?", (member_id, isbn))
+            return state
+
+    def allocate(self, isbn: str, deadline: float) -> Optional[str]:
+        with self.db.transaction():
+            rows = self.db.query("SELECT hold_id, member_id FROM holds WHERE isbn = ? "
+                                 "AND ready_until IS NULL ORDER BY hold_id LIMIT 1", (isbn,))
+            if not rows:
+                return None
+            self.db.execute("UPDATE holds SET ready_until = ? WHERE hold_id = ?", (deadline, rows[0][0]))
+            return rows[0][1]
+
+    def status(self, member_id: str, isbn: str) -> Optional[str]:
+        rows = self.db.query("SELECT ready_until FROM holds WHERE member_id = ? AND isbn = ?",
+                             (member_id, isbn))
+        if not rows:
+            return None
+        return WAITING if rows[0][0] is None else READY
+
+    def hold_count(self, member_id: str) -> int:
+        return self.db.query("SELECT COUNT(*) FROM holds WHERE member_id = ?", (member_id,))[0][0]
+
+    def holds_of(self, member_id: str) -> Dict[str, str]:
+        return {isbn: WAITING if deadline is None else READY for isbn, deadline in self.db.query(
+            "SELECT isbn, ready_until FROM holds WHERE member_id = ?", (member_id,))}
+
+    def queue(self, isbn: str) -> List[str]:
+        return [row[0] for row in self.db.query(
+            "SELECT member_id FROM holds WHERE isbn = ? AND ready_until IS NULL ORDER BY hold_id", (isbn,))]
+
+    def waiting_count(self, isbn: str) -> int:
+        return self.db.query("SELECT COUNT(*) FROM holds WHERE isbn = ? AND ready_until IS NULL",
+                             (isbn,))[0][0]
+
+    def ready_count(self, isbn: str) -> int:
+        return self.db.query("SELECT COUNT(*) FROM holds WHERE isbn = ? AND ready_until IS NOT NULL",
+                             (isbn,))[0][0]
+
+    def ready_counts(self) -> Dict[str, int]:
+        return dict(self.db.query("SELECT isbn, COUNT(*) FROM holds WHERE ready_until IS NOT NULL "
+                                  "GROUP BY isbn"))
+
+    def ready_for(self, isbn: str) -> Dict[str, float]:
+        return dict(self.db.query("SELECT member_id, ready_until FROM holds WHERE isbn = ? "
+                                  "AND ready_until IS NOT NULL", (isbn,)))
+
+    def deadline(self, member_id: str, isbn: str) -> Optional[float]:
+        rows = self.db.query("SELECT ready_until FROM holds WHERE member_id = ? AND isbn = ?",
+                             (member_id, isbn))
+        return rows[0][0] if rows else None
+
+    def next_deadline(self) -> Optional[float]:
+        return self.db.query("SELECT MIN(ready_until) FROM holds WHERE ready_until IS NOT NULL")[0][0]
+
+    def expired(self, now: float) -> List[Tuple[str, str]]:
+        return self.db.query("SELECT member_id, isbn FROM holds WHERE ready_until IS NOT NULL "
+                             "AND ready_until <= ? ORDER BY ready_until", (now,))
+
+    def dump(self) -> List[list]:
+        return [list(row) for row in self.db.query(
+            "SELECT isbn, member_id, ready_until FROM holds ORDER BY hold_id")]
+
+    def load(self, rows: List[list]) -> None:
+        self.db.executemany("INSERT INTO holds (isbn, member_id, ready_until) VALUES (?, ?, ?)",
+                            (tuple(row) for row in rows))
+
+
+class SQLiteMember(Mapping):
+    """Member-compatible record that reads and writes the members table."""
+
+    def __init__(self, db: Database, member_id: str):
+        self.db = db
+        self.member_id = member_id
+
+    def __getitem__(self, key: str):
+        if key == "member_id":
+            return self.member_id
+        if key == "borrowed_books":
+            return LoanList(self.db, self.member_id)
+        if key not in ("name", "email"):
+            raise KeyError(key)
+        rows = self.db.query(f"SELECT {key} FROM members WHERE member_id = ?", (self.member_id,))
+        if not rows:
+            raise KeyError(self.member_id)
+        return rows[0][0]
+
+    def __setitem__(self, key: str, value) -> None:
+        if key == "borrowed_books":
+            with self.db.transaction():
+                self.db.execute("DELETE FROM loans WHERE member_id = ?", (self.member_id,))
+                self.db.executemany("INSERT INTO loans (member_id, isbn) VALUES (?, ?)",
+                                    ((self.member_id, isbn) for isbn in value))
+        elif key in ("name", "email"):
+            self.db.execute(f"UPDATE members SET {key} = ? WHERE member_id = ?",
+                            (value, self.member_id))
+        else:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(MEMBER_FIELDS)
+
+    def __len__(self) -> int:
+        return len(MEMBER_FIELDS)
+
+    def __repr__(self) -> str:
+        return repr(self.copy())
+
+    def copy(self) -> Dict:
+        record = {key: self[key] for key in MEMBER_FIELDS}
+        record["borrowed_books"] = record["borrowed_books"].copy()
+        return record
+
+
+class SQLiteCoBorrowIndex(CoBorrowIndex):
+    """CoBorrowIndex whose history is also kept in the loan_history table.
+
+    The matrix itself stays in memory: it is rebuilt from the table
+    when the database is opened.
+    """
+
+    def __init__(self, db: Database):
+        super().__init__()
+        self.db = db
+        # loans made before the history was kept
+        db.execute("INSERT OR IGNORE INTO loan_history (member_id, isbn) SELECT member_id, isbn FROM loans")
+        self._load(db.query("SELECT member_id, isbn FROM loan_history"))
+
+    def _persist(self, pairs: List[Tuple[str, str]]) -> None:
+        self.db.executemany("INSERT OR IGNORE INTO loan_history (member_id, isbn) VALUES (?, ?)", pairs)
+
+    def clear(self) -> None:
+        self.db.execute("DELETE FROM loan_history")
+        super().clear()
+
+
+class SQLiteMemberStore:
+    """MemberStore-compatible store over the members and loans tables."""
+
+    backing = None
+
+    def __init__(self, db: Database):
+        self.db = db
+        self.ledger = SQLiteLoanLedger(db)
+        self.holds = SQLiteHoldQueues(db)
+        self.history = SQLiteCoBorrowIndex(db)
+
+    def __len__(self) -> int:
+        return self.db.query("SELECT COUNT(*) FROM members")[0][0]
+
+    def __iter__(self) -> Iterator[SQLiteMember]:
+        return iter([SQLiteMember(self.db, row[0]) for row in
+                     self.db.query("SELECT member_id FROM members ORDER BY rowid")])
+
+    def __contains__(self, member_id: str) -> bool:
+        return bool(self.db.query("SELECT 1 FROM members WHERE member_id = ?", (member_id,)))
+
+    def __getitem__(self, index: int) -> SQLiteMember:
+        size = len(self)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("member index out of range")
+        rows = self.db.query("SELECT member_id FROM members ORDER BY rowid LIMIT 1 OFFSET ?", (index,))
+        return SQLiteMember(self.db, rows[0][0])
+
+    def __repr__(self) -> str:
+        return f"SQLiteMemberStore({self.db.path!r})"
+
+    def get(self, member_id: str) -> Optional[SQLiteMember]:
+        return SQLiteMember(self.db, member_id) if member_id in self else None
+
+    def append(self, member: Mapping) -> None:
+        try:
+            with self.db.transaction():
+                self.db.execute("INSERT INTO members (member_id, name, email) VALUES (?, ?, ?)",
+                                (member["member_id"], member["name"], member["email"]))
+                self.db.executemany("INSERT INTO loans (member_id, isbn) VALUES (?, ?)",
+                                    ((member["member_id"], isbn) for isbn in member["borrowed_books"]))
+                if member["borrowed_books"]:
+                    self.history.record_many((member["member_id"], isbn) for isbn in member["borrowed_books"])
+        except sqlite3.IntegrityError:
+            raise ValueError(f"duplicate member_id {member['member_id']!r}") from None
+
+    def delete(self, member_id: str) -> Optional[SQLiteMember]:
+        if member_id not in self:
+            return None
+        with self.db.transaction():
+            self.db.execute("DELETE FROM members WHERE member_id = ?", (member_id,))
+            self.db.execute("DELETE FROM loans WHERE member_id = ?", (member_id,))
+        return SQLiteMember(self.db, member_id)
+
+    def remove(self, member: Mapping) -> None:
+        if self.delete(member["member_id"]) is None:
+            raise ValueError("member not in store")
+
+    def clear(self) -> None:
+        with self.db.transaction():
+            self.db.execute("DELETE FROM members")
+            self.db.execute("DELETE FROM loans")
+            self.db.execute("DELETE FROM holds")
+            self.history.clear()
+
+
+def open_database(path: str, pool_size: int = 4) -> Tuple[SQLiteBookStore, SQLiteMemberStore]:
+    """Open (or create) a library database and return its book and member stores."""
+    db = Database(path, pool_size)
+    return SQLiteBookStore(db), SQLiteMemberStore(db)
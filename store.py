@@ -0,0 +1,503 @@
+# store.py
+
+import sys
+import threading
+from array import array
+from collections.abc import Mapping, MutableMapping
+from contextlib import nullcontext
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+from facets import FacetIndex, FacetValues
+from holds import HoldQueues
+from loans import LoanLedger
+from recommend import CoBorrowIndex
+
+# fields of a book record, in the order the old dicts used
+BOOK_FIELDS = ("title", "author", "genre", "total_copies", "available_copies")
+
+# copy counts are int32 columns (and int32 fields of binary snapshots)
+MAX_COPIES = 2 ** 31 - 1
+
+
+class Member(Mapping):
+    """Slotted member record with dict-style access (m["name"])."""
+
+    __slots__ = ("member_id", "name", "email", "borrowed_books")
+
+    def __init__(self, member_id: str, name: str, email: str, borrowed_books=None):
+        self.member_id = member_id
+        self.name = name
+        self.email = email
+        self.borrowed_books = list(borrowed_books or ())
+
+    @classmethod
+    def from_mapping(cls, record: Mapping) -> "Member":
+        if isinstance(record, cls):
+            return record
+        return cls(record["member_id"], record["name"], record["email"],
+                   record.get("borrowed_books"))
+
+    def __getitem__(self, key: str):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key: str, value) -> None:
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.__slots__)
+
+    def __len__(self) -> int:
+        return len(self.__slots__)
+
+    def __repr__(self) -> str:
+        return repr(self.copy())
+
+    def copy(self) -> Dict:
+        return {key: getattr(self, key) for key in self.__slots__}
+
+
+class MemberStore:
+    """Members keyed by member_id, iterated in insertion order.
+
+    Lookup, insert and delete by member_id are O(1). The list-style
+    methods used by the rest of the code (append, len, iteration,
+    members[0], clear) keep working. Records are stored as slotted
+    Member objects; plain dicts passed to append are converted.
+
+    attach() puts a MappedSnapshot behind the store: its members are
+    loaded one by one the first time they are looked up.
+
+    `ledger` indexes the loans of every member in the store, including
+    snapshot members that have not been loaded yet; `holds` has their
+    hold queues (binary snapshots do not carry them); `history` every
+    book each member has ever borrowed (see recommend.py), starting from
+    the loans members come in with.
+    """
+
+    def __init__(self, records: Iterable[Mapping] = ()):
+        self.ledger = LoanLedger()
+        self.holds = HoldQueues()
+        self.history = CoBorrowIndex()
+        self._lock = threading.Lock()
+        self._by_id: Dict[str, Member] = {}
+        self._backing = None
+        self._shadowed: Set[str] = set()  # snapshot ids already loaded or deleted
+        for record in records:
+            self.append(record)
+
+    @property
+    def backing(self):
+        return self._backing
+
+    def attach(self, snapshot) -> None:
+        """Replace the contents with the members of a MappedSnapshot."""
+        with self._lock:
+            self._by_id.clear()
+            self._shadowed = set()
+            self._backing = snapshot
+            self.ledger.clear()
+            self.holds.clear()
+            self.history.clear()
+            loans = list(snapshot.loans())
+            for member_id, isbns in loans:
+                self.ledger.track(member_id, isbns)
+            self.history.load((member_id, isbn) for member_id, isbns in loans for isbn in isbns)
+
+    def __len__(self) -> int:
+        if self._backing is None:
+            return len(self._by_id)
+        return len(self._by_id) + self._backing.member_count - len(self._shadowed)
+
+    def __iter__(self) -> Iterator[Member]:
+        self._load_all()
+        return iter(list(self._by_id.values()))  # snapshot, safe while others add/delete
+
+    def __contains__(self, member_id: str) -> bool:
+        if member_id in self._by_id:
+            return True
+        return (self._backing is not None and member_id not in self._shadowed
+                and self._backing.has_member(member_id))
+
+    def __getitem__(self, index: int) -> Member:
+        # positional access, kept for list compatibility (O(index))
+        self._load_all()
+        size = len(self._by_id)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("member index out of range")
+        return next(islice(self._by_id.values(), index, None))
+
+    def __repr__(self) -> str:
+        return f"MemberStore({list(self)!r})"
+
+    def get(self, member_id: str) -> Optional[Member]:
+        member = self._by_id.get(member_id)
+        if member is None and self._backing is not None:
+            member = self._fault(member_id)
+        return member
+
+    def append(self, member: Mapping) -> None:
+        member = Member.from_mapping(member)
+        if member.member_id in self:
+            raise ValueError(f"duplicate member_id {member.member_id!r}")
+        self._by_id[member.member_id] = member
+        self.ledger.track(member.member_id, member.borrowed_books)
+        if member.borrowed_books:
+            self.history.record_many((member.member_id, isbn) for isbn in member.borrowed_books)
+
+    def delete(self, member_id: str) -> Optional[Member]:
+        if self.get(member_id) is None:
+            return None
+        self.ledger.untrack(member_id)
+        return self._by_id.pop(member_id, None)
+
+    def remove(self, member: Mapping) -> None:
+        if self.delete(member["member_id"]) is None:
+            raise ValueError("member not in store")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._by_id.clear()
+            self._shadowed = set()
+            self._backing = None
+            self.ledger.clear()
+            self.holds.clear()
+            self.history.clear()
+
+    def _fault(self, member_id: str) -> Optional[Member]:
+        # load one member from the snapshot (once, even with several threads)
+        with self._lock:
+            member = self._by_id.get(member_id)
+            if member is None and self._backing is not None and member_id not in self._shadowed:
+                record = self._backing.member(member_id)
+                if record is not None:
+                    member = self._by_id[member_id] = Member.from_mapping(record)
+                    self._shadowed.add(member_id)
+            return member
+
+    def _load_all(self) -> None:
+        if self._backing is not None and len(self._shadowed) < self._backing.member_count:
+            for member_id in self._backing.member_ids():
+                if member_id not in self._shadowed:
+                    self._fault(member_id)
+
+
+class BookView(MutableMapping):
+    """Dict-style view of one book in a BookStore (books[isbn]["title"]).
+
+    The view looks its row up by ISBN on every access, so it raises
+    KeyError once the book has been deleted.
+    """
+
+    __slots__ = ("_store", "isbn")
+
+    def __init__(self, store: "BookStore", isbn: str):
+        self._store = store
+        self.isbn = isbn
+
+    def __getitem__(self, key: str):
+        return self._store._get_field(self.isbn, key)
+
+    def __setitem__(self, key: str, value) -> None:
+        self._store._set_field(self.isbn, key, value)
+
+    def __delitem__(self, key: str) -> None:
+        raise TypeError("book fields cannot be deleted")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(BOOK_FIELDS)
+
+    def __len__(self) -> int:
+        return len(BOOK_FIELDS)
+
+    def __repr__(self) -> str:
+        return repr(self.copy())
+
+    def copy(self) -> Dict:
+        return self._store.record(self.isbn)
+
+
+class BookResult(Mapping):
+    """Read-only, live view of one book for search results.
+
+    Like BookView it reads the store on every access (so copy counts are
+    current, and a deleted book raises KeyError), but it also has an
+    "isbn" field and never loads a snapshot book into the store.
+    """
+
+    __slots__ = ("_store", "isbn")
+
+    def __init__(self, store, isbn: str):
+        self._store = store
+        self.isbn = isbn
+
+    def __getitem__(self, key: str):
+        if key == "isbn":
+            return self.isbn
+        try:
+            return self._store._get_field(self.isbn, key)
+        except KeyError:
+            if key not in BOOK_FIELDS:
+                raise
+            return self._store.record(self.isbn)[key]  # not loaded from the snapshot
+
+    def __iter__(self) -> Iterator[str]:
+        yield "isbn"
+        yield from BOOK_FIELDS
+
+    def __len__(self) -> int:
+        return len(BOOK_FIELDS) + 1
+
+    def __repr__(self) -> str:
+        return f"BookResult({self.isbn!r})"
+
+    def copy(self) -> Dict:
+        record = self._store.record(self.isbn)
+        record["isbn"] = self.isbn
+        return record
+
+
+class BookStore(MutableMapping):
+    """Books keyed by ISBN, stored column-wise instead of one dict each.
+
+    Titles and authors live in parallel lists (authors are interned, so
+    repeated names are stored once), genres as one-byte codes and copy
+    counts in int32 arrays. books[isbn] returns a BookView, and
+    books[isbn] = {...} inserts or replaces a record. Deleted rows are
+    reused by later inserts. Inserts and deletes take an internal lock;
+    iteration walks a snapshot of the ISBNs.
+
+    attach() puts a MappedSnapshot behind the store. Its books count as
+    present but are only copied into the columns when books[isbn] is
+    first used; `in`, iteration and record() read the file directly.
+
+    `facets` groups the books by genre and availability (see facets.py)
+    and is updated by every write. After attach() it is built on first
+    use, which reads the whole snapshot.
+    """
+
+    def __init__(self, records: Optional[Mapping] = None):
+        self._lock = threading.Lock()
+        self.clear()
+        if records:
+            for isbn, record in records.items():
+                self[isbn] = record
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+
+    def _reset(self) -> None:
+        self._backing = None
+        self._shadowed: Set[str] = set()  # snapshot ISBNs already loaded or deleted
+        self._row: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._titles: List[str] = []
+        self._authors: List[str] = []
+        self._genres = array("B")
+        self._total = array("i")
+        self._available = array("i")
+        self._genre_names: List[str] = []
+        self._genre_codes: Dict[str, int] = {}
+        self._facets: Optional[FacetIndex] = FacetIndex()
+
+    @property
+    def backing(self):
+        return self._backing
+
+    @property
+    def facets_ready(self) -> bool:
+        return self._facets is not None
+
+    @property
+    def facets(self) -> FacetIndex:
+        """The facet index; books must not change while it is first built."""
+        if self._facets is None:
+            facets = FacetIndex()
+            for isbn in self:
+                record = self.record(isbn)
+                facets.add(isbn, (record["genre"], record["total_copies"], record["available_copies"]))
+            with self._lock:
+                if self._facets is None:
+                    self._facets = facets
+        return self._facets
+
+    def transaction(self):
+        # in-memory changes need no transaction (the SQLite store does)
+        return nullcontext()
+
+    def attach(self, snapshot) -> None:
+        """Replace the contents with the books of a MappedSnapshot."""
+        with self._lock:
+            self._reset()
+            self._backing = snapshot
+            self._facets = None  # built when first needed
+
+    def __len__(self) -> int:
+        if self._backing is None:
+            return len(self._row)
+        return len(self._row) + self._backing.book_count - len(self._shadowed)
+
+    def __iter__(self) -> Iterator[str]:
+        isbns = list(self._row)
+        if self._backing is not None:
+            shadowed = self._shadowed
+            isbns.extend(isbn for isbn in self._backing.isbns() if isbn not in shadowed)
+        return iter(isbns)
+
+    def __contains__(self, isbn) -> bool:
+        if isbn in self._row:
+            return True
+        return (self._backing is not None and isbn not in self._shadowed
+                and self._backing.has_book(isbn))
+
+    def __getitem__(self, isbn: str) -> BookView:
+        if isbn not in self._row and not self._fault(isbn):
+            raise KeyError(isbn)
+        return BookView(self, isbn)
+
+    def __setitem__(self, isbn: str, record: Mapping) -> None:
+        values = (record["title"], sys.intern(record["author"]),
+                  self._genre_code(record["genre"]),
+                  int(record["total_copies"]), int(record["available_copies"]))
+        if abs(values[3]) > MAX_COPIES or abs(values[4]) > MAX_COPIES:
+            raise ValueError(f"copy counts of {isbn} out of range (at most {MAX_COPIES:,})")
+        with self._lock:
+            old = None
+            if isbn in self._row:
+                old = self._facet_values(self._row[isbn])
+            elif (self._backing is not None and isbn not in self._shadowed
+                    and self._backing.has_book(isbn)):
+                self._shadowed.add(isbn)  # the new record hides the snapshot one
+                hidden = self._backing.book(isbn)
+                old = (hidden["genre"], hidden["total_copies"], hidden["available_copies"])
+            self._store_row(isbn, values)
+            if self._facets is not None:
+                new = (self._genre_names[values[2]], values[3], values[4])
+                if old is None:
+                    self._facets.add(isbn, new)
+                else:
+                    self._facets.update(isbn, old, new)
+
+    def __delitem__(self, isbn: str) -> None:
+        if isbn not in self._row and not self._fault(isbn):
+            raise KeyError(isbn)
+        with self._lock:
+            row = self._row.pop(isbn)
+            if self._facets is not None:
+                self._facets.remove(isbn, self._facet_values(row))
+            self._titles[row] = self._authors[row] = ""
+            self._free.append(row)
+
+    def __repr__(self) -> str:
+        return f"BookStore({ {isbn: self.record(isbn) for isbn in self}!r})"
+
+    def record(self, isbn: str) -> Dict:
+        """Return a plain dict copy of one book (without loading it)."""
+        row = self._row.get(isbn)
+        if row is None:
+            if isbn in self._shadowed or self._backing is None:
+                raise KeyError(isbn)
+            record = self._backing.book(isbn)
+            if record is None:
+                raise KeyError(isbn)
+            return record
+        return {
+            "title": self._titles[row],
+            "author": self._authors[row],
+            "genre": self._genre_names[self._genres[row]],
+            "total_copies": self._total[row],
+            "available_copies": self._available[row],
+        }
+
+    def _store_row(self, isbn: str, values: tuple) -> None:
+        row = self._row.get(isbn)
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+            else:
+                row = len(self._titles)
+                self._titles.append("")
+                self._authors.append("")
+                self._genres.append(0)
+                self._total.append(0)
+                self._available.append(0)
+            self._row[isbn] = row
+        (self._titles[row], self._authors[row], self._genres[row],
+         self._total[row], self._available[row]) = values
+
+    def _fault(self, isbn: str) -> bool:
+        # copy one book from the snapshot into the columns (once)
+        if self._backing is None:
+            return False
+        with self._lock:
+            if isbn in self._row:
+                return True
+            if isbn in self._shadowed:
+                return False
+            record = self._backing.book(isbn)
+            if record is None:
+                return False
+            self._shadowed.add(isbn)
+            self._store_row(isbn, (record["title"], sys.intern(record["author"]),
+                                   self._genre_code(record["genre"]),
+                                   record["total_copies"], record["available_copies"]))
+            return True
+
+    def _facet_values(self, row: int) -> FacetValues:
+        return self._genre_names[self._genres[row]], self._total[row], self._available[row]
+
+    def _genre_code(self, genre: str) -> int:
+        code = self._genre_codes.get(genre)
+        if code is None:
+            # append the name first so readers never see a dangling code
+            self._genre_names.append(sys.intern(genre))
+            code = self._genre_codes.setdefault(genre, len(self._genre_names) - 1)
+        return code
+
+    def _get_field(self, isbn: str, key: str):
+        row = self._row[isbn]
+        if key == "available_copies":
+            return self._available[row]
+        if key == "total_copies":
+            return self._total[row]
+        if key == "title":
+            return self._titles[row]
+        if key == "author":
+            return self._authors[row]
+        if key == "genre":
+            return self._genre_names[self._genres[row]]
+        raise KeyError(key)
+
+    def _set_field(self, isbn: str, key: str, value) -> None:
+        row = self._row[isbn]
+        facets = self._facets
+        if facets is not None and key == "available_copies":  # borrow/return
+            old, self._available[row] = self._available[row], int(value)
+            facets.available_changed(isbn, self._genre_names[self._genres[row]], old, self._available[row])
+        elif facets is not None and key in ("total_copies", "genre"):
+            old = self._facet_values(row)
+            self._set_column(row, key, value)
+            facets.update(isbn, old, self._facet_values(row))
+        else:
+            self._set_column(row, key, value)
+
+    def _set_column(self, row: int, key: str, value) -> None:
+        if key == "available_copies":
+            self._available[row] = int(value)
+        elif key == "total_copies":
+            self._total[row] = int(value)
+        elif key == "title":
+            self._titles[row] = value
+        elif key == "author":
+            self._authors[row] = sys.intern(value)
+        elif key == "genre":
+            self._genres[row] = self._genre_code(value)
+        else:
+            raise KeyError(key)
@@ -0,0 +1,122 @@
+# synthetic.py
+
+import math
+import random
+from itertools import accumulate
+from typing import Iterator, List, Tuple
+
+from data import GENRES
+
+# Seeded generator of realistic-looking libraries for benchmarks.
+# Title words, authors and borrowing all follow Zipf-like distributions:
+# a few words ("the", "of", "love") and a few prolific authors account
+# for a large share of the catalogue, and a few popular books account
+# for most of the loans. The same seed always produces the same data.
+
+STOP_WORDS = ("the", "of", "and", "a", "in", "to", "for", "on", "at", "with")
+COMMON_WORDS = (
+    "love", "night", "house", "war", "secret", "river", "last", "city", "dark", "story",
+    "life", "world", "time", "girl", "garden", "king", "death", "light", "history", "road",
+    "island", "summer", "shadow", "python", "galaxy", "code", "stone", "fire", "winter", "sea",
+)
+SYLLABLES = ("ka", "ro", "mi", "ten", "sa", "lu", "dor", "vi", "ne", "th",
+             "ar", "bel", "co", "fi", "gra", "hu", "jo", "ly", "pen", "qu")
+# rarer words: 8000 pseudo-words after the real ones, in rank order
+VOCABULARY = STOP_WORDS + COMMON_WORDS + tuple(
+    a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES)
+FIRST_NAMES = ("James", "Mary", "Amina", "Wei", "Fatmata", "Carlos", "Yuki", "Olu",
+               "Anna", "Mohamed", "Priya", "John", "Elena", "Ibrahim", "Sara", "Kofi")
+SURNAMES = ("Smith", "Bangura", "Kamara", "Garcia", "Nakamura", "Okafor", "Novak", "Adams",
+            "Knuth", "Harari", "Weir", "Eco", "Conteh", "Sesay", "Chen", "Silva",
+            "Ivanova", "Mensah", "Koroma", "Jalloh", "Rossi", "Dubois", "Kim", "Patel")
+GENRE_WEIGHTS = (35, 20, 12, 8, 12, 8, 5)  # same order as GENRES
+
+
+def zipf_weights(n: int, s: float = 1.1) -> List[float]:
+    """Cumulative Zipf weights for ranks 1..n (for random.choices)."""
+    return list(accumulate(1.0 / rank ** s for rank in range(1, n + 1)))
+
+
+class ZipfSampler:
+    """Draws indexes 0..n-1, index 0 most often, with P(i) ~ 1 / (i + 1) ** s."""
+
+    def __init__(self, n: int, rng: random.Random, s: float = 1.1):
+        self._population = range(n)
+        self._cum_weights = zipf_weights(n, s)
+        self._rng = rng
+
+    def sample(self, k: int) -> List[int]:
+        return self._rng.choices(self._population, cum_weights=self._cum_weights, k=k)
+
+
+def isbn_for(i: int) -> str:
+    return f"978-{i:010d}"
+
+
+def member_id_for(i: int) -> str:
+    return f"M{i:08d}"
+
+
+def generate_books(n: int, seed: int = 0) -> Iterator[Tuple[str, str, str, str, int]]:
+    """Yield n (isbn, title, author, genre, total_copies) tuples."""
+    rng = random.Random(seed)
+    n_authors = max(1, n // 8)
+    authors = [f"{rng.choice(FIRST_NAMES)} {_surname(rng)}" for _ in range(n_authors)]
+    author_of = ZipfSampler(n_authors, rng, s=0.9).sample(n)
+    words = ZipfSampler(len(VOCABULARY), rng, s=1.0)
+    lengths = rng.choices((1, 2, 3, 4, 5, 6), weights=(10, 30, 30, 15, 10, 5), k=n)
+    genres = rng.choices(GENRES, weights=GENRE_WEIGHTS, k=n)
+    copies = rng.choices((1, 2, 3, 5, 10), weights=(40, 25, 20, 10, 5), k=n)
+    for i in range(n):
+        title = " ".join(VOCABULARY[w] for w in words.sample(lengths[i]))
+        yield isbn_for(i), title.capitalize(), authors[author_of[i]], genres[i], copies[i]
+
+
+def _surname(rng: random.Random) -> str:
+    if rng.random() < 0.3:
+        return rng.choice(SURNAMES)
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.choice((2, 3)))).capitalize()
+
+
+def generate_members(n: int, seed: int = 0) -> Iterator[Tuple[str, str, str]]:
+    """Yield n (member_id, name, email) tuples."""
+    rng = random.Random(seed + 1)
+    for i in range(n):
+        first, last = rng.choice(FIRST_NAMES), _surname(rng)
+        yield member_id_for(i), f"{first} {last}", f"{first.lower()}.{last.lower()}{i}@example.com"
+
+
+def generate_queries(count: int, seed: int = 0) -> List[str]:
+    """Search queries: mostly one or two words, some shortened to prefixes."""
+    rng = random.Random(seed + 2)
+    words = ZipfSampler(len(VOCABULARY), rng, s=0.8)
+    queries = []
+    for _ in range(count):
+        terms = [VOCABULARY[w] for w in words.sample(rng.choice((1, 1, 2)))]
+        if rng.random() < 0.3:
+            terms[-1] = terms[-1][:max(3, len(terms[-1]) - 2)]
+        queries.append(" ".join(terms))
+    return queries
+
+
+def generate_borrows(count: int, n_members: int, n_books: int,
+                     seed: int = 0) -> List[Tuple[str, str]]:
+    """(member_id, isbn) pairs with Zipfian book popularity.
+
+    Members are drawn uniformly; popular books are spread over the ISBN
+    range by a fixed shuffle, so rank does not follow ISBN order.
+    """
+    rng = random.Random(seed + 3)
+    ranks = ZipfSampler(n_books, rng).sample(count)
+    stride = _coprime_stride(n_books, rng)
+    return [(member_id_for(rng.randrange(n_members)), isbn_for(rank * stride % n_books))
+            for rank in ranks]
+
+
+def _coprime_stride(n: int, rng: random.Random) -> int:
+    # rank -> rank * stride % n is a permutation of 0..n-1 when gcd(stride, n) == 1
+    while True:
+        stride = rng.randrange(1, max(2, n))
+        if math.gcd(stride, n) == 1:
+            return stride
+
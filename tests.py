@@ -1,9 +1,35 @@
 
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import operations
 from operations import (
     add_book, add_member, borrow_book, return_book, delete_book, delete_member,
     search_books, update_book, update_member, find_member,
-    books, members, GENRES
+    borrow_many, return_many, add_books, add_members, open_storage, close_storage, checkpoint,
+    export_snapshot, import_snapshot, borrowers, loan_count, check_loans,
+    cache_stats, configure_cache, iter_books, search_page, count_books, genre_counts,
+    changes, subscribe, place_hold, cancel_hold, member_holds, hold_queue, expire_holds,
+    HOLD_PICKUP_SECONDS, renew_loan, overdue_loans, member_loans, iter_overdue,
+    LOAN_SECONDS, MAX_RENEWALS, fuzzy_search, transaction, run_transaction, Transaction,
+    TransactionError, TransactionConflict, related_books, add_loan_history, loan_history,
+    rebuild_recommendations, books, members, GENRES, MAX_BORROW
 )
+from changefeed import ChangeFeed, ChangeFeedGap
+from fines import calculate_fines, fine_for
+from loans import DAY
+from bulk import export_books, export_members, load_books, load_members
+from sharding import ShardedLibrary, shard_of
+from recommend import CoBorrowIndex
+from search_index import SearchIndex, edit_distance
+from store import MemberStore
 
 def reset_data():
     """Reset data structures for clean testing"""
@@ -34,6 +60,16 @@ def test_book_operations():
     assert update_book("978-1111111111", title="Updated Test Book") is True
     assert books["978-1111111111"]["title"] == "Updated Test Book"
     
+    # Test copy counts beyond the int32 columns are rejected without a trace
+    count = count_books()
+    assert add_book("978-3333333333", "Big", "Author", "Fiction", 3_000_000_000) is False
+    assert add_book("978-3333333333", "Big", "Author", "Fiction", -1) is False
+    assert "978-3333333333" not in books and len(books) == count_books() == count
+    assert update_book("978-1111111111", total_copies=2 ** 31) is False
+    assert books["978-1111111111"]["total_copies"] == 3
+    assert add_book("978-3333333333", "Big", "Author", "Fiction", 2 ** 31 - 1) is True
+    assert delete_book("978-3333333333") is True and count_books() == count
+    
     print("✓ Test 1: Book operations passed")
 
 def test_member_operations():
@@ -150,6 +186,1452 @@ def test_edge_cases():
     
     print(" Test 6: Edge cases passed")
 
+def test_member_store():
+    """Test 7: Indexed member store keeps order and O(1) lookups"""
+    reset_data()
+    
+    for i in range(5):
+        assert add_member(f"M10{i}", f"Member {i}", f"m{i}@example.com") is True
+    assert [m["member_id"] for m in members] == ["M100", "M101", "M102", "M103", "M104"]
+    assert members[-1]["member_id"] == "M104"
+    
+    # Delete from the middle keeps the remaining order
+    assert delete_member("M102") is True
+    assert "M102" not in members
+    assert find_member("M102") is None
+    assert [m["member_id"] for m in members] == ["M100", "M101", "M103", "M104"]
+    
+    # Re-adding a deleted ID is allowed and goes to the end
+    assert add_member("M102", "Member 2", "m2@example.com") is True
+    assert members[len(members) - 1]["member_id"] == "M102"
+    
+    print("✓ Test 7: Member store passed")
+
+def test_search_index():
+    """Test 8: Indexed search stays in sync and matches substring mode"""
+    reset_data()
+    
+    add_book("978-7000000001", "Python Crash Course", "Eric Matthes", "Non-Fiction", 2)
+    add_book("978-7000000002", "Fluent Python", "Luciano Ramalho", "Non-Fiction", 1)
+    add_book("978-7000000003", "Dune", "Frank Herbert", "Sci-Fi", 4)
+    
+    def isbns(results):
+        return sorted(r["isbn"] for r in results)
+    
+    # Word and prefix queries give the same books in both modes
+    for query in ("python", "Pyth", "Frank Herbert", "fluent python", "dune"):
+        assert isbns(search_books(query)) == isbns(search_books(query, mode="substring"))
+    
+    # Multi-term AND across fields, including genre
+    assert isbns(search_books("python ramalho")) == ["978-7000000002"]
+    assert isbns(search_books("sci herbert")) == ["978-7000000003"]
+    assert search_books("python herbert") == []
+    
+    # Index follows updates and deletes
+    assert update_book("978-7000000003", title="Dune Messiah") is True
+    assert isbns(search_books("messiah")) == ["978-7000000003"]
+    assert delete_book("978-7000000002") is True
+    assert isbns(search_books("python")) == ["978-7000000001"]
+    
+    # Empty queries fall back to the substring scan
+    assert len(search_books("")) == 2
+    
+    print("✓ Test 8: Search index passed")
+
+def test_compact_records():
+    """Test 9: Column store and slotted records behave like dicts"""
+    reset_data()
+    
+    add_book("978-8000000001", "First", "Same Author", "Fiction", 2)
+    add_book("978-8000000002", "Second", "Same Author", "Mystery", 1)
+    book = books["978-8000000001"]
+    assert book["genre"] == "Fiction" and book["total_copies"] == 2
+    assert book.copy() == {"title": "First", "author": "Same Author", "genre": "Fiction",
+                           "total_copies": 2, "available_copies": 2}
+    assert dict(books["978-8000000002"].items())["genre"] == "Mystery"
+    assert [isbn for isbn, _ in books.items()] == ["978-8000000001", "978-8000000002"]
+    
+    # Writes through the view land in the store
+    book["available_copies"] -= 1
+    assert books["978-8000000001"]["available_copies"] == 1
+    
+    # Deleted rows are reused without leaking old values
+    book["available_copies"] += 1
+    assert delete_book("978-8000000001") is True
+    add_book("978-8000000003", "Third", "Other Author", "Sci-Fi", 5)
+    assert books["978-8000000003"].copy()["title"] == "Third"
+    assert books["978-8000000003"]["available_copies"] == 5
+    assert len(books) == 2
+    
+    # Members are slotted records with dict-style access
+    add_member("M200", "Slot Member", "slot@example.com")
+    member = find_member("M200")
+    assert member["borrowed_books"] == [] and member.copy()["email"] == "slot@example.com"
+    
+    print("✓ Test 9: Compact records passed")
+
+def test_batch_circulation():
+    """Test 10: Batch borrow/return in best-effort and atomic modes"""
+    reset_data()
+    
+    add_book("978-9000000001", "Batch One", "Author", "Fiction", 2)
+    add_book("978-9000000002", "Batch Two", "Author", "Fiction", 1)
+    add_member("M300", "Kiosk A", "a@example.com")
+    add_member("M301", "Kiosk B", "b@example.com")
+    
+    # Best effort: later items see earlier ones (copies and MAX_BORROW)
+    results = borrow_many([
+        ("M300", "978-9000000001"),
+        ("M301", "978-9000000001"),
+        ("M300", "978-9000000001"),   # no copies left
+        ("M300", "978-9000000002"),
+        ("M300", "NO-SUCH-ISBN"),
+        ("GHOST", "978-9000000002"),
+    ])
+    assert results == [True, True, False, True, False, False]
+    assert books["978-9000000001"]["available_copies"] == 0
+    assert books["978-9000000002"]["available_copies"] == 0
+    assert find_member("M300")["borrowed_books"] == ["978-9000000001", "978-9000000002"]
+    
+    # Atomic: one bad item means nothing is applied
+    assert return_many([("M300", "978-9000000001"), ("M301", "978-9000000002")], atomic=True) == [False, False]
+    assert books["978-9000000001"]["available_copies"] == 0
+    assert len(find_member("M300")["borrowed_books"]) == 2
+    
+    # A member cannot return the same copy twice in one batch
+    assert return_many([("M301", "978-9000000001"), ("M301", "978-9000000001")]) == [True, False]
+    assert return_many([("M300", "978-9000000001"), ("M300", "978-9000000002")], atomic=True) == [True, True]
+    assert books["978-9000000001"]["available_copies"] == 2
+    assert books["978-9000000002"]["available_copies"] == 1
+    assert find_member("M300")["borrowed_books"] == []
+    
+    print("✓ Test 10: Batch circulation passed")
+
+def test_concurrent_circulation():
+    """Test 11: Many threads borrowing/returning never oversell"""
+    reset_data()
+    
+    isbns = [f"978-9100000{i:03d}" for i in range(4)]
+    for isbn in isbns:
+        add_book(isbn, "Popular Book", "Author", "Fiction", 3)
+    member_ids = [f"M4{i:02d}" for i in range(12)]
+    for member_id in member_ids:
+        add_member(member_id, "Reader", "reader@example.com")
+    
+    errors = []
+    stop = threading.Event()
+    
+    def worker(seed):
+        rng = random.Random(seed)
+        try:
+            for _ in range(3000):
+                member_id, isbn = rng.choice(member_ids), rng.choice(isbns)
+                op = rng.random()
+                if op < 0.45:
+                    borrow_book(member_id, isbn)
+                elif op < 0.9:
+                    return_book(member_id, isbn)
+                elif op < 0.95:
+                    update_book(isbn, title=f"Popular Book {seed}")
+                else:
+                    # delete must refuse while copies are out; re-add if it went through
+                    if delete_book(isbn):
+                        add_book(isbn, "Popular Book", "Author", "Fiction", 3)
+        except Exception as exc:  # surface thread failures in the main thread
+            errors.append(exc)
+    
+    def monitor():
+        while not stop.is_set():
+            for isbn in isbns:
+                if isbn in books and books[isbn]["available_copies"] < 0:
+                    errors.append(AssertionError(f"negative copies for {isbn}"))
+            for m in members:
+                if len(m["borrowed_books"]) > MAX_BORROW:
+                    errors.append(AssertionError(f"{m['member_id']} over MAX_BORROW"))
+    
+    old_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)  # force frequent thread switches
+    try:
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        watcher = threading.Thread(target=monitor)
+        watcher.start()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        stop.set()
+        watcher.join()
+    finally:
+        sys.setswitchinterval(old_interval)
+    
+    assert not errors, errors[:3]
+    for isbn in isbns:
+        on_loan = sum(m["borrowed_books"].count(isbn) for m in members)
+        book = books[isbn]
+        assert 0 <= book["available_copies"] == book["total_copies"] - on_loan
+    assert check_loans() == []
+    
+    print("✓ Test 11: Concurrent circulation passed")
+
+def test_persistent_storage():
+    """Test 12: Changes survive a restart via the write-ahead log"""
+    reset_data()
+    
+    with tempfile.TemporaryDirectory() as directory:
+        assert open_storage(directory, fsync="always") == 0
+        add_book("978-9200000001", "Durable Book", "Author", "History", 2)
+        add_book("978-9200000002", "Gone Book", "Author", "History", 1)
+        add_member("M500", "Persistent Reader", "p@example.com")
+        borrow_book("M500", "978-9200000001")
+        checkpoint()
+        update_book("978-9200000001", title="Durable Book II")
+        delete_book("978-9200000002")
+        borrow_many([("M500", "978-9200000001")])
+        return_book("M500", "978-9200000001")
+        close_storage()
+        
+        # "Restart": wipe memory, then recover from snapshot + log
+        reset_data()
+        assert open_storage(directory) == 4
+        assert books["978-9200000001"]["title"] == "Durable Book II"
+        assert books["978-9200000001"]["available_copies"] == 1
+        assert "978-9200000002" not in books
+        assert find_member("M500")["borrowed_books"] == ["978-9200000001"]
+        assert len(search_books("durable")) == 1
+        close_storage()
+        
+        # A torn last record (crash mid-write) is ignored and cut off
+        with open(os.path.join(directory, "library.wal"), "ab") as f:
+            f.write(b'{"lsn": 99, "op": "delete_me')
+        reset_data()
+        assert open_storage(directory) == 4
+        assert return_book("M500", "978-9200000001") is True
+        close_storage()
+        reset_data()
+        assert open_storage(directory) == 5
+        assert find_member("M500")["borrowed_books"] == []
+        close_storage()
+    
+    print("✓ Test 12: Persistent storage passed")
+
+def test_binary_snapshot():
+    """Test 13: Binary snapshot export and lazy memory-mapped import"""
+    reset_data()
+    
+    add_book("978-9300000001", "Mapped Galaxy", "Ada Byte", "Sci-Fi", 2)
+    add_book("978-9300000002", "Mapped River", "Ada Byte", "Fiction", 1)
+    add_book("978-9300000003", "Quiet Harbour", "Ola Sea", "Mystery", 1)
+    add_member("M600", "Mapped Reader", "map@example.com")
+    add_member("M601", "Other Reader", "other@example.com")
+    borrow_book("M600", "978-9300000002")
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "catalogue.snap")
+        export_snapshot(path)
+        expected_books = {isbn: books[isbn].copy() for isbn in books}
+        
+        reset_data()
+        import_snapshot(path)
+        assert len(books) == 3 and len(members) == 2
+        assert "978-9300000003" in books and "978-0000000000" not in books
+        assert sorted(r["isbn"] for r in search_books("mapped ada")) == ["978-9300000001", "978-9300000002"]
+        assert find_member("M600")["borrowed_books"] == ["978-9300000002"]
+        
+        # Records loaded on first touch keep working with every operation
+        assert return_book("M600", "978-9300000002") is True
+        assert books["978-9300000002"]["available_copies"] == 1
+        assert update_book("978-9300000001", title="Remapped Galaxy") is True
+        assert [r["isbn"] for r in search_books("mapped")] == ["978-9300000002"]
+        assert [r["isbn"] for r in search_books("remapped")] == ["978-9300000001"]
+        assert delete_book("978-9300000003") is True
+        assert "978-9300000003" not in books and search_books("harbour") == []
+        assert add_book("978-9300000003", "New Harbour", "Ola Sea", "Mystery", 1) is True
+        assert add_member("M600", "Duplicate", "dup@example.com") is False
+        assert len(books) == 3 and sorted(books) == sorted(expected_books)
+        
+        # Eager import copies everything and matches the export
+        reset_data()
+        import_snapshot(path, lazy=False)
+        assert {isbn: books[isbn].copy() for isbn in books} == expected_books
+        assert [m["member_id"] for m in members] == ["M600", "M601"]
+    
+    print("✓ Test 13: Binary snapshot passed")
+
+def test_server():
+    """Test 14: asyncio JSON-lines server with pipelined requests"""
+    from server import start_server
+    reset_data()
+    
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(start_server(port=0))
+    port = server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        requests = [
+            {"id": 1, "op": "add_book", "args": ["978-9400000001", "Served Python", "Net Author", "Fiction", 1]},
+            {"id": 2, "op": "add_member", "args": ["M700", "Remote Reader", "remote@example.com"]},
+            {"id": 3, "op": "borrow_book", "args": ["M700", "978-9400000001"]},
+            {"id": 4, "op": "borrow_book", "args": ["M700", "978-9400000001"]},
+            {"id": 5, "op": "find_member", "args": ["M700"]},
+            {"id": 6, "op": "search_books", "args": ["served"]},
+            {"id": 7, "op": "return_book", "args": ["M700", "978-9400000001"]},
+            {"id": 8, "op": "update_book", "args": ["978-9400000001"], "kwargs": {"title": "Served Again"}},
+            {"id": 9, "op": "delete_book", "args": ["978-9400000001"]},
+            {"id": 10, "op": "no_such_op"},
+            {"id": 11, "op": "search_books", "args": ["x"], "kwargs": {"mode": "bad"}},
+            {"id": 12, "op": "borrow_many", "args": [[["M700", "978-0000000000"]]]},
+        ]
+        with socket.create_connection(("127.0.0.1", port)) as sock:
+            # all requests in one write, then a half-close; the server must
+            # answer every one, in order, before closing its side
+            sock.sendall(b"".join(json.dumps(r).encode() + b"\n" for r in requests) + b"not json\n")
+            sock.shutdown(socket.SHUT_WR)
+            data = b""
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+        responses = [json.loads(line) for line in data.splitlines()]
+        assert [r["id"] for r in responses] == list(range(1, 13)) + [None]
+        assert [r.get("result") for r in responses[:4]] == [True, True, True, False]
+        assert responses[4]["result"]["borrowed_books"] == ["978-9400000001"]
+        assert [b["isbn"] for b in responses[5]["result"]] == ["978-9400000001"]
+        assert [r.get("result") for r in responses[6:9]] == [True, True, True]
+        assert "unknown operation" in responses[9]["error"]
+        assert responses[10]["error"].startswith("ValueError")
+        assert responses[11]["result"] == [False]
+        assert "error" in responses[12]
+        assert "978-9400000001" not in books and find_member("M700")["borrowed_books"] == []
+    finally:
+        server.close()
+        asyncio.run_coroutine_threadsafe(server.wait_closed(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+    
+    print("✓ Test 14: Asyncio server passed")
+
+def test_loan_ledger():
+    """Test 15: Loan ledger answers who has a book and stays consistent"""
+    reset_data()
+    
+    add_book("978-9500000001", "Ledger Book", "Author", "Fiction", 3)
+    add_book("978-9500000002", "Other Book", "Author", "Fiction", 1)
+    add_member("M800", "First Holder", "a@example.com")
+    add_member("M801", "Second Holder", "b@example.com")
+    
+    assert borrow_book("M800", "978-9500000001") is True
+    assert borrow_book("M800", "978-9500000001") is True
+    assert borrow_book("M801", "978-9500000001") is True
+    assert borrowers("978-9500000001") == {"M800": 2, "M801": 1}
+    assert borrowers("978-9500000002") == {}
+    assert loan_count("M800") == 2 and loan_count("M801") == 1 and loan_count("NOPE") == 0
+    assert check_loans() == []
+    
+    # delete checks ask the ledger
+    assert delete_book("978-9500000001") is False
+    assert delete_member("M801") is False
+    assert return_many([("M801", "978-9500000001"), ("M801", "978-9500000001")]) == [True, False]
+    assert borrowers("978-9500000001") == {"M800": 2}
+    assert delete_member("M801") is True
+    assert return_book("M800", "978-9500000001") is True
+    assert return_book("M800", "978-9500000002") is False
+    assert borrow_many([("M800", "978-9500000002")]) == [True]
+    assert members.ledger.loans_of("M800") == {"978-9500000001": 1, "978-9500000002": 1}
+    assert check_loans() == []
+    
+    # changes made behind the ledger's back are reported (in SQLite the
+    # member's list is the loans table itself, so only the counter can drift)
+    books["978-9500000002"]["available_copies"] = 1
+    find_member("M800")["borrowed_books"].append("978-0000000000")
+    problems = check_loans()
+    assert any("978-9500000002" in p for p in problems)
+    assert any("not in the catalogue" in p for p in problems)
+    if isinstance(members, MemberStore):
+        assert any("M800" in p for p in problems)
+    
+    # the ledger of a lazily imported snapshot is ready without loading members
+    reset_data()
+    add_book("978-9500000003", "Snapshot Book", "Author", "Fiction", 2)
+    add_member("M802", "Snapshot Holder", "c@example.com")
+    borrow_book("M802", "978-9500000003")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "catalogue.snap")
+        export_snapshot(path)
+        reset_data()
+        import_snapshot(path)
+        assert borrowers("978-9500000003") == {"M802": 1}
+        assert delete_book("978-9500000003") is False
+        assert check_loans() == []
+    
+    print("✓ Test 15: Loan ledger passed")
+
+def test_synthetic_library():
+    """Test 16: Seeded synthetic library generator for benchmarks"""
+    from synthetic import generate_books, generate_borrows, generate_members
+    reset_data()
+    
+    # the same seed gives the same library, a different seed another one
+    assert list(generate_books(200, seed=3)) == list(generate_books(200, seed=3))
+    assert list(generate_books(200, seed=3)) != list(generate_books(200, seed=4))
+    assert all(add_book(*row) for row in generate_books(200, seed=3))
+    assert all(add_member(*row) for row in generate_members(50, seed=3))
+    assert len(books) == 200 and len(members) == 50
+    
+    # borrowing is skewed: the most popular book gets a large share
+    pairs = generate_borrows(2000, 50, 200, seed=3)
+    assert all(m in members and isbn in books for m, isbn in pairs)
+    top = max(sum(1 for _, isbn in pairs if isbn == b) for b in {isbn for _, isbn in pairs})
+    assert top > 2000 / 200 * 10
+    
+    print("✓ Test 16: Synthetic library passed")
+
+def test_metrics():
+    """Test 17: Instrumentation counts calls, failure reasons and latency"""
+    import metrics
+    reset_data()
+    was_enabled = metrics.is_enabled()
+    metrics.disable()
+    metrics.reset()
+    
+    add_book("978-9700000001", "Metered Book", "Author", "Fiction", 1)
+    assert metrics.snapshot()["operations"] == {}  # nothing recorded while disabled
+    
+    metrics.enable()
+    try:
+        add_member("M900", "Metered Reader", "m@example.com")
+        add_member("M901", "Second Reader", "s@example.com")
+        assert borrow_book("M900", "978-9700000001") is True
+        assert borrow_book("M901", "978-9700000001") is False
+        assert borrow_book("NOPE", "978-9700000001") is False
+        assert borrow_book("M900", "978-0000000000") is False
+        assert add_book("978-9700000001", "Again", "Author", "Fiction", 1) is False
+        assert add_book("978-9700000002", "Bad", "Author", "Poetry", 1) is False
+        assert borrow_many([("M901", "978-9700000001"), ("NOPE", "978-9700000001")]) == [False, False]
+        assert update_member("M900", name="Renamed") is True  # uses no instrumented call inside
+        
+        snap = metrics.snapshot()
+        ops = snap["operations"]
+        assert ops["borrow_book"]["calls"] == 4 and ops["borrow_book"]["failures"] == 3
+        assert ops["borrow_book"]["failure_reasons"] == {"no_copies": 1, "unknown_member": 1, "unknown_isbn": 1}
+        assert ops["add_book"]["failure_reasons"] == {"duplicate_isbn": 1, "invalid_genre": 1}
+        assert ops["borrow_many"]["failure_reasons"] == {"no_copies": 1, "unknown_member": 1}
+        assert "find_member" not in ops and ops["update_member"]["calls"] == 1
+        latency = ops["borrow_book"]["latency_us"]
+        assert 0 < latency["p50"] <= latency["p99"] <= latency["max"] * 1.25 + 0.01
+        assert sum(ops["borrow_book"]["histogram_us"].values()) == 4
+        
+        # exceptions are counted and still raised
+        try:
+            search_books("x", mode="bad")
+            assert False, "expected ValueError"
+        except ValueError:
+            pass
+        assert metrics.snapshot()["operations"]["search_books"]["errors"] == 1
+        
+        # sampled profiling and memory tracing, switched on at runtime
+        metrics.start_profiling(every=1, memory=True)
+        for _ in range(5):
+            search_books("metered")
+        metrics.stop_profiling()
+        snap = metrics.snapshot()
+        assert snap["operations"]["search_books"]["sampled_calls"] == 5
+        assert any("search_books" in row["function"] for row in snap["profile"])
+        
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "metrics.json")
+            metrics.export_json(path)
+            with open(path, encoding="utf-8") as f:
+                assert json.load(f)["operations"]["borrow_book"]["calls"] == 4
+    finally:
+        if not was_enabled:
+            metrics.disable()
+        metrics.reset()
+    
+    print("✓ Test 17: Metrics passed")
+
+def test_query_cache():
+    """Test 18: Search results are cached and invalidated precisely"""
+    reset_data()
+    configure_cache(maxsize=1024)
+    
+    add_book("978-9800000001", "Cached Python Guide", "Ada Lovelace", "Non-Fiction", 2)
+    add_book("978-9800000002", "Cached River Tales", "Ben Okri", "Fiction", 1)
+    add_member("M950", "Cache Reader", "cache@example.com")
+    
+    before = cache_stats()
+    assert [r["isbn"] for r in search_books("cached python")] == ["978-9800000001"]
+    assert [r["isbn"] for r in search_books("PYTHON  cached")] == ["978-9800000001"]  # same key
+    stats = cache_stats()
+    assert stats["misses"] == before["misses"] + 1 and stats["hits"] == before["hits"] + 1
+    
+    # availability is read live, not cached
+    borrow_book("M950", "978-9800000001")
+    assert search_books("cached python")[0]["available_copies"] == 1
+    assert cache_stats()["hits"] == stats["hits"] + 1
+    
+    # a change that does not affect a query leaves it cached...
+    search_books("river")
+    hits = cache_stats()["hits"]
+    update_book("978-9800000001", title="Cached Python Handbook")
+    search_books("river")
+    assert cache_stats()["hits"] == hits + 1
+    # ...while queries whose result changes are dropped
+    assert [r["title"] for r in search_books("cached python")] == ["Cached Python Handbook"]
+    update_book("978-9800000002", title="Cached Python Tales")
+    assert [r["isbn"] for r in search_books("cached python")] == ["978-9800000001", "978-9800000002"]
+    update_book("978-9800000001", title="Plain Handbook")
+    assert [r["isbn"] for r in search_books("python")] == ["978-9800000002"]
+    add_book("978-9800000003", "Pythonic Patterns", "Cy Coder", "Non-Fiction", 1)
+    assert [r["isbn"] for r in search_books("python")] == ["978-9800000002", "978-9800000003"]
+    return_book("M950", "978-9800000001")
+    delete_book("978-9800000003")
+    assert [r["isbn"] for r in search_books("python")] == ["978-9800000002"]
+    
+    # an ISBN re-added after the store was cleared directly
+    reset_data()
+    add_book("978-9800000002", "Java Tales", "Ben Okri", "Fiction", 1)
+    assert search_books("python") == []
+    
+    # size limit and LRU order
+    configure_cache(maxsize=2)
+    search_books("java")
+    search_books("tales")
+    search_books("java")
+    search_books("okri")  # evicts "tales", the least recently used
+    hits = cache_stats()["hits"]
+    search_books("java")
+    assert cache_stats()["hits"] == hits + 1
+    search_books("tales")
+    assert cache_stats()["hits"] == hits + 1
+    assert cache_stats()["size"] == 2 and cache_stats()["evictions"] >= 2
+    
+    # lifetime
+    configure_cache(ttl=0.0)
+    search_books("java")
+    misses = cache_stats()["misses"]
+    search_books("java")
+    assert cache_stats()["misses"] == misses + 1
+    configure_cache(maxsize=1024, ttl=float("inf"))
+    assert 0 < cache_stats()["hit_rate"] < 1
+    
+    print("✓ Test 18: Query cache passed")
+
+def test_streaming_search():
+    """Test 19: Streaming and cursor-paginated search"""
+    reset_data()
+    for i in (5, 1, 4, 2, 3):
+        add_book(f"978-9900000{i:03d}", f"Paged Volume {'EDCBA'[i - 1]}", "Pat Pager", "Fiction", 2)
+    add_book("978-9900000900", "Unrelated", "Someone Else", "History", 1)
+    add_member("M960", "Page Reader", "page@example.com")
+    
+    # streaming yields the same books as search_books, in ISBN order
+    stream = iter_books("paged")
+    first = next(stream)
+    assert first["isbn"] == "978-9900000001" and first["title"] == "Paged Volume E"
+    assert [r["isbn"] for r in stream] == [f"978-9900000{i:03d}" for i in (2, 3, 4, 5)]
+    assert [r.copy() for r in iter_books("paged")] == search_books("paged")
+    assert [r["isbn"] for r in iter_books("volume", order="title")] == [
+        f"978-9900000{i:03d}" for i in (5, 4, 3, 2, 1)]
+    assert len(list(iter_books("pager", mode="substring"))) == 5
+    
+    # views are read-only and live
+    borrow_book("M960", "978-9900000001")
+    assert first["available_copies"] == 1 and dict(first)["isbn"] == "978-9900000001"
+    try:
+        first["title"] = "Changed"
+        assert False, "views must be read-only"
+    except TypeError:
+        pass
+    return_book("M960", "978-9900000001")
+    
+    # pages resume where the previous one stopped
+    page = search_page("paged", limit=2)
+    assert [r["isbn"] for r in page["results"]] == ["978-9900000001", "978-9900000002"]
+    delete_book("978-9900000002")  # changes between pages cause no repeats or skips
+    add_book("978-9900000000", "Paged Volume Zero", "Pat Pager", "Fiction", 1)
+    page = search_page("paged", limit=2, cursor=page["next"])
+    assert [r["isbn"] for r in page["results"]] == ["978-9900000003", "978-9900000004"]
+    page = search_page("paged", limit=2, cursor=page["next"])
+    assert [r["isbn"] for r in page["results"]] == ["978-9900000005"] and page["next"] is None
+    
+    # title order, ties broken by ISBN
+    titles, cursor = [], None
+    while True:
+        page = search_page("volume", limit=2, cursor=cursor, order="title")
+        titles += [r["title"] for r in page["results"]]
+        cursor = page["next"]
+        if cursor is None:
+            break
+    assert titles == ["Paged Volume A", "Paged Volume B", "Paged Volume C",
+                      "Paged Volume E", "Paged Volume Zero"]
+    assert search_page("nothing matches") == {"results": [], "next": None}
+    
+    # a cursor only resumes the search it came from
+    cursor = search_page("paged", limit=1)["next"]
+    for bad in (lambda: search_page("volume", cursor=cursor),
+                lambda: search_page("paged", cursor=cursor, order="title"),
+                lambda: search_page("paged", cursor="not a cursor"),
+                lambda: search_page("paged", limit=0),
+                lambda: iter_books("paged", order="author"),  # raised by the call, not on next()
+                lambda: iter_books("paged", mode="regex")):
+        try:
+            bad()
+            assert False, "expected ValueError"
+        except ValueError:
+            pass
+    
+    print("✓ Test 19: Streaming and paginated search passed")
+
+def test_facets():
+    """Test 20: Genre/availability facets and counts"""
+    reset_data()
+    
+    def scanned(genre=None, available=None):
+        return sorted(isbn for isbn in books
+                      if (genre is None or books[isbn]["genre"] == genre)
+                      and (available is None or (books[isbn]["available_copies"] > 0) == available))
+    
+    def check():
+        for genre in (None,) + GENRES:
+            for available in (None, True, False):
+                expected = scanned(genre, available)
+                assert count_books(genre=genre, available=available) == len(expected)
+                assert [r["isbn"] for r in iter_books("", genre=genre, available=available)] == expected
+        for genre, counts in genre_counts().items():
+            in_genre = [books.record(isbn) for isbn in scanned(genre)]
+            assert counts == {
+                "books": len(in_genre),
+                "available_books": sum(r["available_copies"] > 0 for r in in_genre),
+                "total_copies": sum(r["total_copies"] for r in in_genre),
+                "available_copies": sum(r["available_copies"] for r in in_genre),
+            }, genre
+    
+    check()
+    assert genre_counts()["Mystery"]["books"] == 0
+    add_book("978-9700000001", "Facet Mystery One", "Fay Cet", "Mystery", 1)
+    add_book("978-9700000002", "Facet Mystery Two", "Fay Cet", "Mystery", 2)
+    add_book("978-9700000003", "Facet History", "Fay Cet", "History", 1)
+    add_member("M970", "Facet Reader", "facet@example.com")
+    add_member("M971", "Facet Reader Two", "facet2@example.com")
+    check()
+    
+    # borrowing the last copy moves a book out of "available", returning it moves it back
+    assert borrow_book("M970", "978-9700000001")
+    assert count_books(genre="Mystery", available=False) == 1
+    assert genre_counts()["Mystery"]["available_copies"] == 2
+    check()
+    borrow_many([("M970", "978-9700000002"), ("M971", "978-9700000002"), ("M971", "978-9700000003")])
+    assert count_books(genre="Mystery", available=True) == 0
+    check()
+    return_book("M970", "978-9700000002")
+    update_book("978-9700000003", genre="Mystery", total_copies=3)
+    update_book("978-9700000001", genre="Poetry")  # rejected, leaves the counters as they were
+    check()
+    return_many([("M970", "978-9700000001"), ("M971", "978-9700000002"), ("M971", "978-9700000003")])
+    delete_book("978-9700000002")
+    check()
+    
+    # text search combined with facets
+    assert [r["isbn"] for r in iter_books("facet", genre="Mystery")] == ["978-9700000001", "978-9700000003"]
+    borrow_book("M970", "978-9700000003")
+    assert [r["isbn"] for r in iter_books("facet", available=True)] == ["978-9700000001", "978-9700000003"]
+    borrow_book("M971", "978-9700000001")
+    assert [r["isbn"] for r in iter_books("facet", available=False)] == ["978-9700000001"]
+    assert count_books("facet", genre="Mystery", available=True) == 1
+    assert count_books("facet") == 2 and count_books("fay", mode="substring") == 2
+    page = search_page("facet", limit=1, genre="Mystery")
+    assert [r["isbn"] for r in page["results"]] == ["978-9700000001"]
+    assert [r["isbn"] for r in search_page("facet", limit=1, genre="Mystery", cursor=page["next"])["results"]] == [
+        "978-9700000003"]
+    try:
+        search_page("facet", limit=1, genre="History", cursor=page["next"])
+        assert False, "cursor must not resume a differently filtered search"
+    except ValueError:
+        pass
+    try:
+        count_books(genre="Poetry")
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+    return_book("M970", "978-9700000003")
+    return_book("M971", "978-9700000001")
+    
+    # a lazily imported snapshot builds its facets on first use
+    if isinstance(members, MemberStore):
+        path = os.path.join(tempfile.mkdtemp(), "facets.snap")
+        export_snapshot(path)
+        import_snapshot(path, lazy=True)
+        assert not books.facets_ready
+        add_book("978-9700000004", "Facet Biography", "Fay Cet", "Biography", 1)
+        borrow_book("M970", "978-9700000001")
+        check()
+        assert books.facets_ready
+        update_book("978-9700000003", genre="History")  # replaces a snapshot book
+        books["978-9700000003"] = dict(books.record("978-9700000003"), genre="Fiction")
+        check()
+        return_book("M970", "978-9700000001")
+    
+    # clearing the store clears the counts
+    reset_data()
+    assert count_books() == 0 and all(c["books"] == 0 for c in genre_counts().values())
+    
+    print("✓ Test 20: Facets passed")
+
+def test_sharded_library():
+    """Test 21: Sharded catalogue across worker processes"""
+    with ShardedLibrary(workers=3) as lib:
+        rows = [(f"978-9600000{i:03d}", f"Sharded {'Night' if i % 2 else 'Day'} {i}", "Shard Author",
+                 GENRES[i % len(GENRES)], 1 + i % 2) for i in range(30)]
+        assert lib.add_books(rows) == [True] * 30
+        assert not lib.add_book(*rows[0])  # duplicate, found on its own shard
+        assert lib.add_members([(f"M96{i}", f"Shard Member {i}", f"s{i}@example.com") for i in range(6)]) == [True] * 6
+        assert len({shard_of(isbn, 3) for isbn, *_ in rows}) == 3  # books really are spread out
+        
+        # scatter-gather search returns every match, merged in ISBN order
+        night = lib.search_books("sharded night")
+        assert [r["isbn"] for r in night] == [row[0] for row in rows if "Night" in row[1]]
+        assert len(lib.search_books("shard author")) == 30 and lib.count_books(genre="Fiction") == 5
+        
+        # borrowing across shards keeps copies, loans and the limit in step
+        member = "M960"
+        cross = [row[0] for row in rows if shard_of(row[0], 3) != shard_of(member, 3)][:4]
+        local = next(row[0] for row in rows if shard_of(row[0], 3) == shard_of(member, 3))
+        assert all(lib.borrow_book(member, isbn) for isbn in cross[:3])
+        assert not lib.borrow_book(member, cross[3])  # MAX_BORROW reached
+        assert not lib.borrow_book(member, local)
+        assert lib.find_member(member)["borrowed_books"] == cross[:3]
+        assert not lib.delete_book(cross[0]) and not lib.delete_member(member)
+        assert not lib.return_book(member, cross[3])
+        assert lib.return_book(member, cross[0])
+        assert lib.borrow_book(member, local) and lib.return_book(member, local)
+        assert not lib.borrow_book("M999", cross[0]) and not lib.borrow_book(member, "978-0000000000")
+        for isbn in cross[1:3]:
+            assert lib.return_book(member, isbn)
+        assert lib.find_member(member)["borrowed_books"] == []
+        
+        # a member cannot be deleted in the middle of a cross-shard borrow
+        member_shard = lib._member_shard(member)
+        assert lib._call(member_shard, "reserve", member) is None
+        assert lib._call(lib._book_shard(cross[0]), "take_copy", cross[0]) is None
+        assert not lib.delete_member(member)
+        lib._call(member_shard, "record_loan", member, cross[0])
+        assert lib.find_member(member)["borrowed_books"] == [cross[0]]
+        assert lib.return_book(member, cross[0])
+        
+        # the last copy goes to exactly one of many concurrent borrowers
+        single = next(row[0] for row in rows if row[4] == 1)
+        winners = []
+        threads = [threading.Thread(target=lambda m=f"M96{i}": winners.append(lib.borrow_book(m, single)))
+                   for i in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert winners.count(True) == 1
+        assert lib.count_books(available=False) == 1
+        
+        # one member borrowing from many threads never goes over the limit
+        member = "M961"
+        spread = [row[0] for row in rows if row[4] == 2][:8]
+        results = []
+        threads = [threading.Thread(target=lambda i=i: results.append(lib.borrow_book(member, i)))
+                   for i in spread]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert results.count(True) == MAX_BORROW == len(lib.find_member(member)["borrowed_books"])
+        
+        # updates and deletes go to the owning shard; errors come back to the caller
+        assert lib.update_book(rows[1][0], title="Sharded Dawn")
+        assert lib.search_books("dawn")[0]["isbn"] == rows[1][0]
+        assert lib.update_member("M962", name="Renamed") and lib.find_member("M962")["name"] == "Renamed"
+        assert lib.delete_book(rows[2][0]) and not lib.update_book(rows[2][0], title="Gone")
+        assert lib.count_books() == 29
+        try:
+            lib.search_books("night", mode="bogus")
+            assert False, "expected ValueError"
+        except ValueError:
+            pass
+        assert lib.find_member("M963")["member_id"] == "M963"
+    
+    print("✓ Test 21: Sharded library passed")
+
+def test_bulk_load():
+    """Test 22: Streaming bulk import and export"""
+    reset_data()
+    directory = tempfile.mkdtemp()
+    
+    # batch adds behave like add_book/add_member one by one
+    assert add_books([("978-9500000001", "Bulk One", "Ann Bulk", "Fiction", 2),
+                      ("978-9500000001", "Bulk Again", "Ann Bulk", "Fiction", 1),
+                      ("978-9500000002", "Bulk Poems", "Ann Bulk", "Poetry", 1)]) == [True, False, False]
+    assert add_members([("M950", "Bulk Member", "b@example.com"),
+                        ("M950", "Bulk Twin", "t@example.com")]) == [True, False]
+    assert [r["isbn"] for r in search_books("bulk")] == ["978-9500000001"]
+    
+    # a copy count too large for the store fails its row only; the rows around it are logged
+    position = changes()["next"]
+    assert add_books([("978-9500000003", "Bulk Three", "Ann Bulk", "Fiction", 1),
+                      ("978-9500000004", "Bulk Huge", "Ann Bulk", "Fiction", 3_000_000_000),
+                      ("978-9500000005", "Bulk Five", "Ann Bulk", "Fiction", 1)]) == [True, False, True]
+    assert [e["args"][0] for e in changes(position)["events"]] == ["978-9500000003", "978-9500000005"]
+    assert [r["isbn"] for r in search_books("bulk")] == ["978-9500000001", "978-9500000003", "978-9500000005"]
+    assert "978-9500000004" not in books
+    
+    csv_path = os.path.join(directory, "books.csv")
+    with open(csv_path, "w", encoding="utf-8") as f:
+        f.write("isbn,title,author,genre,total_copies,shelf\n"
+                "978-9500000010,Loaded Tales,Cy Loader,Fiction,3,A1\n"
+                "978-9500000011,\"Loaded, Again\",Cy Loader,Mystery,1,A2\n"
+                "978-9500000012,Bad Genre,Cy Loader,Poetry,1,A3\n"
+                "978-9500000013,Bad Copies,Cy Loader,Fiction,many,A4\n"
+                "978-9500000014,,Cy Loader,Fiction,1,A5\n"
+                "978-9500000010,Repeated In File,Cy Loader,Fiction,1,A6\n"
+                "978-9500000001,Already Loaded,Cy Loader,Fiction,1,A7\n"
+                "978-9500000015,Short Row\n"
+                "978-9500000016,Loaded Last, Cy Loader ,History,0,A9\n")
+    rejects = os.path.join(directory, "rejects.jsonl")
+    report = load_books(csv_path, rejects=rejects, chunk_size=3)  # duplicates span chunks
+    assert report["loaded"] == 3 and report["rejected"] == 6
+    assert report["reasons"] == {"invalid_genre": 1, "invalid_copies": 1, "missing_field": 2,
+                                 "duplicate_isbn": 2}
+    with open(rejects, encoding="utf-8") as f:
+        rejected = [json.loads(line) for line in f]
+    assert sorted((r["line"], r["reason"]) for r in rejected) == [
+        (4, "invalid_genre"), (5, "invalid_copies"), (6, "missing_field"), (7, "duplicate_isbn"),
+        (8, "duplicate_isbn"), (9, "missing_field")]
+    assert rejected[0]["row"]["genre"] == "Poetry" and report["examples"] == rejected
+    assert books["978-9500000011"]["title"] == "Loaded, Again"
+    assert books["978-9500000016"]["author"] == "Cy Loader" and books["978-9500000016"]["total_copies"] == 0
+    assert [r["isbn"] for r in search_books("loaded")] == ["978-9500000010", "978-9500000011", "978-9500000016"]
+    assert count_books(genre="Mystery") == 1
+    
+    jsonl_path = os.path.join(directory, "members.jsonl")
+    with open(jsonl_path, "w", encoding="utf-8") as f:
+        f.write('{"member_id": "M951", "name": "Json Member", "email": "j@example.com"}\n'
+                'not json\n'
+                '\n'
+                '{"member_id": "M950", "name": "Existing", "email": "e@example.com"}\n'
+                '{"member_id": "M952", "name": "No Email"}\n'
+                '{"member_id": 953, "name": "Numeric Id", "email": "n@example.com"}\n')
+    report = load_members(jsonl_path)
+    assert report["loaded"] == 2
+    assert report["reasons"] == {"malformed_row": 1, "duplicate_member": 1, "missing_field": 1}
+    assert find_member("953")["name"] == "Numeric Id"
+    
+    # exports load back unchanged, as CSV and as JSON lines
+    borrow_book("M951", "978-9500000010")
+    for ext in ("csv", "jsonl"):
+        books_path = os.path.join(directory, f"export.{ext}")
+        members_path = os.path.join(directory, f"members-export.{ext}")
+        assert export_books(books_path) == len(books)
+        assert export_members(members_path) == len(members)
+        expected_books = {isbn: books.record(isbn) for isbn in books}
+        expected_members = {m["member_id"]: (m["name"], m["email"]) for m in members}
+        return_book("M951", "978-9500000010")
+        reset_data()
+        assert load_books(books_path)["loaded"] == len(expected_books)
+        assert load_members(members_path)["loaded"] == len(expected_members)
+        for isbn, record in expected_books.items():
+            # loaded books have every copy in
+            assert books.record(isbn) == dict(record, available_copies=record["total_copies"])
+        assert {m["member_id"]: (m["name"], m["email"]) for m in members} == expected_members
+        borrow_book("M951", "978-9500000010")
+    return_book("M951", "978-9500000010")
+    
+    # the batch functions are logged like single adds
+    reset_data()
+    storage = os.path.join(directory, "wal")
+    open_storage(storage)
+    path = os.path.join(directory, "replay.csv")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("isbn,title,author,genre,total_copies\n978-9500000020,Logged Load,Lo Gger,Fiction,2\n")
+    assert load_books(path)["loaded"] == 1
+    close_storage()
+    reset_data()
+    open_storage(storage)
+    assert books["978-9500000020"]["title"] == "Logged Load"
+    close_storage()
+    try:
+        load_books(os.path.join(directory, "members-export.csv"))
+        assert False, "expected ValueError for missing columns"
+    except ValueError:
+        pass
+    
+    print("✓ Test 22: Bulk import and export passed")
+
+def test_change_feed():
+    """Test 23: Change feed of successful mutations"""
+    reset_data()
+    start = changes()["next"]
+    assert changes()["events"] == []
+    
+    add_book("978-9600000001", "Feed Book", "Fe Ed", "Fiction", 2)
+    add_book("978-9600000001", "Duplicate", "Fe Ed", "Fiction", 1)  # failed: no event
+    add_member("M960", "Feed Reader", "feed@example.com")
+    update_book("978-9600000001", title="Feed Book 2")
+    borrow_book("M960", "978-9600000001")
+    borrow_book("M960", "978-0000000000")  # failed
+    return_many([("M960", "978-9600000001"), ("M960", "978-9600000001")])
+    add_books([("978-9600000002", "Feed Two", "Fe Ed", "Mystery", 1)])
+    delete_book("978-9600000002")
+    delete_member("M960")
+    
+    feed = changes(start)
+    events = feed["events"]
+    assert [e["op"] for e in events] == ["add_book", "add_member", "update_book", "borrow_book",
+                                         "return_book", "add_book", "delete_book", "delete_member"]
+    assert [e["seq"] for e in events] == list(range(start + 1, start + 9))
+    assert feed["next"] == start + 8 and changes(feed["next"])["events"] == []
+    assert events[0]["args"] == ["978-9600000001", "Feed Book", "Fe Ed", "Fiction", 2]
+    assert events[2]["args"] == ["978-9600000001"] and events[2]["kwargs"] == {"title": "Feed Book 2"}
+    assert events[3]["args"] == ["M960", "978-9600000001"] and list(events[3]["kwargs"]) == ["at"]
+    events[0]["args"].clear()  # events are copies
+    assert changes(start, limit=1)["events"][0]["args"][0] == "978-9600000001"
+    
+    # tailing in batches from a given offset
+    page = changes(start, limit=3)
+    assert [e["seq"] for e in page["events"]] == [start + 1, start + 2, start + 3]
+    assert changes(page["next"], limit=100)["events"] == events[3:]
+    
+    # a subscriber sees changes made by other threads, in order
+    got = []
+    with subscribe(batch_size=4) as subscription:
+        assert subscription.poll(timeout=0.01) == []
+        def consume():
+            while len(got) < 20:
+                batch = subscription.poll(timeout=5)
+                assert 0 < len(batch) <= 4
+                got.extend(batch)
+        reader = threading.Thread(target=consume)
+        reader.start()
+        add_books([(f"978-96100000{i:02d}", f"Tail {i}", "Fe Ed", "Fiction", 1) for i in range(10)])
+        for i in range(10):
+            delete_book(f"978-96100000{i:02d}")
+        reader.join()
+    assert [e["op"] for e in got] == ["add_book"] * 10 + ["delete_book"] * 10
+    assert [e["seq"] for e in got] == list(range(got[0]["seq"], got[0]["seq"] + 20))
+    
+    # replacing everything is announced with a reset event
+    path = os.path.join(tempfile.mkdtemp(), "feed.snap")
+    export_snapshot(path)
+    position = changes()["next"]
+    import_snapshot(path)
+    assert [e["op"] for e in changes(position)["events"]] == ["reset"]
+    
+    # backpressure: a slow subscriber holds publishers back instead of losing events
+    small = ChangeFeed(capacity=4, max_wait=5)
+    subscription = small.subscribe(batch_size=2)
+    received = []
+    def slow_reader():
+        while len(received) < 50:
+            time.sleep(0.001)
+            received.extend(e["args"][0] for e in subscription.poll(timeout=5))
+    reader = threading.Thread(target=slow_reader)
+    reader.start()
+    for i in range(50):
+        small.publish("op", (i,))
+    reader.join()
+    assert received == list(range(50)) and small.overruns == 0
+    
+    # ... but only for max_wait; then its events are overwritten
+    small.max_wait = 0.01
+    small.publish_many([("op", (i,), None) for i in range(5)])
+    assert small.overruns == 1
+    try:
+        subscription.poll(timeout=0)
+        assert False, "expected ChangeFeedGap"
+    except ChangeFeedGap as gap:
+        assert gap.after == 50 and gap.oldest == 52
+    subscription.seek(small.oldest_seq - 1)
+    assert [e["seq"] for e in subscription.poll(timeout=0)] == [52, 53]
+    subscription.close()
+    assert small.stats()["subscriptions"] == 0
+    
+    # ... in total per call: a reader taking one event at a time cannot stall a batch for long
+    paced = ChangeFeed(capacity=2, max_wait=0.2)
+    trickle = paced.subscribe(batch_size=1)
+    paced.publish_many([("op", (i,), None) for i in range(2)])
+    stop = threading.Event()
+    def trickle_reader():
+        while not stop.wait(0.1):
+            try:
+                trickle.poll(timeout=0)
+            except ChangeFeedGap:
+                return
+    reader = threading.Thread(target=trickle_reader)
+    reader.start()
+    start = time.monotonic()
+    paced.publish_many([("op", (i,), None) for i in range(20)])  # one event per 0.1 s: 2 s unbounded
+    assert time.monotonic() - start < 1.0
+    stop.set()
+    reader.join()
+    trickle.close()
+    try:
+        small.read(0)
+        assert False, "expected ChangeFeedGap"
+    except ChangeFeedGap:
+        pass
+    
+    print("✓ Test 23: Change feed passed")
+
+def test_holds():
+    """Test 24: Hold queues"""
+    reset_data()
+    isbn = "978-9700000001"
+    add_book(isbn, "Popular Book", "Ho Ld", "Fiction", 1)
+    for i in range(1, 7):
+        add_member(f"M97{i}", f"Holder {i}", f"h{i}@example.com")
+    position = changes()["next"]
+    
+    assert place_hold("M971", isbn) is False  # a copy is on the shelf: borrow it
+    assert borrow_book("M971", isbn) is True
+    assert place_hold("M972", isbn) is True
+    assert place_hold("M972", isbn) is False  # already waiting
+    assert place_hold("M973", isbn) is True
+    assert place_hold("M999", isbn) is False and place_hold("M974", "978-0000000000") is False
+    assert hold_queue(isbn) == {"ready": {}, "waiting": ["M972", "M973"]}
+    assert member_holds("M972") == {isbn: "waiting"}
+    assert delete_book(isbn) is False
+    
+    # a returned copy goes straight to the next in line
+    available = (count_books(available=True), genre_counts()["Fiction"])
+    assert return_book("M971", isbn) is True
+    assert list(hold_queue(isbn)["ready"]) == ["M972"] and hold_queue(isbn)["waiting"] == ["M973"]
+    deadline = hold_queue(isbn)["ready"]["M972"]
+    assert abs(deadline - (time.time() + HOLD_PICKUP_SECONDS)) < 60
+    assert borrow_book("M974", isbn) is False  # set aside for M972
+    assert borrow_many([("M974", isbn)]) == [False]
+    
+    # ... so it is not available to anyone else, and cannot be cut from the total
+    assert books[isbn]["available_copies"] == 0
+    assert (count_books(available=True), genre_counts()["Fiction"]) == available
+    page = search_page("", genre="Fiction", available=True, limit=1000)
+    assert isbn not in [b["isbn"] for b in page["results"]]
+    assert update_book(isbn, total_copies=0) is False
+    try:
+        run_transaction([["update_book", [isbn], {"total_copies": 0}]])
+        assert False, "expected TransactionError"
+    except TransactionError as e:
+        assert e.reasons == [("total_below_on_loan", isbn)]
+    assert books[isbn]["total_copies"] == 1 and check_loans() == []
+    assert borrow_book("M972", isbn) is True
+    assert member_holds("M972") == {} and books[isbn]["available_copies"] == 0
+    
+    # a lapsed hold passes the copy on, then back to the shelf
+    assert place_hold("M974", isbn) is True
+    assert return_book("M972", isbn) is True  # ready for M973
+    assert expire_holds() == 0
+    assert expire_holds(time.time() + HOLD_PICKUP_SECONDS + 60) == 1
+    assert member_holds("M973") == {} and list(hold_queue(isbn)["ready"]) == ["M974"]
+    assert cancel_hold("M974", isbn) is True and cancel_hold("M974", isbn) is False
+    assert hold_queue(isbn) == {"ready": {}, "waiting": []}
+    assert borrow_book("M975", isbn) is True
+    
+    # holds count towards MAX_BORROW, so a member can always collect them
+    add_book("978-9700000002", "Second", "Ho Ld", "Fiction", 5)
+    add_book("978-9700000003", "Third", "Ho Ld", "Fiction", 5)
+    assert borrow_book("M976", "978-9700000002") and borrow_book("M976", "978-9700000003")
+    assert place_hold("M976", isbn) is True
+    assert borrow_book("M976", "978-9700000002") is False  # 2 loans + 1 hold
+    assert borrow_many([("M976", "978-9700000003")]) == [False]
+    assert place_hold("M973", isbn) is True
+    assert borrow_many([("M973", "978-9700000002"), ("M973", "978-9700000003"),
+                        ("M973", "978-9700000003")]) == [True, True, False]
+    assert place_hold("M973", "978-9700000002") is False  # 2 loans + 1 hold
+    
+    # a batch can collect a ready hold; others cannot take the copy
+    assert return_book("M975", isbn) is True  # ready for M976
+    assert borrow_many([("M971", isbn), ("M976", isbn)]) == [False, True]
+    assert member_holds("M976") == {} and hold_queue(isbn)["waiting"] == ["M973"]
+    
+    # deleting a member with a ready hold hands the copy on
+    assert return_book("M976", isbn) is True  # ready for M973
+    for loaned in ("978-9700000002", "978-9700000002", "978-9700000003", "978-9700000003"):
+        return_book("M973", loaned)
+        return_book("M976", loaned)
+    assert place_hold("M971", isbn) is True
+    assert delete_member("M973") is True
+    assert list(hold_queue(isbn)["ready"]) == ["M971"]
+    assert check_loans() == []
+    
+    ops = [e["op"] for e in changes(position)["events"]]
+    assert ops.count("hold_ready") == 6 and ops.count("expire_hold") == 1 and ops.count("place_hold") == 6
+    
+    # a batch borrow lapses overdue holds first, as borrow_book does
+    other = "978-9700000004"
+    add_book(other, "Fourth", "Ho Ld", "Fiction", 1)
+    add_member("M977", "Holder 7", "h7@example.com")
+    add_member("M978", "Holder 8", "h8@example.com")
+    pickup = operations.HOLD_PICKUP_SECONDS
+    operations.HOLD_PICKUP_SECONDS = 0  # ready holds lapse straight away
+    try:
+        assert borrow_book("M977", other) and place_hold("M978", other)
+        assert return_book("M977", other) is True
+    finally:
+        operations.HOLD_PICKUP_SECONDS = pickup
+    assert list(operations._holds.ready_for(other)) == ["M978"]
+    assert borrow_many([("M977", other)]) == [True] and member_holds("M978") == {}
+    
+    # holds survive a restart, through the log and through a checkpoint,
+    # with the pickup deadlines they were given
+    directory = tempfile.mkdtemp()
+    open_storage(directory)
+    assert place_hold("M974", isbn) is True
+    checkpoint()
+    assert place_hold("M975", isbn) is True
+    assert cancel_hold("M971", isbn) is True  # the copy goes to M974
+    queue = hold_queue(isbn)
+    close_storage()
+    reset_data()
+    time.sleep(0.01)
+    open_storage(directory)
+    assert hold_queue(isbn) == queue == {"ready": {"M974": queue["ready"]["M974"]}, "waiting": ["M975"]}
+    assert books[isbn]["available_copies"] == 0 and check_loans() == []
+    assert borrow_book("M974", isbn) is True and borrow_book("M975", isbn) is False
+    close_storage()
+    
+    print("✓ Test 24: Hold queues passed")
+
+def test_due_dates():
+    """Test 25: Due dates, renewals and fines"""
+    reset_data()
+    now = time.time()
+    for i in range(1, 5):
+        add_book(f"978-9800000001{i}", f"Due Book {i}", "Du E", "Fiction", 2)
+        add_member(f"M98{i}", f"Reader {i}", f"r{i}@example.com")
+    
+    # due LOAN_SECONDS after checkout; overdue comes out oldest first
+    assert borrow_book("M981", "978-98000000011", at=now - 20 * DAY) is True
+    assert borrow_book("M982", "978-98000000012", at=now - 30 * DAY) is True
+    assert borrow_book("M983", "978-98000000013", at=now - 15 * DAY - 3600) is True
+    assert borrow_many([("M984", "978-98000000014"), ("M984", "978-98000000011")]) == [True, True]
+    loans = member_loans("M984")
+    assert [l["isbn"] for l in loans] == ["978-98000000014", "978-98000000011"]
+    assert abs(loans[0]["due"] - loans[0]["checkout"] - LOAN_SECONDS) < 1e-6
+    overdue = overdue_loans(now)
+    assert [l["member_id"] for l in overdue] == ["M982", "M981", "M983"]
+    assert round(overdue[0]["days_overdue"]) == 16 and overdue_loans(now, limit=1) == overdue[:1]
+    assert [loan.member_id for loan in iter_overdue(now)] == ["M982", "M981", "M983"]
+    assert overdue_loans(now - 40 * DAY) == []
+    
+    # fines: per started day, capped per loan
+    assert fine_for(0.5) == 25 and fine_for(6) == 150 and fine_for(365) == 1000
+    fines = calculate_fines(now, per_day=10, cap=100)
+    assert fines["loans"] == 3 and fines["by_member"] == {"M982": 100, "M981": 60, "M983": 20}
+    assert fines["total"] == 180 and fines["members"] == 3
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "fines.csv")
+        assert calculate_fines(now, path=path)["loans"] == 3
+        with open(path) as f:
+            assert f.readline().strip() == "member_id,isbn,due,days_late,fine"
+            assert len(f.readlines()) == 3
+    
+    # renewals move the due date, up to MAX_RENEWALS, never when overdue or wanted
+    assert renew_loan("M984", "978-98000000014") is True
+    assert member_loans("M984")[-1]["renewals"] == 1
+    for _ in range(MAX_RENEWALS - 1):
+        assert renew_loan("M984", "978-98000000014") is True
+    assert renew_loan("M984", "978-98000000014") is False  # renewal limit
+    assert renew_loan("M981", "978-98000000011") is False  # overdue
+    assert renew_loan("M984", "978-98000000012") is False and renew_loan("M999", "978-98000000011") is False
+    assert place_hold("M983", "978-98000000011") is True  # both copies are out
+    assert renew_loan("M984", "978-98000000011") is False  # M983 is waiting
+    assert cancel_hold("M983", "978-98000000011") is True
+    assert renew_loan("M984", "978-98000000011", at=now + DAY) is True
+    assert member_loans("M984")[-1]["due"] == now + DAY + LOAN_SECONDS
+    
+    # returning ends the loan in the index
+    assert return_book("M982", "978-98000000012") is True
+    assert [l["member_id"] for l in overdue_loans(now)] == ["M981", "M983"]
+    assert check_loans() == []
+    
+    # due dates survive a restart, through the log and through a checkpoint
+    with tempfile.TemporaryDirectory() as directory:
+        open_storage(directory)
+        assert borrow_book("M982", "978-98000000012", at=now - 25 * DAY) is True
+        checkpoint()
+        assert renew_loan("M984", "978-98000000011", at=now) is True
+        close_storage()
+        expected = overdue_loans(now), member_loans("M984")
+        reset_data()
+        open_storage(directory)
+        assert (overdue_loans(now), member_loans("M984")) == expected
+        close_storage()
+    
+    print("✓ Test 25: Due dates, renewals and fines passed")
+
+def test_fuzzy_search():
+    """Test 26: Typo-tolerant search"""
+    reset_data()
+    add_book("978-9900000001", "The Art of Computer Programming", "Donald Knuth", "Non-Fiction", 1)
+    add_book("978-9900000002", "Sapiens", "Yuval Noah Harari", "History", 2)
+    add_book("978-9900000003", "Homo Deus", "Yuval Noah Harari", "History", 1)
+    add_book("978-9900000004", "Concrete Mathematics", "Graham Knuth Patashnik", "Non-Fiction", 1)
+    
+    # edits: insert, delete, substitute, swap neighbours; one per word up to 5 letters
+    assert edit_distance("knuht", "knuth", 2) == 1 and edit_distance("harrari", "harari", 2) == 1
+    assert edit_distance("kitten", "sitting", 2) == 3 and edit_distance("same", "same", 0) == 0
+    
+    assert search_books("Harrari") == [] and search_books("Knuht") == []
+    assert [b["isbn"] for b in fuzzy_search("Harrari")] == ["978-9900000002", "978-9900000003"]
+    assert [b["isbn"] for b in fuzzy_search("Knuht")] == ["978-9900000001", "978-9900000004"]
+    assert fuzzy_search("Knuht")[0]["typos"] == 1 and fuzzy_search("knuth")[0]["typos"] == 0
+    assert [b["isbn"] for b in fuzzy_search("harari sapeins")] == ["978-9900000002"]
+    assert [b["isbn"] for b in fuzzy_search("Yuval Harrari", limit=1)] == ["978-9900000002"]
+    assert fuzzy_search("Knuht Sapiens") == [] and fuzzy_search("") == [] and fuzzy_search("zzzzzz") == []
+    assert fuzzy_search("hx") == []  # no typos allowed in 2-letter words
+    # two typos in 6 letters can leave no trigram in common: found all the same
+    assert add_book("978-9900000009", "Abcdef", "Qq Zz", "Fiction", 1) is True
+    assert [(b["isbn"], b["typos"]) for b in fuzzy_search("bacdfe")] == [("978-9900000009", 2)]
+    assert delete_book("978-9900000009") is True and fuzzy_search("bacdfe") == []
+    try:
+        fuzzy_search("Knuht", limit=0)
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+    # the fewest typos rank first
+    assert [b["typos"] for b in fuzzy_search("concrete mathematcs knth")] == [2]
+    
+    # kept up to date by add/update/delete
+    add_book("978-9900000005", "Sapients", "A. Nother", "Fiction", 1)
+    assert [(b["isbn"], b["typos"]) for b in fuzzy_search("sapiens")] == [
+        ("978-9900000002", 0), ("978-9900000005", 1)]
+    assert update_book("978-9900000005", title="Something Else") is True
+    assert [b["isbn"] for b in fuzzy_search("sapiens")] == ["978-9900000002"]
+    assert [b["isbn"] for b in fuzzy_search("somthing")] == ["978-9900000005"]
+    assert delete_book("978-9900000001") is True
+    assert [b["isbn"] for b in fuzzy_search("Knuht")] == ["978-9900000004"]
+    assert delete_book("978-9900000004") is True and fuzzy_search("Knuht") == []
+    
+    # a larger vocabulary: every misspelling finds its word first
+    index = SearchIndex()
+    rng = random.Random(26)
+    words = {"".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(4, 10)))
+             for _ in range(3000)}
+    for i, word in enumerate(sorted(words)):
+        index.add(f"isbn{i:05d}", {"title": word, "author": "x", "genre": "y"})
+    for i, word in enumerate(sorted(words)[:300]):
+        k = rng.randrange(len(word) - 1)
+        typo = word[:k] + word[k + 1] + word[k] + word[k + 2:]  # swap two letters
+        if typo != word:
+            assert f"isbn{i:05d}" in [isbn for isbn, _ in index.fuzzy(typo, limit=5)], (word, typo)
+    assert index.fuzzy(typo, limit=0) == []
+    index.add("isbn-abcdef", {"title": "abcdef", "author": "x", "genre": "y"})
+    assert ("isbn-abcdef", 2) in index.fuzzy("bacdfe")
+    
+    print("✓ Test 26: Typo-tolerant search passed")
+
+def test_transactions():
+    """Test 27: Multi-operation transactions"""
+    reset_data()
+    for i in range(1, 6):
+        add_book(f"978-9700000000{i}", f"Desk Book {i}", "Tx Author", "Fiction", 1)
+    add_member("M971", "Desk Reader", "desk@example.com")
+    add_member("M972", "Other Reader", "other@example.com")
+    for i in (1, 2):
+        assert borrow_book("M971", f"978-9700000000{i}") is True
+    
+    # a failed update_book leaves the book as it was
+    assert update_book("978-97000000001", total_copies=0) is False
+    assert books["978-97000000001"]["total_copies"] == 1
+    assert books["978-97000000001"]["available_copies"] == 0
+    
+    # "borrow 3, return 2": MAX_BORROW is checked on the end state only
+    with transaction() as tx:
+        for i in (3, 4, 5):
+            assert tx.borrow_book("M971", f"978-9700000000{i}") is True  # 5 loans for now
+        assert tx.return_book("M971", "978-97000000001") is True
+        assert tx.return_book("M971", "978-97000000002") is True
+        assert tx.return_book("M971", "978-97000000002") is False  # returned already
+        assert loan_count("M971") == 2 and books["978-97000000004"]["available_copies"] == 1
+        assert tx.book("978-97000000004")["available_copies"] == 0
+        assert sorted(tx.member("M971")["borrowed_books"]) == [
+            "978-97000000003", "978-97000000004", "978-97000000005"]
+    assert tx.closed and loan_count("M971") == MAX_BORROW
+    assert sorted(find_member("M971")["borrowed_books"]) == [
+        "978-97000000003", "978-97000000004", "978-97000000005"]
+    assert books["978-97000000002"]["available_copies"] == 1 and check_loans() == []
+    try:
+        with transaction() as tx:
+            tx.return_book("M971", "978-97000000003")
+            tx.borrow_book("M971", "978-97000000001")
+            tx.borrow_book("M971", "978-97000000002")
+        assert False, "expected TransactionError"
+    except TransactionError as e:
+        assert e.reasons == [("borrow_limit", "M971")]
+    assert loan_count("M971") == MAX_BORROW and books["978-97000000001"]["available_copies"] == 1
+    
+    # broken rules: nothing at all is applied
+    before = (dict(books["978-97000000002"]), find_member("M972")["name"])
+    try:
+        with transaction() as tx:
+            tx.update_book("978-97000000002", genre="Poetry")
+            tx.update_member("M972", name="Renamed")
+            tx.borrow_book("M972", "978-97000000002")
+            tx.borrow_book("M972", "978-97000000002")
+            tx.update_book("978-97000000003", total_copies=0)
+        assert False, "expected TransactionError"
+    except TransactionConflict:
+        assert False, "not a conflict"
+    except TransactionError as e:
+        assert e.reasons == [("invalid_genre", "978-97000000002"), ("no_copies", "978-97000000002"),
+                             ("total_below_on_loan", "978-97000000003")]
+    assert (books["978-97000000002"], find_member("M972")["name"]) == before
+    assert loan_count("M972") == 0
+    
+    # copy counts too large for the store are refused when staged, so no commit stops halfway
+    position = changes()["next"]
+    assert run_transaction([["update_member", ["M972"], {"name": "Renamed"}],
+                            ["add_book", ["978-97000000009", "Huge", "Tx Author", "Fiction", 2 ** 31]]]) == [True, False]
+    assert run_transaction([["update_book", ["978-97000000002"], {"total_copies": 2 ** 31}]]) == [False]
+    assert "978-97000000009" not in books and find_member("M972")["name"] == before[1]
+    assert changes(position)["events"] == []
+    
+    # an exception in the block or rollback() discards the changes
+    try:
+        with transaction() as tx:
+            tx.update_member("M972", name="Renamed")
+            raise KeyError("desk closed")
+    except KeyError:
+        pass
+    with transaction() as tx:
+        tx.update_member("M972", name="Renamed")
+        tx.rollback()
+    assert find_member("M972")["name"] == "Other Reader"
+    
+    # new books and members can be used in the same transaction
+    with transaction() as tx:
+        assert tx.add_book("978-97000000006", "Desk Book 6", "Tx Author", "Fiction", 2) is True
+        assert tx.add_member("M973", "New Reader", "new@example.com") is True
+        assert tx.add_member("M972", "Again", "again@example.com") is False  # duplicate
+        assert tx.borrow_book("M973", "978-97000000006") is True
+    assert loan_count("M973") == 1 and books["978-97000000006"]["available_copies"] == 1
+    assert "desk" in [b["title"].split()[0].lower() for b in search_books("Desk Book 6")]
+    
+    # optimistic: a change to something read since the start is a conflict
+    tx = Transaction()
+    tx.borrow_book("M972", "978-97000000006")
+    assert borrow_book("M973", "978-97000000006") is True  # takes the last copy
+    try:
+        tx.commit()
+        assert False, "expected TransactionConflict"
+    except TransactionConflict as e:
+        assert e.reasons == [("borrow_book", "M973, 978-97000000006")]
+    assert loan_count("M972") == 0
+    # changes to other books and members do not conflict
+    tx = Transaction()
+    tx.return_book("M973", "978-97000000006")
+    assert return_book("M971", "978-97000000005") is True
+    tx.commit()
+    assert loan_count("M973") == 1
+    
+    # run_transaction: any failed step rolls back the others
+    assert run_transaction([["borrow_book", ["M972", "978-97000000005"]],
+                            ["borrow_book", ["M972", "978-00000000000"]]]) == [True, False]
+    assert loan_count("M972") == 0
+    
+    # a committed transaction is one log record and replays as a whole
+    with tempfile.TemporaryDirectory() as directory:
+        open_storage(directory)
+        assert run_transaction([["return_book", ["M971", "978-97000000004"]],
+                                ["borrow_book", ["M972", "978-97000000004"], {"at": time.time()}],
+                                ["update_book", ["978-97000000004"], {"title": "Renamed Book"}]]
+                               ) == [True, True, True]
+        close_storage()
+        expected = (member_loans("M971"), member_loans("M972"), dict(books["978-97000000004"]))
+        reset_data()
+        assert open_storage(directory) == 1
+        assert (member_loans("M971"), member_loans("M972"), books["978-97000000004"]) == expected
+        close_storage()
+    assert check_loans() == []
+    
+    print("✓ Test 27: Multi-operation transactions passed")
+
+def test_recommendations():
+    """Test 28: Co-borrowing recommendations"""
+    reset_data()
+    for i in range(1, 7):
+        add_book(f"978-9600000000{i}", f"Related Book {i}", "Co Author", "Fiction", 5)
+    for i in range(1, 5):
+        add_member(f"M96{i}", f"Reader {i}", f"co{i}@example.com")
+    x, y, z, w, v, u = (f"978-9600000000{i}" for i in range(1, 7))
+    
+    # "also borrowed": members who borrowed both, most shared first
+    for isbn in (x, y, z):
+        assert borrow_book("M961", isbn) is True
+    assert borrow_many([("M962", x), ("M962", y)]) == [True, True]
+    with transaction() as tx:
+        tx.borrow_book("M963", x)
+        tx.borrow_book("M963", w)
+    assert [(b["isbn"], b["co_borrowers"]) for b in related_books(x)] == [(y, 2), (z, 1), (w, 1)]
+    assert [b["isbn"] for b in related_books(x, limit=1)] == [y]
+    assert related_books(x)[0]["title"] == "Related Book 2"
+    assert [(b["isbn"], b["co_borrowers"]) for b in related_books(w)] == [(x, 1)]
+    assert related_books(v) == [] and related_books("978-0000000000") == []
+    for limit in (0, -1):
+        try:
+            related_books(x, limit=limit)
+            assert False, "expected ValueError"
+        except ValueError:
+            pass
+    
+    # history outlives the loan; borrowing the same book again changes nothing
+    assert return_book("M961", y) is True and borrow_book("M961", y) is True
+    assert return_book("M961", y) is True
+    assert loan_history("M961") == [x, y, z]
+    assert [(b["isbn"], b["co_borrowers"]) for b in related_books(y)] == [(x, 2), (z, 1)]
+    # deleted books are left out
+    assert return_book("M961", z) is True and delete_book(z) is True
+    assert [b["isbn"] for b in related_books(x)] == [y, w]
+    
+    # past loans in bulk: same counts as borrowing them one at a time
+    assert add_loan_history([("M964", v), ("M964", x), ("M999", v), ("M999", x), ("M964", v)]) == 4
+    assert [(b["isbn"], b["co_borrowers"]) for b in related_books(v)] == [(x, 2)]
+    assert [(b["isbn"], b["co_borrowers"]) for b in related_books(x)] == [(y, 2), (v, 2), (w, 1)]
+    rng = random.Random(28)
+    pairs = [(f"m{rng.randrange(40)}", f"b{int(rng.paretovariate(1.2)) % 60}") for _ in range(600)]
+    one_by_one, bulk = CoBorrowIndex(), CoBorrowIndex()
+    assert sum(one_by_one.record(*pair) for pair in pairs) == bulk.load(pairs)
+    for i in range(60):
+        assert one_by_one.related(f"b{i}", 100) == bulk.related(f"b{i}", 100), i
+    assert one_by_one.stats() == bulk.stats()
+    before = {isbn: related_books(isbn) for isbn in (x, y, v, w)}
+    assert rebuild_recommendations()["loans"] == 11
+    assert {isbn: related_books(isbn) for isbn in (x, y, v, w)} == before
+    
+    # the history survives a restart, through the log and through a checkpoint
+    with tempfile.TemporaryDirectory() as directory:
+        open_storage(directory)
+        assert borrow_book("M964", u) is True
+        checkpoint()
+        assert add_loan_history([("M999", u)]) == 1
+        close_storage()
+        expected = {isbn: related_books(isbn) for isbn in (x, y, v, w, u)}
+        reset_data()
+        assert related_books(x) == []
+        open_storage(directory)
+        assert {isbn: related_books(isbn) for isbn in (x, y, v, w, u)} == expected
+        assert [(b["isbn"], b["co_borrowers"]) for b in related_books(u)] == [(x, 2), (v, 2)]
+        close_storage()
+    
+    # binary snapshots carry current loans only: importing one resets the history to them
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "library.snap")
+        export_snapshot(path)
+        current = {m: list(find_member(m)["borrowed_books"]) for m in ("M961", "M962", "M963", "M964")}
+        assert any(len(loan_history(m)) > len(current[m]) for m in current)
+        for lazy in (True, False):
+            import_snapshot(path, lazy=lazy)
+            assert {m: loan_history(m) for m in current} == current, lazy
+            assert rebuild_recommendations()["loans"] == sum(map(len, current.values()))
+    
+    print("✓ Test 28: Co-borrowing recommendations passed")
+
 def run_all_tests():
     """Run all test functions"""
     print("Running Library Management System Tests...\n")
@@ -160,6 +1642,28 @@ def run_all_tests():
     test_borrow_limit()
     test_delete_operations()
     test_edge_cases()
+    test_member_store()
+    test_search_index()
+    test_compact_records()
+    test_batch_circulation()
+    test_concurrent_circulation()
+    test_persistent_storage()
+    test_binary_snapshot()
+    test_server()
+    test_loan_ledger()
+    test_synthetic_library()
+    test_metrics()
+    test_query_cache()
+    test_streaming_search()
+    test_facets()
+    test_sharded_library()
+    test_bulk_load()
+    test_change_feed()
+    test_holds()
+    test_due_dates()
+    test_fuzzy_search()
+    test_transactions()
+    test_recommendations()
     
     print("\n All tests passed successfully!")
     print(f"Total genres available: {len(GENRES)} - {GENRES}")
@@ -0,0 +1,192 @@
+# wal.py
+
+import json
+import os
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+LOG_FILE = "library.wal"
+SNAPSHOT_FILE = "snapshot.json"
+
+# fsync policies:
+#   "always" - every append is on disk before it returns; appends that
+#              arrive while an fsync is running share the next one
+#   "batch"  - fsync once group_size records are pending, or after
+#              group_interval seconds (a crash can lose that window)
+#   "never"  - write to the OS and let it decide when to flush
+FSYNC_POLICIES = ("always", "batch", "never")
+
+
+class WriteAheadLog:
+    """Append-only JSON-lines log of operations, plus compacted snapshots.
+
+    Each record is {"lsn": n, "op": name, "args": [...], "kwargs": {...}}
+    with a log sequence number (lsn) that increases by one per record.
+    checkpoint() writes a snapshot tagged with the last lsn and truncates
+    the log; recovery loads the snapshot and replays the records after it.
+    """
+
+    def __init__(self, directory: str, fsync: str = "batch", group_size: int = 128,
+                 group_interval: float = 0.01, checkpoint_every: int = 0):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"unknown fsync policy {fsync!r}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.fsync = fsync
+        self.group_size = group_size
+        self.group_interval = group_interval
+        self.checkpoint_every = checkpoint_every
+        # set once checkpoint_every records were logged since the last checkpoint
+        self.checkpoint_due = threading.Event()
+
+        self._lock = threading.Lock()        # guards the file buffer and lsn
+        self._sync_lock = threading.Lock()   # one fsync at a time
+        snapshot_lsn = read_snapshot(directory)[0]
+        self._lsn = self._durable_lsn = max(snapshot_lsn, _last_lsn(self.log_path))
+        self._since_checkpoint = 0
+        self._file = open(self.log_path, "ab")
+        self._closed = threading.Event()
+        self._flusher = None
+        if fsync != "always":
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+
+    @property
+    def log_path(self) -> str:
+        return os.path.join(self.directory, LOG_FILE)
+
+    @property
+    def lsn(self) -> int:
+        return self._lsn
+
+    def append(self, op: str, args: List[Any], kwargs: Optional[Dict] = None) -> int:
+        """Log one operation and return its lsn (durable per the fsync policy)."""
+        return self.append_many([(op, args, kwargs)])
+
+    def append_many(self, records: List[Tuple[str, List[Any], Optional[Dict]]]) -> int:
+        """Log several operations with a single sync; returns the last lsn."""
+        with self._lock:
+            for op, args, kwargs in records:
+                self._lsn += 1
+                record = {"lsn": self._lsn, "op": op, "args": args}
+                if kwargs:
+                    record["kwargs"] = kwargs
+                self._file.write(json.dumps(record, separators=(",", ":")).encode() + b"\n")
+            lsn = self._lsn
+            pending = lsn - self._durable_lsn
+            self._since_checkpoint += len(records)
+            if self.checkpoint_every and self._since_checkpoint >= self.checkpoint_every:
+                self.checkpoint_due.set()
+        if self.fsync == "always" or (self.fsync == "batch" and pending >= self.group_size):
+            self.sync(lsn)
+        return lsn
+
+    def sync(self, lsn: Optional[int] = None) -> None:
+        """Make every record up to lsn (default: all) durable."""
+        with self._sync_lock:
+            if lsn is not None and self._durable_lsn >= lsn:
+                return  # another writer's fsync already covered it
+            with self._lock:
+                self._file.flush()
+                target = self._lsn
+            os.fsync(self._file.fileno())
+            self._durable_lsn = target
+
+    def checkpoint(self, state: Dict) -> int:
+        """Write state as the snapshot at the current lsn and truncate the log.
+
+        The caller must make sure no operation runs in between, so that
+        state matches the log exactly.
+        """
+        with self._sync_lock, self._lock:
+            lsn = self._lsn
+            _write_json_atomic(os.path.join(self.directory, SNAPSHOT_FILE),
+                               {"lsn": lsn, **state})
+            self._file.close()
+            self._file = open(self.log_path, "wb")
+            os.fsync(self._file.fileno())
+            self._durable_lsn = lsn
+            self._since_checkpoint = 0
+            self.checkpoint_due.clear()
+        return lsn
+
+    def close(self) -> None:
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        if self.fsync != "never":
+            self.sync()
+        with self._lock:
+            self._file.close()
+
+    def _flush_loop(self) -> None:
+        while not self._closed.wait(self.group_interval):
+            if self._lsn == self._durable_lsn:
+                continue
+            if self.fsync == "batch":
+                self.sync()
+            else:
+                with self._lock:
+                    self._file.flush()
+
+
+def read_snapshot(directory: str) -> Tuple[int, Dict]:
+    """Return (lsn, state) of the last snapshot, or (0, {}) if there is none."""
+    try:
+        with open(os.path.join(directory, SNAPSHOT_FILE), encoding="utf-8") as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return 0, {}
+    return state.pop("lsn"), state
+
+
+def read_log(directory: str, after_lsn: int = 0) -> Iterator[Dict]:
+    """Yield logged records with lsn > after_lsn.
+
+    A torn last line (crash in the middle of a write) is cut off the
+    file so new appends start on a clean line.
+    """
+    path = os.path.join(directory, LOG_FILE)
+    if not os.path.exists(path):
+        return
+    good_end = 0
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if not line.endswith(b"\n"):
+                break
+            good_end += len(line)
+            if record["lsn"] > after_lsn:
+                yield record
+    if good_end != os.path.getsize(path):
+        with open(path, "r+b") as f:
+            f.truncate(good_end)
+
+
+def _last_lsn(path: str) -> int:
+    """lsn of the last complete record in the log (0 if empty/missing)."""
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 65536))
+            tail = f.read().split(b"\n")
+    except FileNotFoundError:
+        return 0
+    for line in reversed(tail[:-1]):  # the piece after the last newline is torn/empty
+        try:
+            return json.loads(line)["lsn"]
+        except ValueError:
+            continue
+    return 0
+
+
+def _write_json_atomic(path: str, data: Dict) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)